@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+"""
+Time PostProcessor.transform_timeframe for all supported timeframe pairs on synthetic RTH
+1-minute data, compared with plain DataFrame.resample().
+
+    $ export PYTHONPATH=`pwd`
+    $ python benchmarks/bench_resample.py --days 250 --repeat 3
+"""
+import argparse
+import timeit
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from pd_dataprovider.utils.post_processor import PostProcessor
+from pd_dataprovider.utils.timeframe import Timeframe
+
+TIMEFRAMES = ['1min', '5min', '15min', '30min', '60min', '240min', 'day', '5D', 'week', 'month']
+
+CONVERSION = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+
+
+def make_minutes(days: int, seed: int = 0) -> pd.DataFrame:
+    sessions = pd.bdate_range(end='2020-12-31', periods=days)
+    minutes = pd.timedelta_range('09:30:00', '15:59:00', freq='1min')
+    index = pd.DatetimeIndex((sessions.to_numpy()[:, None] + minutes.to_numpy()[None, :]).ravel())
+    rng = np.random.default_rng(seed)
+    close = (100 + rng.standard_normal(len(index)).cumsum() * 0.01).astype(np.float32)
+    return pd.DataFrame({'Open': close + 0.01, 'High': close + 0.05, 'Low': close - 0.05, 'Close': close,
+                         'Volume': rng.integers(100, 10000, len(index)).astype(np.float32)},
+                        index=index)
+
+
+def resample_reference(data: pd.DataFrame, transform: str) -> pd.DataFrame:
+    target = Timeframe.parse(transform)
+    if target.kind == 'week':
+        return data.resample('W-MON', label='left', closed='left').agg(CONVERSION).dropna()
+    if target.kind == 'month':
+        return data.resample('MS').agg(CONVERSION).dropna()
+    return data.resample(f"{target.minutes}Min").agg(CONVERSION).dropna()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=250)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore', FutureWarning)
+    post_processor = PostProcessor(0)
+    sources = {'1min': make_minutes(args.days)}
+    print(f"{len(sources['1min'])} 1min bars ({args.days} days)")
+    for timeframe in TIMEFRAMES:
+        if timeframe not in sources:
+            sources[timeframe] = post_processor.transform_timeframe(
+                sources['1min'], {'timeframe': '1min', 'transform': timeframe})
+        data = sources[timeframe]
+        for transform in TIMEFRAMES:
+            try:
+                plan = post_processor.resample_plan(timeframe, transform)
+            except Exception:
+                continue
+            if not plan:
+                continue
+            func_args = {'timeframe': timeframe, 'transform': transform}
+            engine = min(timeit.repeat(lambda: post_processor.transform_timeframe(data, func_args),
+                                       number=1, repeat=args.repeat))
+            reference = min(timeit.repeat(lambda: resample_reference(data, transform),
+                                          number=1, repeat=args.repeat))
+            chain = ' -> '.join([timeframe] + [tf.name for tf in plan])
+            print(f"{chain:>24}: {len(data):8d} bars, engine {engine * 1000:8.2f} ms, "
+                  f"resample {reference * 1000:8.2f} ms, speedup {reference / engine:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
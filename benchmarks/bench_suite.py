@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+"""
+Throughput benchmarks on synthetic files in the layouts of the file providers (see synthetic.py):
+
+    get_datas/{layout}/{timeframe}          get_datas() of all symbols
+    stage/{layout}/{timeframe}/{stage}      each reading and post processing stage of get_datas(), see StageProfiler
+    transform/{timeframe}->{transform}      PostProcessor.transform_timeframe() of one symbol
+
+Each case runs in a new process and reports rows/sec and the peak RSS of that process. Save the results
+with --save-baseline and compare a later run with --baseline, which exits with status 1 if any case is
+slower than the baseline by more than --tolerance.
+
+    $ export PYTHONPATH=`pwd`
+    $ python benchmarks/bench_suite.py --symbols 10 --years 2 --save-baseline baseline.json
+    $ python benchmarks/bench_suite.py --symbols 10 --years 2 --baseline baseline.json
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import LAYOUTS, generate, make_bars  # noqa: E402
+
+TRANSFORMS = ['1min->5min', '1min->60min', '1min->day', '5min->15min', '5min->day', 'day->week', 'day->month']
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, KiB on Linux
+
+
+def bench_get_datas(root: str, layout: str, timeframe: str, symbols: [str], repeat: int) -> [dict]:
+    from pd_dataprovider.objects import SymbolData
+    from pd_dataprovider.provider_factory import ProviderFactory
+
+    provider = ProviderFactory.make_provider(layout, profile=True, **{layout: {'paths': f"{root}/{layout}"}})
+    symbol_datas = [SymbolData(symbol, timeframe, timeframe, '', '', rth_only=False) for symbol in symbols]
+    rows = 0
+
+    def run():
+        nonlocal rows
+        rows = sum(len(data.df) for data in provider.get_datas(symbol_datas))
+
+    seconds = min(timeit.repeat(run, number=1, repeat=repeat))
+    results = [{'name': f"get_datas/{layout}/{timeframe}", 'seconds': seconds, 'rows': rows}]
+    # Stages of the last run
+    for stage, row in provider.profiler.report().iterrows():
+        results.append({'name': f"stage/{layout}/{timeframe}/{stage}", 'seconds': row['seconds'],
+                        'rows': int(max(row['rows_in'], row['rows_out']))})
+    return results
+
+
+def bench_transform(pair: str, years: int, repeat: int) -> [dict]:
+    from pd_dataprovider.utils.post_processor import PostProcessor
+
+    timeframe, transform = pair.split('->')
+    data = make_bars(timeframe, years)
+    post_processor = PostProcessor(0)
+    func_args = {'timeframe': timeframe, 'transform': transform}
+    seconds = min(timeit.repeat(lambda: post_processor.transform_timeframe(data, func_args),
+                                number=1, repeat=repeat))
+    return [{'name': f"transform/{pair}", 'seconds': seconds, 'rows': len(data)}]
+
+
+def run_case(func, *args) -> [dict]:
+    """
+    Process entry point, adds the peak RSS of the process to the results of func(*args).
+    """
+    warnings.simplefilter('ignore', FutureWarning)
+    import logging
+    logging.disable(logging.WARNING)
+    before = peak_rss_mb()
+    results = func(*args)
+    for result in results:
+        result['peak_rss_mb'] = peak_rss_mb()
+        result['rss_increase_mb'] = result['peak_rss_mb'] - before
+    return results
+
+
+def run_isolated(func, *args) -> [dict]:
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_case, func, *args).result()
+
+
+def compare(results: [dict], baseline: dict, tolerance: float) -> [str]:
+    """
+    Print each case with its change in rows/sec from baseline, returns the names of regressed cases.
+    """
+    regressions = []
+    for result in results:
+        rate = result['rows'] / result['seconds'] if result['seconds'] else float('inf')
+        line = (f"{result['name']:<48} {result['rows']:>10d} rows {result['seconds'] * 1000:>9.2f} ms "
+                f"{rate:>13,.0f} rows/s {result['peak_rss_mb']:>7.0f} MB peak")
+        base = baseline.get(result['name'])
+        if base and base['seconds'] and result['seconds']:
+            change = rate / (base['rows'] / base['seconds']) - 1
+            line += f" {change:+7.1%}"
+            # Stages are single measurements, only whole cases are checked
+            if change < -tolerance and not result['name'].startswith('stage/'):
+                regressions.append(result['name'])
+                line += ' REGRESSION'
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', help='Directory for the synthetic files, default a temporary directory')
+    parser.add_argument('--layouts', default=','.join(LAYOUTS))
+    parser.add_argument('--timeframes', default='day,5min')
+    parser.add_argument('--transforms', default=','.join(TRANSFORMS))
+    parser.add_argument('--symbols', type=int, default=10)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', help='Compare with results saved with --save-baseline')
+    parser.add_argument('--save-baseline', help='Save the results as json')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown from the baseline')
+    args = parser.parse_args()
+
+    layouts = args.layouts.split(',') if args.layouts else []
+    timeframes = args.timeframes.split(',') if args.timeframes else []
+    transforms = args.transforms.split(',') if args.transforms else []
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.root or tmp
+        rows = generate(root, layouts, args.symbols, args.years, timeframes)
+        print(f"{args.symbols} symbols, {args.years} years: " +
+              ', '.join(f"{timeframe} {rows[(layouts[0], timeframe)]} rows" for timeframe in timeframes if layouts))
+
+        symbols = [f"SYM{i:03d}" for i in range(args.symbols)]
+        results = []
+        for layout in layouts:
+            for timeframe in timeframes:
+                results += run_isolated(bench_get_datas, root, layout, timeframe, symbols, args.repeat)
+        for pair in transforms:
+            results += run_isolated(bench_transform, pair, args.years, args.repeat)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result['name']: result for result in json.load(f)['results']}
+    regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=1)
+    if regressions:
+        print(f"{len(regressions)} cases slower than baseline by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
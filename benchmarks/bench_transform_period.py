@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+"""
+Compare the vectorized week/month aggregation in PostProcessor with the previous
+per-group DataFrame.append implementation on multi-decade daily data.
+
+    $ export PYTHONPATH=`pwd`
+    $ python benchmarks/bench_transform_period.py --years 30 --repeat 3
+"""
+import argparse
+import timeit
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from pd_dataprovider.utils.post_processor import PostProcessor
+
+
+def make_daily(years: int, seed: int = 0) -> pd.DataFrame:
+    index = pd.bdate_range(end='2020-12-31', periods=years * 252)
+    rng = np.random.default_rng(seed)
+    close = (100 + rng.standard_normal(len(index)).cumsum()).astype(np.float32)
+    return pd.DataFrame({'Open': close + 0.1, 'High': close + 1, 'Low': close - 1, 'Close': close,
+                         'Volume': rng.integers(1000, 100000, len(index)).astype(np.float32)},
+                        index=index)
+
+
+def legacy_transform(data, keys):
+    transdat = data.loc[:, ["Open", "High", "Low", "Close", 'Volume']]
+    for name, values in keys.items():
+        transdat[name] = values
+    dataframes = pd.DataFrame({"Open": [], "High": [], "Low": [], "Close": [], "Volume": []})
+    for name, group in transdat.groupby(list(keys)):
+        df = pd.DataFrame(
+            {"Open": group.iloc[0, 0], "High": max(group.High), "Low": min(group.Low),
+             "Close": group.iloc[-1, 3], "Volume": group.Volume.sum()},
+            index=[group.index[0]])
+        dataframes = dataframes.append(df)
+    return dataframes.sort_index()
+
+
+def legacy_week(data):
+    index = pd.to_datetime(data.index)
+    return legacy_transform(data, {'year': index.map(lambda x: x.isocalendar()[0]),
+                                   'week': index.map(lambda x: x.isocalendar()[1])})
+
+
+def legacy_month(data):
+    index = pd.to_datetime(data.index)
+    return legacy_transform(data, {'year': index.map(lambda x: x.year),
+                                   'month': index.map(lambda x: x.month)})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore', FutureWarning)
+    daily = make_daily(args.years)
+    post_processor = PostProcessor(0)
+    cases = [('week', legacy_week, post_processor._transform_week),
+             ('month', legacy_month, post_processor._transform_month)]
+
+    print(f"{len(daily)} daily bars ({args.years} years)")
+    for name, legacy, vectorized in cases:
+        pd.testing.assert_frame_equal(legacy(daily), vectorized(daily), check_dtype=False, check_freq=False)
+        legacy_time = min(timeit.repeat(lambda: legacy(daily), number=1, repeat=args.repeat))
+        vectorized_time = min(timeit.repeat(lambda: vectorized(daily), number=1, repeat=args.repeat))
+        print(f"{name:>6}: legacy {legacy_time * 1000:9.1f} ms, vectorized {vectorized_time * 1000:7.2f} ms, "
+              f"speedup {legacy_time / vectorized_time:6.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8; py-indent-offset:4 -*-
+"""
+Synthetic bar files in the layouts of the file providers in pd_dataprovider.ini, written as
+'{root}/{layout}/{timeframe}/{symbol}.{csv|json}' so ProviderFactory.make_provider(layout) can read them
+with paths '{root}/{layout}'.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from pd_dataprovider.utils.timeframe import Timeframe
+
+TZ = 'America/New_York'
+
+# Column names and datetime format of each layout, as mapped in ProviderFactory
+LAYOUTS = {
+    'csv': {'columns': ['Date', 'Open', 'High', 'Low', 'Close', 'Volume'], 'epoch': False},
+    'tradingview': {'columns': ['time', 'open', 'high', 'low', 'close', 'volume'], 'epoch': True},
+    'avfile': {'columns': ['timestamp', 'open', 'high', 'low', 'close', 'volume'], 'epoch': False},
+    'alpaca-file': {'columns': ['startEpochTime', 'openPrice', 'highPrice', 'lowPrice', 'closePrice', 'volume'],
+                    'epoch': True, 'json': True},
+}
+
+
+def make_bars(timeframe: str, years: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Random walk OHLCV bars of timeframe for the regular sessions (09:30 to 16:00) of years business years
+    ending 2020-12-31.
+    """
+    sessions = pd.bdate_range(end='2020-12-31', periods=years * 252)
+    target = Timeframe.parse(timeframe)
+    if target.kind == 'intraday':
+        bars = pd.timedelta_range('09:30:00', '15:59:00', freq=f"{target.minutes}min")
+        index = pd.DatetimeIndex((sessions.to_numpy()[:, None] + bars.to_numpy()[None, :]).ravel())
+    elif target.kind == 'day':
+        index = sessions
+    else:
+        raise Exception(f"Can only generate intraday and daily bars, not '{timeframe}'")
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + rng.standard_normal(len(index)).cumsum() * 0.05, 2)
+    return pd.DataFrame({'Open': np.round(close + 0.01, 2), 'High': np.round(close + 0.05, 2),
+                         'Low': np.round(close - 0.05, 2), 'Close': close,
+                         'Volume': rng.integers(100, 100000, len(index))},
+                        index=pd.DatetimeIndex(index, name='Date'))
+
+
+def write_bars(root: str, layout: str, timeframe: str, symbol: str, df: pd.DataFrame) -> str:
+    """
+    Write df as the file of symbol in layout, returns the filename.
+    """
+    spec = LAYOUTS[layout]
+    columns = spec['columns']
+    out = df.copy()
+    if spec['epoch']:
+        out.index = out.index.tz_localize(TZ).tz_convert('UTC').asi8 // 10 ** 9
+    out.index.name = columns[0]
+    out.columns = columns[1:]
+    directory = f"{root}/{layout}/{timeframe}"
+    os.makedirs(directory, exist_ok=True)
+    if spec.get('json'):
+        filename = f"{directory}/{symbol}.json"
+        with open(filename, 'w') as f:
+            json.dump({symbol: json.loads(out.reset_index().to_json(orient='records'))}, f)
+    else:
+        filename = f"{directory}/{symbol}.csv"
+        out.to_csv(filename)
+    return filename
+
+
+def generate(root: str, layouts: [str], symbols: int, years: int, timeframes: [str], seed: int = 0) -> dict:
+    """
+    Write symbols files ('SYM000', 'SYM001', ...) per layout and timeframe.
+    :return: Number of rows per (layout, timeframe)
+    """
+    rows = {}
+    for timeframe in timeframes:
+        for i in range(symbols):
+            df = make_bars(timeframe, years, seed + i)
+            for layout in layouts:
+                write_bars(root, layout, timeframe, f"SYM{i:03d}", df)
+                rows[(layout, timeframe)] = rows.get((layout, timeframe), 0) + len(df)
+    return rows
@@ -1,12 +1,13 @@
 #!/usr/bin/env python
 import click
 import pandas as pd
-from qa_dataprovider.provider_factory import ProviderFactory
-from qa_dataprovider.providers.async_ib_dataprovider import AsyncIBDataProvider
-from qa_dataprovider.objects import SymbolData
+from pd_dataprovider.provider_factory import ProviderFactory
+from pd_dataprovider.providers.async_ib_dataprovider import AsyncIBDataProvider
+from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.utils.incremental import read_last_timestamp, append_bars
 
 
-def download(symbols, file, timeframe, verbose, tz='America/New_York'):
+def download(symbols, file, timeframe, verbose, tz='America/New_York', update=False):
     ib = ProviderFactory.make_provider('alpaca', verbose=verbose, tz=tz, limit=1000)
     symbols = symbols.split(',')
     if file:
@@ -14,10 +15,18 @@ def download(symbols, file, timeframe, verbose, tz='America/New_York'):
             symbols = [ticker.rstrip() for ticker in f.readlines() if not ticker.startswith('#')]
     chunks = [symbols[i:i + 3] for i in range(0, len(symbols), 3)]
     for chunk in chunks:
-        datas = ib.get_datas([SymbolData(symbol, timeframe, timeframe, '', '', True) for symbol in chunk])
-        for symbol, data in zip(chunk, datas):
-            data.df.to_csv(f"{symbol}.csv", header=True)
-            print(f"Wrote {len(data.df)} rows to {symbol}.csv")
+        symbol_datas = []
+        for symbol in chunk:
+            last = read_last_timestamp(f"{symbol}.csv") if update else None
+            symbol_datas.append(SymbolData(symbol, timeframe, timeframe, f"{last:%Y-%m-%d %H:%M}" if last else '',
+                                           f"{pd.Timestamp.now():%Y-%m-%d %H:%M}" if last else '', True))
+        for data in ib.get_datas(symbol_datas):
+            if update:
+                rows = append_bars(f"{data.symbol}.csv", data.df)
+                print(f"Appended {rows} rows to {data.symbol}.csv")
+            else:
+                data.df.to_csv(f"{data.symbol}.csv", header=True)
+                print(f"Wrote {len(data.df)} rows to {data.symbol}.csv")
 
 
 @click.command()
@@ -26,8 +35,9 @@ def download(symbols, file, timeframe, verbose, tz='America/New_York'):
 @click.option('--timeframe', default='5min')
 @click.option('-v', '--verbose', count=True)
 @click.option('--tz', default='America/New_York')
-def main(symbols, file, timeframe, verbose, tz):
-    download(symbols, file, timeframe, verbose, tz)
+@click.option('--update', is_flag=True, help='Append bars after the last bar in existing files')
+def main(symbols, file, timeframe, verbose, tz, update):
+    download(symbols, file, timeframe, verbose, tz, update)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Convert the CSV/JSON files of a configured provider into bar store files read by the 'binary' provider:
+
+    $ python pd_dataprovider/convert_store.py --provider infront --out /Users/fbjarkes/Bardata/binary --workers 8
+
+Files are converted in parallel processes. Symbols with a bar store file newer than their source file are
+skipped, so an interrupted conversion continues where it stopped when run again.
+
+Bar store values are float32, i.e. about 7 significant digits. Each written file is read back and compared
+with the parsed source (float64), and fails if any value differs by more than --tolerance relative to it.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import numpy as np
+
+from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.provider_factory import ProviderFactory
+from pd_dataprovider.providers.generic_dataprovider import GenericDataProvider
+from pd_dataprovider.utils.bar_store import COLUMNS, EXTENSION, read_bars, write_bars
+
+# Relative rounding error of float32 is at most 2 ** -24, about 6e-8
+TOLERANCE = 1e-6
+
+
+def convert_symbol(provider: GenericDataProvider, timeframe: str, symbol: str, out_path: str,
+                   verify: bool = True, tolerance: float = TOLERANCE) -> (str, str, int):
+    """
+    Write the bars of symbol as parsed by provider to '{out_path}/{timeframe}/{symbol}.bars'.
+    :param tolerance: Maximum relative difference between the written and the source values when verifying
+    :return: (symbol, 'converted', rows) or (symbol, 'skipped', 0) if the bar store file is up to date
+    """
+    symbol_data = SymbolData(symbol, timeframe, timeframe, None, None)
+    source = next((filename for filename in provider._filenames(symbol_data) if os.path.exists(filename)), None)
+    if source is None:
+        raise Exception(f"{symbol} not found")
+    out_file = f"{out_path}/{timeframe}/{symbol}.{EXTENSION}"
+    if os.path.exists(out_file) and os.path.getmtime(out_file) >= os.path.getmtime(source):
+        return symbol, 'skipped', 0
+
+    df = provider._read_data(symbol_data, drop_non_default_columns=True)
+    if df.empty:
+        raise Exception(f"No rows in '{source}'")
+    expected = df.reindex(columns=COLUMNS).sort_index()
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    write_bars(out_file, expected)
+    if verify:
+        stored = read_bars(out_file)
+        values = expected.to_numpy(dtype=np.float64)
+        if not stored.index.equals(expected.index) or \
+                not np.allclose(stored.to_numpy(dtype=np.float64), values, rtol=tolerance, atol=0, equal_nan=True):
+            os.remove(out_file)
+            raise Exception(f"'{out_file}' differs from '{source}' by more than {tolerance} relative")
+    return symbol, 'converted', len(expected)
+
+
+def convert(provider: GenericDataProvider, out_path: str, timeframes: [str], symbols: [str] = None,
+            workers: int = None, verify: bool = True, echo=print, tolerance: float = TOLERANCE) -> dict:
+    """
+    Convert the symbols (default all symbols of provider) for each timeframe.
+    :return: Number of symbols per status, 'converted', 'skipped' and 'failed'
+    """
+    counts = {'converted': 0, 'skipped': 0, 'failed': 0}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for timeframe in timeframes:
+            tf_symbols = symbols if symbols else provider.list_symbols(timeframe)
+            futures = {executor.submit(convert_symbol, provider, timeframe, symbol, out_path, verify, tolerance): symbol
+                       for symbol in tf_symbols}
+            for i, future in enumerate(futures, 1):
+                try:
+                    symbol, status, rows = future.result()
+                    echo(f"[{i}/{len(futures)}] {timeframe} {symbol}: {status}" + (f" {rows} rows" if rows else ''))
+                except Exception as e:
+                    status = 'failed'
+                    echo(f"[{i}/{len(futures)}] {timeframe} {futures[future]}: failed, {e}")
+                counts[status] += 1
+    return counts
+
+
+@click.command()
+@click.option('--provider', default='csv', help="Provider in pd_dataprovider.ini to convert", show_default=True)
+@click.option('--paths', help='Comma separated paths overriding the provider paths in pd_dataprovider.ini')
+@click.option('--out', required=True, type=click.Path(file_okay=False), help='Bar store path')
+@click.option('--timeframes', default='day', help='Comma separated timeframes', show_default=True)
+@click.option('--symbols', help='Comma separated symbols, default all symbols found')
+@click.option('--workers', type=int, help='Number of processes, default number of cores')
+@click.option('--no-verify', is_flag=True, help='Skip reading back and comparing the written files')
+@click.option('--tolerance', type=float, default=TOLERANCE, show_default=True,
+              help='Maximum relative difference of the written values from the source values')
+@click.option('-v', '--verbose', count=True)
+def main(provider, paths, out, timeframes, symbols, workers, no_verify, tolerance, verbose):
+    kwargs = {provider: {'paths': paths}} if paths else {}
+    data_provider = ProviderFactory.make_provider(provider, verbose=verbose, **kwargs)
+    counts = convert(data_provider, out, timeframes.split(','), symbols.split(',') if symbols else None,
+                     workers, not no_verify, click.echo, tolerance)
+    click.echo(f"{counts['converted']} converted, {counts['skipped']} skipped, {counts['failed']} failed")
+    if counts['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
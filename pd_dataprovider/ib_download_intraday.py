@@ -1,15 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8; py-indent-offset:4 -*-
 
+import asyncio
+
 import click
 import pandas as pd
-from qa_dataprovider.provider_factory import ProviderFactory
-from qa_dataprovider.providers.async_ib_dataprovider import AsyncIBDataProvider
-from qa_dataprovider.objects import SymbolData
+from pd_dataprovider.provider_factory import ProviderFactory
+from pd_dataprovider.providers.async_ib_dataprovider import AsyncIBDataProvider
+from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.utils.incremental import read_last_timestamp, append_bars
 
 
-def download_intraday(symbols, file, timeframe, verbose, start, tz='America/New_York', id=0):
+def download_intraday(symbols, file, timeframe, verbose, start, tz='America/New_York', id=0, update=False,
+                      clients=1):
     """
+    With update, only bars after the last bar in an existing {symbol}.csv are requested and appended. All
+    symbols are requested at once, spread over clients connections within the IB pacing limits.
+
     TICKER # Stock type and SMART exchange
 
     TICKER-STK # Stock and SMART exchange
@@ -54,17 +61,23 @@ def download_intraday(symbols, file, timeframe, verbose, start, tz='America/New_
 
     TICKER-OPT-EXCHANGE-CURRENCY-YYYYMMDD-STRIKE-RIGHT-MULT # OPT
     """
-    ib = ProviderFactory.make_provider('ibasync', verbose=verbose, keep_alive=True, tz=tz)
+    ib = ProviderFactory.make_provider('ibasync', verbose=verbose, tz=tz, id=int(id), clients=clients)
     symbols = symbols.split(',')
     if file:
         with open(file) as f:
             symbols = [ticker.rstrip() for ticker in f.readlines() if not ticker.startswith('#')]
-    chunks = [symbols[i:i + 3] for i in range(0, len(symbols), 3)]
-    for chunk in chunks:
-        datas = ib.get_datas([SymbolData(symbol, timeframe, timeframe, start, '', True) for symbol in chunk])
-        for symbol, data in zip(chunk, datas):
-            data.df.to_csv(f"{symbol}.csv", header=True)
-            print(f"Wrote {len(data.df)} rows to {symbol}.csv")
+    symbol_datas = []
+    for symbol in symbols:
+        last = read_last_timestamp(f"{symbol}.csv") if update else None
+        symbol_datas.append(SymbolData(symbol, timeframe, timeframe,
+                                       f"{last:%Y-%m-%d %H:%M}" if last else start, '', True))
+    for data in asyncio.run(ib.get_datas_async(symbol_datas)):
+        if update:
+            rows = append_bars(f"{data.symbol}.csv", data.df)
+            print(f"Appended {rows} rows to {data.symbol}.csv")
+        else:
+            data.df.to_csv(f"{data.symbol}.csv", header=True)
+            print(f"Wrote {len(data.df)} rows to {data.symbol}.csv")
 
 
 @click.command()
@@ -75,8 +88,11 @@ def download_intraday(symbols, file, timeframe, verbose, start, tz='America/New_
 @click.option('--start')
 @click.option('--tz', default='America/New_York')
 @click.option('--id', default='0')
-def main(symbols, file, timeframe, verbose, start, tz, id):
-    download_intraday(symbols, file, timeframe, verbose, start, tz, id)
+@click.option('--update', is_flag=True, help='Append bars after the last bar in existing files')
+@click.option('--clients', default=1, help='Number of connections, with client ids id, id + 1, ...',
+              show_default=True)
+def main(symbols, file, timeframe, verbose, start, tz, id, update, clients):
+    download_intraday(symbols, file, timeframe, verbose, start, tz, id, update, clients)
 
 
 if __name__ == '__main__':
@@ -3,13 +3,17 @@
 
 import click
 import pandas as pd
-from qa_dataprovider.provider_factory import ProviderFactory
-from qa_dataprovider.providers.async_ib_dataprovider import AsyncIBDataProvider
-from qa_dataprovider.objects import SymbolData
+from pd_dataprovider.provider_factory import ProviderFactory
+from pd_dataprovider.providers.async_ib_dataprovider import AsyncIBDataProvider
+from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.utils.incremental import read_last_timestamp, append_bars
 
 
-def download_years(symbols: str, file: str, years: str, verbose: int):
+def download_years(symbols: str, file: str, years: str, verbose: int, update: bool = False):
     """
+    With update, only years from the last bar in an existing {symbol}.csv are requested and bars after it
+    are appended.
+
     TICKER # Stock type and SMART exchange
 
     TICKER-STK # Stock and SMART exchange
@@ -62,7 +66,10 @@ def download_years(symbols: str, file: str, years: str, verbose: int):
 
     for symbol in symbols:
         total = pd.DataFrame()
+        last = read_last_timestamp(f"{symbol}.csv") if update else None
         for i, y in enumerate(years.split(',')):
+            if last is not None and int(y) < last.year:
+                continue
             try:
                 df_list = ib.get_dataframes(
                     [SymbolData(symbol, 'day', 'day', f'{y}-01-01', f'{y}-12-31')])
@@ -70,14 +77,16 @@ def download_years(symbols: str, file: str, years: str, verbose: int):
                     print(f"No data for {y}. Stopping")
                     break
                 else:
-                    total = total.append(df_list[0])
+                    total = pd.concat([total, df_list[0]])
             except Exception as e:
                 print(f"Error for {y}: '{e}'. Stopping.")
                 break
 
 
         total = total.sort_index(ascending=True)
-        if len(total) > 0:
+        if last is not None:
+            print(f"Appended {append_bars(f'{symbol}.csv', total)} rows to {symbol}.csv")
+        elif len(total) > 0:
             print(f"Writing {len(total)} rows to {symbol}.csv")
             total.to_csv(f"{symbol}.csv", header=True)
         else:
@@ -91,8 +100,9 @@ def download_years(symbols: str, file: str, years: str, verbose: int):
 @click.option('--symbols', default="SPY", help="Comma separated list of symbols")
 @click.option('--file', type=click.Path(exists=True), help='Read symbols from file')
 @click.option('-v', '--verbose', count=True)
-def main(years, symbols, file, verbose):
-    download_years(symbols, file, years, verbose)
+@click.option('--update', is_flag=True, help='Append bars after the last bar in existing files')
+def main(years, symbols, file, verbose, update):
+    download_years(symbols, file, years, verbose, update)
 
 
 if __name__ == '__main__':
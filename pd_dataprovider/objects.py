@@ -19,4 +19,83 @@ class Data:
     symbol: str = ''
     timeframe: str = ''
     start: datetime = ''
-    end: datetime = ''
\ No newline at end of file
+    end: datetime = ''
+
+    def memory_usage(self) -> pd.Series:
+        """
+        Bytes used by the index and each column of df.
+        """
+        return self.df.memory_usage(index=True, deep=True)
+
+
+class LazyData:
+    """
+    Like Data, but the dataframe is loaded and post-processed on first access of df, see
+    GenericDataProvider.get_lazy_datas(). start, end and rows describe the source data (first and last bar
+    and number of bars as stored, before filtering and transforms) and are read cheaply from the file when
+    the provider supports it, otherwise they are taken from the loaded dataframe. rows is None if the
+    provider knows start and end but not the number of bars without reading the whole file.
+    """
+
+    def __init__(self, symbol_data: SymbolData, loader, describer=None, cache: bool = True):
+        """
+        :param loader: Function returning the post-processed dataframe
+        :param describer: Function returning (start, end, rows) of the source data, or None if not known
+        :param cache: Keep the dataframe after the first access of df until release()
+        """
+        self.symbol_data = symbol_data
+        self.symbol = symbol_data.symbol
+        self.timeframe = symbol_data.transform
+        self._loader = loader
+        self._describer = describer
+        self._cache = cache
+        self._df = None
+        self._description = None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        if self._df is not None:
+            return self._df
+        df = self._loader()
+        if self._cache:
+            self._df = df
+        return df
+
+    @property
+    def loaded(self) -> bool:
+        return self._df is not None
+
+    def release(self):
+        """
+        Drop the cached dataframe, it is loaded again on the next access of df.
+        """
+        self._df = None
+
+    @property
+    def start(self) -> datetime:
+        return self._describe()[0]
+
+    @property
+    def end(self) -> datetime:
+        return self._describe()[1]
+
+    @property
+    def rows(self) -> int:
+        return self._describe()[2]
+
+    def _describe(self) -> tuple:
+        if self._description is None:
+            description = self._describer() if self._describer is not None else None
+            if description is None:
+                df = self.df
+                description = (df.index[0], df.index[-1], len(df)) if not df.empty else (None, None, 0)
+            start, end, rows = description
+            self._description = (pd.Timestamp(start).to_pydatetime() if start is not None else None,
+                                 pd.Timestamp(end).to_pydatetime() if end is not None else None, rows)
+        return self._description
+
+    def memory_usage(self) -> pd.Series:
+        """
+        Bytes used by the index and each column of df.
+        """
+        return self.df.memory_usage(index=True, deep=True)
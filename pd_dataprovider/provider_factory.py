@@ -1,6 +1,7 @@
 import os
 from configparser import ConfigParser
 from pd_dataprovider.providers.async_ib_dataprovider import AsyncIBDataProvider
+from pd_dataprovider.providers.binary_dataprovider import BinaryStoreDataProvider
 from pd_dataprovider.providers.csv_dataprovider import CsvFileDataProvider
 from pd_dataprovider.providers.json_dataprovider import JSONDataProvider
 
@@ -21,9 +22,14 @@ class ProviderFactory:
         cwd = os.path.dirname(os.path.realpath(__file__))
         cfg.read(f"{os.path.split(cwd)[0]}/pd_dataprovider.ini") # TODO: override cfg path from env-variable
 
+        # Provider options, e.g. executor='process', are passed on to the providers accepting them
+        csv_options = {key: kwargs[key] for key in CsvFileDataProvider.OPTIONS if key in kwargs}
+        json_options = {key: kwargs[key] for key in JSONDataProvider.OPTIONS if key in kwargs}
+        binary_options = {key: kwargs[key] for key in BinaryStoreDataProvider.OPTIONS if key in kwargs}
+
         # Can override paths from cfg with parameter
         paths = []
-        if provider in cfg:
+        if provider in cfg and 'paths' in cfg[provider]:
             paths = cfg[provider]['paths'].split(',')
         if provider in kwargs and 'paths' in kwargs[provider]:
             paths = kwargs[provider]['paths'].split(',')
@@ -34,17 +40,18 @@ class ProviderFactory:
                                        port=int(cfg[provider]['port']),
                                        timeout=int(cfg[provider]['timeout']),
                                        chunk_size=int(cfg[provider]['chunk_size']),
-                                       **kwargs)
+                                       **{'clients': int(cfg[provider].get('clients', '1')), **kwargs})
 
         elif provider in ['ibfile', 'quandl', 'csv','ibfile-intraday']:
-            return CsvFileDataProvider(paths, verbose=verbose)
+            return CsvFileDataProvider(paths, verbose=verbose, **csv_options)
 
         elif provider == 'tradingview':
             return CsvFileDataProvider(
                 paths,
                 verbose=verbose,
                 col_names=['time','open','high','low','close', 'volume'],
-                epoch=True
+                epoch=True,
+                **csv_options
             )
 
         elif provider == 'avfile':
@@ -52,20 +59,23 @@ class ProviderFactory:
                 paths,
                 verbose=verbose,
                 col_names=['timestamp','open','high','low','close', 'volume'],
-                epoch=False
+                epoch=False,
+                **csv_options
             )
         elif provider == 'infront':
             return CsvFileDataProvider(
                 paths,
                 verbose=verbose,
-                prefix=['NSQ', 'NYS', 'NYSF', 'SSE', ''] if kwargs.get('prefix') is None else kwargs.get('prefix')
+                prefix=['NSQ', 'NYS', 'NYSF', 'SSE', ''] if kwargs.get('prefix') is None else kwargs.get('prefix'),
+                **csv_options
             )
         elif provider == 'alpaca':
             return JSONDataProvider(
                 paths,
                 verbose=verbose,
                 keys=['t', 'o', 'h', 'l', 'c', 'v'],
-                epoch=True
+                epoch=True,
+                **json_options
             )
         elif provider == 'alpaca-file':
             return JSONDataProvider(
@@ -82,4 +92,6 @@ class ProviderFactory:
                 keys=['DateTime', 'Open', 'High', 'Low', 'Close', 'Volume'],
                 **kwargs
             )
+        elif provider == 'binary':
+            return BinaryStoreDataProvider(paths, verbose=verbose, **binary_options)
         raise Exception(f"Invalid provider {provider}")
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import traceback
 from datetime import datetime, timedelta
@@ -9,15 +10,36 @@ import pytz
 from ib_insync import IB, Stock, Index, Forex, Future, CFD, Commodity, BarData
 
 from pd_dataprovider.providers.generic_dataprovider import GenericDataProvider
-from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.objects import SymbolData, Data
+from pd_dataprovider.utils.dtypes import compact_ohlcv
+from pd_dataprovider.utils.ib_pool import IBClientPool
+from pd_dataprovider.utils.live_bars import LiveFrame
+from pd_dataprovider.utils.pacing import PacingScheduler, PacingViolation
 
 
 class AsyncIBDataProvider(GenericDataProvider):
 
     logger = logging.getLogger(__name__)
 
+    # Bar size and max duration in days for intraday timeframes
+    INTRADAY_BARS = {
+        '5min': ('5 mins', 30),
+        '15min': ('15 mins', 60),
+        '60min': ('1 hour', 365),
+    }
+
+    PACING_VIOLATION_CODE = 162
+
     def __init__(self, verbose: int, host: str, port: int, timeout: int, chunk_size: int, id=0,
-                 tz='America/New_York', **kwargs):
+                 tz='America/New_York', ib: IB = None, pacing: PacingScheduler = None, clients: int = 1,
+                 ib_factory=IB, **kwargs):
+        """
+        :param ib: IB instance to use, e.g. a stand-in for tests
+        :param pacing: Scheduler for requests in get_datas_async(), default PacingScheduler()
+        :param clients: Number of connections, with client ids id, id + 1, ..., for requests in
+        get_datas_async() and stream_datas(), see IBClientPool
+        :param ib_factory: Creates the IB instances of the connections besides ib
+        """
         super(AsyncIBDataProvider, self).__init__(self.logger, verbose, tz,chunk_size=chunk_size, **kwargs)
         self.port = port
         self.host = host
@@ -25,83 +47,183 @@ class AsyncIBDataProvider(GenericDataProvider):
         self.keep_alive = False
         if 'keep_alive' in kwargs:
             self.keep_alive = kwargs['keep_alive']
-        self.ib = IB()
+        self.ib = ib_factory() if ib is None else ib
         self.id = id
+        self.pacing = PacingScheduler() if pacing is None else pacing
+        self._request_errors = {}
+        self._historical_requests = {}
+        first_id = self._client_id()
+        ibs = [self.ib] + [ib_factory() for _ in range(clients - 1)]
+        self.pool = IBClientPool(ibs, [first_id + i for i in range(clients)], host, port, timeout)
+        for client in ibs:
+            client.errorEvent += self._error_handler(client)
 
     def disconnect(self):
-        self.ib.disconnect()
+        self.pool.disconnect()
+        self._request_errors.clear()
 
-    def connect(self):
+    def _client_id(self) -> int:
         if self.id == 0:
-            id = int(random.uniform(1, 1000))
-        else:
-            id = self.id
+            return int(random.uniform(1, 1000))
+        return self.id
+
+    def connect(self):
+        id = self.pool.client_ids[0]
         self.logger.info(f"IBAsync: {self.host}:{self.port}, timeout={self.timeout}, id={id}")
         self.ib.connect(self.host, self.port, clientId=id, timeout=self.timeout, readonly=True)
 
+    async def connect_async(self):
+        await self.pool.connect_async()
+
     def _initialize(self):
         if not self.ib.isConnected():
             self.connect()
 
+    async def _initialize_async(self):
+        # Reconnects clients lost since the previous call with keep_alive
+        if self.pool.connected() < len(self.pool):
+            await self.connect_async()
+
     def _finish(self):
         if not self.keep_alive:
             self.disconnect()
 
     async def _get_data_internal_async(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
-        return self._get_data_internal(symbol_data)
-
-    def _get_data_internal(self, symbol_data: SymbolData) -> pd.DataFrame:
         self.logger.info(f"Getting symbol data: {symbol_data}")
+        request = self._historical_request(symbol_data)
+        key = tuple(str(value) for value in request.values())
+        bars = await self.pacing.run(
+            key, lambda: self.pool.run(lambda ib: self._req_historical_data_async(ib, request)))
+        return self._bars_to_df(bars, symbol_data)
 
-        if symbol_data.timeframe == 'day':
-            symbol, bars = self._get_daily(
-                symbol_data.start, symbol_data.symbol, symbol_data.end)
-            symbol = symbol_data.symbol.split('-')[0]
-            dataframe = self._to_dataframe(bars)
+    async def stream_datas(self, symbol_datas: [SymbolData], capacity: int = 10000, callback=None):
+        """
+        Stream intraday bars with keepUpToDate, yielding a Data each time bars of a symbol are updated.
+        Only the new bars are post processed, updating the last, partial, transformed bar. The df of
+        each Data is a view of the ring buffer of the symbol, i.e. changed by later updates, so copy it
+        to keep it.
 
-        elif symbol_data.timeframe == '60min':
-            now = f"{(datetime.now()):%Y-%m-%d %H:%M}"
-            duration = '365 D'
-            if symbol_data.start:
-                diff = datetime.strptime(now, '%Y-%m-%d %H:%M') - datetime.strptime(symbol_data.start, '%Y-%m-%d %H:%M')
-                if diff.days < 365:
-                    duration = f"{diff.days} D"
-            symbol, bars = self._get_intraday(symbol_data.symbol, now, duration, '1 hour', symbol_data.rth_only)
-            symbol = symbol_data.symbol.split('-')[0]
-            dataframe = self._to_dataframe(bars, tz_fix=True)
+            async for data in provider.stream_datas(symbol_datas):
+                print(data.symbol, data.df.iloc[-1])
 
-        elif symbol_data.timeframe == '5min':
-            now = f"{(datetime.now()):%Y-%m-%d %H:%M}"
-            duration = '30 D'
-            if symbol_data.start:
-                diff = datetime.strptime(now, '%Y-%m-%d %H:%M') - datetime.strptime(symbol_data.start, '%Y-%m-%d %H:%M')
-                if diff.days < 30:
-                    duration = f"{diff.days} D"
+        Use start_stream() to receive the updates with a callback only.
 
-            symbol, bars = self._get_intraday(symbol_data.symbol, now, duration, '5 mins', symbol_data.rth_only)
-            symbol = symbol_data.symbol.split('-')[0]
-            dataframe = self._to_dataframe(bars, tz_fix=True)
+        :param capacity: Number of bars kept per symbol
+        :param callback: Called with each Data as the update is received
+        """
+        await self._initialize_async()
+        queue = asyncio.Queue()
+        subscriptions = []
+        try:
+            for symbol_data in symbol_datas:
+                if symbol_data.timeframe not in self.INTRADAY_BARS:
+                    raise Exception(f"Can only stream intraday timeframes, not '{symbol_data.timeframe}'")
+                request = dict(self._historical_request(symbol_data), endDateTime='', keepUpToDate=True)
+                key = tuple(str(value) for value in request.values())
+                ib, bars = await self.pacing.run(key, lambda: self.pool.run(
+                    lambda ib: self._subscribe_async(ib, request)))
+                subscriptions.append((ib, bars))
+                symbol = symbol_data.symbol.split('-')[0]
+                live = LiveFrame(self.post_processor, self._post_process_args(
+                    symbol, symbol_data.start, symbol_data.end, symbol_data.timeframe, symbol_data.transform,
+                    rth_only=symbol_data.rth_only), capacity)
+
+                def publish(symbol_data=symbol_data, live=live):
+                    data = Data(live.df, symbol_data.symbol, symbol_data.transform, symbol_data.start,
+                                symbol_data.end)
+                    if callback is not None:
+                        callback(data)
+                    queue.put_nowait(data)
+
+                def on_update(bars, has_new_bar, live=live, publish=publish):
+                    # The last bar is updated in place until the next one is appended
+                    updated = self._to_dataframe(bars[-2:] if has_new_bar else bars[-1:], tz_fix=True)
+                    if live.update(updated):
+                        publish()
+
+                live.update(self._to_dataframe(bars, tz_fix=True))
+                publish()
+                bars.updateEvent += on_update
+
+            while True:
+                yield await queue.get()
+        finally:
+            for ib, bars in subscriptions:
+                ib.cancelHistoricalData(bars)
+            self._finish()
+
+    def start_stream(self, symbol_datas: [SymbolData], callback, capacity: int = 10000) -> asyncio.Task:
+        """
+        Stream as stream_datas() in a task of the running event loop, calling callback with each Data.
+        Cancel the task to stop streaming.
+        """
+        async def consume():
+            async for _ in self.stream_datas(symbol_datas, capacity, callback):
+                pass
+        return asyncio.ensure_future(consume())
+
+    async def _subscribe_async(self, ib: IB, request: dict) -> (IB, [BarData]):
+        # Updates are received, and must be cancelled, by the client making the request
+        return ib, await self._req_historical_data_async(ib, request)
+
+    async def _req_historical_data_async(self, ib: IB, request: dict) -> [BarData]:
+        # The request id is only known when the request returns, so errors are kept while any historical
+        # request of the client is in flight and dropped when none is
+        self._historical_requests[id(ib)] = self._historical_requests.get(id(ib), 0) + 1
+        try:
+            bars = await ib.reqHistoricalDataAsync(**request, timeout=self.timeout)
+            error = self._request_errors.pop((id(ib), bars.reqId), None)
+        finally:
+            self._historical_requests[id(ib)] -= 1
+            if not self._historical_requests[id(ib)]:
+                del self._historical_requests[id(ib)]
+                for key in [key for key in self._request_errors if key[0] == id(ib)]:
+                    del self._request_errors[key]
+        if error and error[0] == self.PACING_VIOLATION_CODE and 'pacing violation' in error[1].lower():
+            raise PacingViolation(error[1])
+        return bars
+
+    def _error_handler(self, ib: IB):
+        # Request ids are per client
+        def on_error(reqId, errorCode, errorString, *args):
+            if reqId > 0 and id(ib) in self._historical_requests:
+                self._request_errors[(id(ib), reqId)] = (errorCode, errorString)
+        return on_error
 
-        elif symbol_data.timeframe == '15min':
+    def _get_data_internal(self, symbol_data: SymbolData) -> pd.DataFrame:
+        self.logger.info(f"Getting symbol data: {symbol_data}")
+        bars = self.ib.reqHistoricalData(**self._historical_request(symbol_data))
+        return self._bars_to_df(bars, symbol_data)
+
+    def _historical_request(self, symbol_data: SymbolData) -> dict:
+        """
+        Arguments to reqHistoricalData() for symbol_data.
+        """
+        if symbol_data.timeframe == 'day':
+            return self._daily_request(symbol_data.start, symbol_data.symbol, symbol_data.end)
+
+        elif symbol_data.timeframe in self.INTRADAY_BARS:
+            barsize, max_days = self.INTRADAY_BARS[symbol_data.timeframe]
             now = f"{(datetime.now()):%Y-%m-%d %H:%M}"
-            duration = '60 D'
+            duration = f"{max_days} D"
             if symbol_data.start:
                 diff = datetime.strptime(now, '%Y-%m-%d %H:%M') - datetime.strptime(symbol_data.start, '%Y-%m-%d %H:%M')
-                if diff.days < 60:
-                    duration = f"{diff.days} D"
-            symbol, bars = self._get_intraday(
-                symbol_data.symbol, now, duration, '15 mins', symbol_data.rth_only)
-            symbol = symbol_data.symbol.split('-')[0]
-            dataframe = self._to_dataframe(bars, tz_fix=True)
+                if diff.days < max_days:
+                    duration = f"{max(diff.days, 1)} D"
+            return self._intraday_request(symbol_data.symbol, now, duration, barsize, symbol_data.rth_only)
 
         else:
             raise Exception(f"{symbol_data.timeframe} not implemented!")
 
-        df = dataframe
-        if dataframe.empty:
+    def _bars_to_df(self, bars: [BarData], symbol_data: SymbolData) -> pd.DataFrame:
+        symbol = symbol_data.symbol.split('-')[0]
+        df = self._to_dataframe(bars, tz_fix=symbol_data.timeframe != 'day')
+        if df.empty:
             self.logger.warning(f"Got empty df for {symbol_data}")
         else:
-            df = self._post_process(dataframe, symbol, symbol_data.start,
+            if self.compact:
+                df = compact_ohlcv(df)
+            df = self._post_process(df, symbol, symbol_data.start,
                                     symbol_data.end, symbol_data.timeframe, symbol_data.transform)
 
         return df
@@ -208,20 +330,19 @@ class AsyncIBDataProvider(GenericDataProvider):
         else:
             return Stock(symbol, exchange, currency)
 
-    def _get_intraday(self, ticker: str, to_date: str, duration: str,
-                      barsize: str, rth_only: bool) -> (str, [BarData]):
+    def _intraday_request(self, ticker: str, to_date: str, duration: str,
+                          barsize: str, rth_only: bool) -> dict:
         to_dt = datetime.strptime(f"{to_date}", '%Y-%m-%d %H:%M')
         contract = AsyncIBDataProvider.parse_contract(ticker)
         whatToShow = 'MIDPOINT' if isinstance(
             contract, (Forex, CFD, Commodity)) else 'TRADES'
-        bars = self.ib.reqHistoricalData(contract, endDateTime=to_dt, durationStr=duration,
-                                         barSizeSetting=barsize,
-                                         whatToShow=whatToShow,
-                                         useRTH=rth_only,
-                                         formatDate=2)
-        return contract.symbol, bars
-
-    def _get_daily(self, from_date: str, ticker: str, to_date: str) -> (str, [BarData]):
+        return dict(contract=contract, endDateTime=to_dt, durationStr=duration,
+                    barSizeSetting=barsize,
+                    whatToShow=whatToShow,
+                    useRTH=rth_only,
+                    formatDate=2)
+
+    def _daily_request(self, from_date: str, ticker: str, to_date: str) -> dict:
         #TODO: strip HH:MM from start/end dates?
         from_dt = datetime.strptime(from_date, "%Y-%m-%d")
         today = datetime.strptime(to_date, "%Y-%m-%d")
@@ -239,12 +360,11 @@ class AsyncIBDataProvider(GenericDataProvider):
         whatToShow = 'MIDPOINT' if isinstance(
             contract, (Forex, CFD, Commodity)) else 'TRADES'
         # bars = self.ib.reqDailyBars(contract, 2016)
-        bars = self.ib.reqHistoricalData(contract, endDateTime=to_dt, durationStr=F"{days} D",
-                                         barSizeSetting='1 day',
-                                         whatToShow=whatToShow,
-                                         useRTH=True,
-                                         formatDate=1)
-        return contract.symbol, bars
+        return dict(contract=contract, endDateTime=to_dt, durationStr=F"{days} D",
+                    barSizeSetting='1 day',
+                    whatToShow=whatToShow,
+                    useRTH=True,
+                    formatDate=1)
 
     def _to_dataframe(self, bars, tz_fix=False):
         if tz_fix:
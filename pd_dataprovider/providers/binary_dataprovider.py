@@ -0,0 +1,85 @@
+import logging
+import os
+
+import pandas as pd
+
+from pd_dataprovider.providers.generic_dataprovider import GenericDataProvider
+from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.utils.bar_store import EXTENSION, read_bars
+from pd_dataprovider.utils.file_index import FileIndex
+
+
+class BinaryStoreDataProvider(GenericDataProvider):
+    """
+    Reads bar store files, '{path}/{timeframe}/{symbol}.bars', see utils.bar_store. Files are memory mapped
+    and only the rows from start to end, found by binary search on the timestamps, are used. Without a
+    transform, RTH filter of intraday bars, compact or missing values, the DataFrames from get_datas() wrap
+    the mapped file without parsing or copying.
+    """
+    READS_DATA = True
+    OPTIONS = GenericDataProvider.OPTIONS + ['file_index', 'file_index_path']
+    logging.basicConfig(level=logging.DEBUG,
+                        format='%(filename)s: %(message)s')
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, paths, verbose=0, file_index=True, file_index_path=None, **kwargs):
+        """
+        :param list paths: Paths containing a directory of bar store files per timeframe
+        :param bool file_index: Find files from directory listings, see FileIndex
+        :param str file_index_path: Keep the directory listings in this file between runs
+        """
+        super(BinaryStoreDataProvider, self).__init__(self.logger, verbose, tz='America/New_York', **kwargs)
+        self.paths = paths
+        self.file_index = FileIndex(EXTENSION, index_file=file_index_path) if file_index else None
+
+    def _get_data_internal(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        return self._get_data_group([symbol_data], **kwargs)[0]
+
+    async def _get_data_internal_async(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        return (await self._get_data_group_async([symbol_data], kwargs))[0]
+
+    def list_symbols(self, timeframe: str) -> [str]:
+        return (self.file_index or FileIndex(EXTENSION)).list_symbols(self.paths, timeframe)
+
+    def _filenames(self, symbol_data: SymbolData) -> [str]:
+        if self.file_index is not None:
+            filenames = [self.file_index.resolve(path, symbol_data.timeframe, symbol_data.symbol) for path in self.paths]
+            return [filename for filename in filenames if filename is not None]
+        return [f"{path}/{symbol_data.timeframe}/{symbol_data.symbol}.{EXTENSION}" for path in self.paths]
+
+    def _prefetch(self, symbol_data: SymbolData) -> bool:
+        # Mapping the file is cheaper than reading it ahead
+        return False
+
+    def _describe(self, symbol_data: SymbolData) -> tuple:
+        filename = next((filename for filename in self._filenames(symbol_data) if os.path.exists(filename)), None)
+        if filename is None:
+            return None
+        df = read_bars(filename)
+        return (df.index[0], df.index[-1], len(df)) if len(df) else (None, None, 0)
+
+    def _read_data(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        for filename in self._filenames(symbol_data):
+            self.logger.debug(f"Trying '{filename}'")
+            if os.path.exists(filename):
+                try:
+                    df = read_bars(filename, symbol_data.start, symbol_data.end)
+                except Exception as e:
+                    self.logger.warning(f"Error reading '{filename}': {e}")
+                    continue
+                if df.empty:
+                    self.logger.info(f"{filename}, no rows from {symbol_data.start} to {symbol_data.end}")
+                    df.symbol = symbol_data.symbol
+                    return df
+                self.logger.info(f"{filename}, {len(df):d} rows ({df.index[0]} to {df.index[-1]})")
+                return df
+
+        return self._not_found(symbol_data, **kwargs)
+
+    def _not_found(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        if kwargs.get('graceful', False):
+            self.logger.warning(f"Could not find or open {symbol_data.symbol} in {self.paths}")
+            df = pd.DataFrame()
+            df.symbol = symbol_data.symbol
+            return df
+        raise Exception(f"{symbol_data.symbol} not found in {self.paths}")
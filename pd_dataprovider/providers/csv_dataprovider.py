@@ -1,4 +1,5 @@
 import asyncio
+import io
 import logging
 import os
 
@@ -6,6 +7,9 @@ from pd_dataprovider.providers.generic_dataprovider import GenericDataProvider
 import pandas as pd
 import numpy as np
 from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.utils.day_index import DayIndex
+from pd_dataprovider.utils.file_index import FileIndex
+from pd_dataprovider.utils.incremental import read_last_line
 
 
 class CsvFileDataProvider(GenericDataProvider):
@@ -17,11 +21,14 @@ class CsvFileDataProvider(GenericDataProvider):
         ...
     """
     DEFAULT_COL_NAMES = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+    READS_DATA = True
+    OPTIONS = GenericDataProvider.OPTIONS + ['stream_rows', 'day_index', 'file_index', 'file_index_path']
     logging.basicConfig(level=logging.DEBUG,
                         format='%(filename)s: %(message)s')
     logger = logging.getLogger(__name__)
 
-    def __init__(self, in_paths, verbose=0, prefix=None, col_names=None, epoch=False, **kwargs):
+    def __init__(self, in_paths, verbose=0, prefix=None, col_names=None, epoch=False, stream_rows=None,
+                 day_index=False, file_index=True, file_index_path=None, **kwargs):
         """
         Initialize with a list of paths for which each call to get_data() tries to open
         csv file directly in paths. 
@@ -35,6 +42,13 @@ class CsvFileDataProvider(GenericDataProvider):
         "NYS_AAPL.csv" or "NYSF_AAPL.csv"
         :param list col_names: Specify custom column names
         :param epoch: Datetimes in epoch or as string
+        :param int stream_rows: Read files in chunks of this many rows keeping only rows between start and end,
+        stopping at the first row after end if the file is sorted
+        :param bool day_index: Read only the days between start and end using a sidecar index of byte offsets
+        per day, see DayIndex
+        :param bool file_index: Find files from directory listings instead of trying each path and prefix,
+        see FileIndex
+        :param str file_index_path: Keep the directory listings in this file between runs
         """
         super(CsvFileDataProvider, self).__init__(self.logger, verbose, tz='America/New_York', **kwargs)
         if prefix is None:
@@ -46,86 +60,158 @@ class CsvFileDataProvider(GenericDataProvider):
         self.prefix = prefix
         self.col_names = col_names
         self.epoch = epoch
+        self.stream_rows = stream_rows
+        self.day_index = day_index
+        self.file_index = FileIndex('csv', prefix, file_index_path) if file_index else None
 
-    @DeprecationWarning
     async def _get_data_internal_async(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
-        for path in self.paths:
-            # filenames = [
-            #     "{}/{}_{}.{}".format(path, prefix, symbol_data.symbol, 'csv') for prefix in self.prefix]
-            # filenames.append("{}/{}.{}".format(path, symbol_data.symbol, 'csv'))
-            filename = (f"{path}/{symbol_data.timeframe}/{symbol_data.symbol}.csv")
-            self.logger.debug("Trying '{}'".format(filename))
-            if os.path.exists(filename):
-                with open(filename) as f:
-                    # async with AIOFile(filename, 'r') as f:
-                    # TODO: check if file contains any data? To avoid ambigous async error if empty file
-                    df = pd.read_csv(f, dtype={self.col_names[1]: np.float32, self.col_names[2]: np.float32,
-                                               self.col_names[3]: np.float32,
-                                               self.col_names[4]: np.float32, self.col_names[5]: np.float32},
-                                     parse_dates=True, index_col=self.col_names[0])
-                    df = df.sort_index()
-                    if self.epoch:
-                        df.index = pd.to_datetime(df.index, unit='s')
-
-                    if not all(elem in self.col_names for elem in self.DEFAULT_COL_NAMES):
-                        df.rename(columns={self.col_names[1]: 'Open', self.col_names[2]: 'High',
-                                           self.col_names[3]: 'Low', self.col_names[4]: 'Close',
-                                           self.col_names[5]: 'Volume'},
-                                  inplace=True)
-                    self.logger.info("{}, {:d} rows ({} to {})"
-                                     .format(f.name, len(df), df.index[0], df.index[-1]))
-
-                    data = self._post_process(df, symbol_data.symbol, symbol_data.start, symbol_data.end,
-                                              symbol_data.timeframe, symbol_data.transform,
-                                              rth_only=symbol_data.rth_only, **kwargs)
-                    return data
-        if 'graceful' in kwargs and kwargs['graceful']:
-            self.logger.warning(f"Could not find or open {symbol_data.symbol} in {self.paths}")
-            return pd.DataFrame()
-        else:
-            raise Exception("{} not found in {}".format(symbol_data.symbol, self.paths))
+        return (await self._get_data_group_async([symbol_data], kwargs))[0]
+
+    def _parse_csv(self, source, **kwargs):
+        """
+        read_csv() with the configured columns, returns an iterator of frames if chunksize is given.
+        """
+        reader = pd.read_csv(source, dtype={self.col_names[1]: np.float32, self.col_names[2]: np.float32,
+                                            self.col_names[3]: np.float32,
+                                            self.col_names[4]: np.float32, self.col_names[5]: np.float32},
+                             parse_dates=True, index_col=self.col_names[0], **kwargs)
+        if 'chunksize' in kwargs:
+            return (self._normalize(chunk) for chunk in reader)
+        return self._normalize(reader)
+
+    def _normalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.epoch:
+            # df.index = pd.to_datetime(df.index, unit='s')
+            df.index = pd.to_datetime(df.index, unit='s', utc=True).tz_convert(self.tz).tz_localize(None)
+
+        if not all(elem in self.col_names for elem in self.DEFAULT_COL_NAMES):
+            df.rename(columns={self.col_names[1]: 'Open', self.col_names[2]: 'High',
+                               self.col_names[3]: 'Low', self.col_names[4]: 'Close',
+                               self.col_names[5]: 'Volume'},
+                      inplace=True)
+        return df
+
+    def _read_csv(self, filename: str, start: str = None, end: str = None) -> pd.DataFrame:
+        """
+        Read filename sorted by date. With both start and end given, the day index or the streaming
+        reader (if enabled) return only the rows in that range, plus rows earlier on the day of end when
+        using the day index.
+        """
+        if start and end:
+            if self.day_index:
+                index = DayIndex.load(filename, self.col_names[0], self.epoch, self.tz)
+                if index is not None:
+                    return self._parse_csv(index.read_range(start, end)).sort_index()
+            if self.stream_rows:
+                return self._read_csv_chunked(filename, start, end)
+        return self._parse_csv(filename).sort_index()
+
+    def _read_csv_chunked(self, filename: str, start: str, end: str) -> pd.DataFrame:
+        selected = []
+        ascending = True
+        last = None
+        chunk = None
+        for chunk in self._parse_csv(filename, chunksize=self.stream_rows):
+            if chunk.empty:
+                continue
+            ascending = ascending and chunk.index.is_monotonic_increasing and (last is None or chunk.index[0] >= last)
+            last = chunk.index[-1]
+            if not ascending:
+                chunk = chunk.sort_index()
+            rows = chunk.loc[start:end]
+            if not rows.empty:
+                selected.append(rows)
+            if ascending and len(chunk.loc[:end]) < len(chunk):
+                self.logger.debug(f"Stopped reading '{filename}' after {last}")
+                break
+        if not selected:
+            return chunk.iloc[:0] if chunk is not None else self._parse_csv(filename)
+        return pd.concat(selected).sort_index()
 
     def _get_data_internal(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
-        drop_non_default_columns = kwargs.get('drop_non_default_columns', False)
+        return self._get_data_group([symbol_data], **kwargs)[0]
+
+    def list_symbols(self, timeframe: str) -> [str]:
+        return (self.file_index or FileIndex('csv', self.prefix)).list_symbols(self.paths, timeframe)
+
+    def _filenames(self, symbol_data: SymbolData) -> [str]:
+        if self.file_index is not None:
+            filenames = [self.file_index.resolve(path, symbol_data.timeframe, symbol_data.symbol) for path in self.paths]
+            return [filename for filename in filenames if filename is not None]
+        filenames = []
         for path in self.paths:
-            filenames = [
+            filenames += [
                 "{}/{}/{}_{}.{}".format(path, symbol_data.timeframe, prefix, symbol_data.symbol, 'csv') for prefix in
                 self.prefix]
             filenames.append("{}/{}/{}.{}".format(path, symbol_data.timeframe, symbol_data.symbol, 'csv'))
-            for filename in filenames:
-                self.logger.debug("Trying '{}'".format(filename))
-                if os.path.exists(filename):
-                    with open(filename) as f:
-                        try:
-                            df = pd.read_csv(f, dtype={self.col_names[1]: np.float32, self.col_names[2]: np.float32,
-                                                       self.col_names[3]: np.float32,
-                                                       self.col_names[4]: np.float32, self.col_names[5]: np.float32},
-                                             parse_dates=True, index_col=self.col_names[0])
-                            df = df.sort_index()
-                            if self.epoch:
-                                # df.index = pd.to_datetime(df.index, unit='s')
-                                df.index = pd.to_datetime(df.index, unit='s', utc=True).tz_convert(self.tz).tz_localize(
-                                    None)
-
-                            if not all(elem in self.col_names for elem in self.DEFAULT_COL_NAMES):
-                                df.rename(columns={self.col_names[1]: 'Open', self.col_names[2]: 'High',
-                                                   self.col_names[3]: 'Low', self.col_names[4]: 'Close',
-                                                   self.col_names[5]: 'Volume'},
-                                          inplace=True)
-
-                            if drop_non_default_columns:
-                                df.drop(columns=[col for col in df if col not in self.DEFAULT_COL_NAMES], inplace=True)
-
-                            self.logger.info("{}, {:d} rows ({} to {})"
-                                             .format(f.name, len(df), df.index[0], df.index[-1]))
-
-                            data = self._post_process(df, symbol_data.symbol, symbol_data.start, symbol_data.end,
-                                                      symbol_data.timeframe, symbol_data.transform,
-                                                      rth_only=symbol_data.rth_only, **kwargs)
-                            return data
-                        except Exception as e:
-                            self.logger.warning(f"Error reading and processsing df: ", e)
+        return filenames
+
+    def _range(self, symbol_data: SymbolData) -> (str, str):
+        """
+        The start and end to read if reading only a range of the file, otherwise None, None.
+        """
+        if (self.stream_rows or self.day_index) and symbol_data.start and symbol_data.end:
+            return symbol_data.start, symbol_data.end
+        return None, None
 
+    def _prefetch(self, symbol_data: SymbolData) -> bool:
+        return super()._prefetch(symbol_data) and self._range(symbol_data)[0] is None
+
+    def _read_data(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        for filename in self._filenames(symbol_data):
+            self.logger.debug("Trying '{}'".format(filename))
+            if os.path.exists(filename):
+                try:
+                    start, end = self._range(symbol_data)
+                    params = (self.col_names, self.epoch, str(self.tz))
+                    if start:
+                        params += (start, end)
+                    df = self._read_cached(filename, params, lambda: self._read_csv(filename, start, end))
+                    return self._loaded(df, filename, symbol_data, **kwargs)
+                except Exception as e:
+                    self.logger.warning(f"Error reading '{filename}': {e}")
+
+        return self._not_found(symbol_data, **kwargs)
+
+    def _read_source(self, symbol_data: SymbolData, filename: str, contents: bytes, **kwargs) -> pd.DataFrame:
+        try:
+            df = self._parse_csv(io.BytesIO(contents)).sort_index()
+            return self._loaded(df, filename, symbol_data, **kwargs)
+        except Exception as e:
+            self.logger.warning(f"Error reading '{filename}': {e}")
+        return self._not_found(symbol_data, **kwargs)
+
+    def _describe(self, symbol_data: SymbolData) -> tuple:
+        """
+        Parse only the first and last row of the file. The number of rows is taken from a current DayIndex
+        of the file if there is one, otherwise it is not known (None), counting would read the whole file.
+        """
+        filename = next((filename for filename in self._filenames(symbol_data) if os.path.exists(filename)), None)
+        if filename is None:
+            return None
+        with open(filename, 'rb') as f:
+            header = f.readline()
+            first = f.readline()
+        if not first.strip():
+            return None, None, 0
+        last = read_last_line(filename).encode()
+        df = self._parse_csv(io.BytesIO(header + first.rstrip(b'\r\n') + b'\n' + last + b'\n'))
+        index = DayIndex.load(filename, self.col_names[0], self.epoch, self.tz, build=False)
+        return df.index.min(), df.index.max(), index.rows if index is not None else None
+
+    def _loaded(self, df: pd.DataFrame, filename: str, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        if kwargs.get('drop_non_default_columns', False):
+            df.drop(columns=[col for col in df if col not in self.DEFAULT_COL_NAMES], inplace=True)
+        if df.empty:
+            self.logger.info(f"{filename}, no rows from {symbol_data.start} to {symbol_data.end}")
+            df.symbol = symbol_data.symbol
+            return df
+
+        self.logger.info("{}, {:d} rows ({} to {})"
+                         .format(filename, len(df), df.index[0], df.index[-1]))
+        return df
+
+    def _not_found(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
         if 'graceful' in kwargs and kwargs['graceful']:
             self.logger.warning(f"Could not find or open {symbol_data.symbol} in {self.paths}")
             return pd.DataFrame()
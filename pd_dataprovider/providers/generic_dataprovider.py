@@ -1,24 +1,57 @@
 import asyncio
+import contextlib
+import os
 import sys
 import traceback
 import logging
+import time
 from abc import ABCMeta, abstractmethod
 import concurrent.futures
-from functools import reduce
+from functools import partial, reduce
+import aiofiles
+import aiofiles.os
+import numpy as np
 import pandas as pd
 import pytz
 
+from pd_dataprovider.utils.calendar import SessionCalendar
+from pd_dataprovider.utils.file_cache import FileCache
+from pd_dataprovider.utils.frame_cache import FrameCache
+from pd_dataprovider.utils.dtypes import compact_ohlcv
 from pd_dataprovider.utils.post_processor import PostProcessor
-from pd_dataprovider.objects import SymbolData, Data
+from pd_dataprovider.utils.profiler import StageProfiler
+from pd_dataprovider.objects import SymbolData, Data, LazyData
 import pd_dataprovider.utils.log_helper as log_helper
 
 
+def _get_data_worker(provider, symbol_datas: [SymbolData], kwargs: dict, source: tuple = None) -> \
+        ([(str, pd.DataFrame)], list):
+    """
+    Executor entry point. The symbol attribute set on the dataframes does not survive pickling, so it is
+    returned separately and restored by the caller, as are profiling records made in a worker process.
+    """
+    dataframes = [(getattr(df, 'symbol', None), df) for df in provider._get_data_group(symbol_datas, source, **kwargs)]
+    return dataframes, provider.profiler.take_remote() if provider.profiler is not None else []
+
+
 class GenericDataProvider(metaclass=ABCMeta):
 
     chunk_size = 100
 
     DEFAULT_COL_NAMES = ['Datetime', 'Open', 'High', 'Low', 'Close', 'Volume']
 
+    # Keyword arguments accepted by all providers, see __init__
+    OPTIONS = ['chunk_size', 'executor', 'max_workers', 'ordered', 'cache_dir', 'cache_format',
+               'frame_cache_bytes', 'compact', 'async_limit', 'exchange', 'profile', 'profile_callback']
+
+    EXECUTORS = {
+        'thread': concurrent.futures.ThreadPoolExecutor,
+        'process': concurrent.futures.ProcessPoolExecutor,
+    }
+
+    # Set by providers implementing _read_data(), _read_source(), _filenames() and _not_found()
+    READS_DATA = False
+
     _logger = logging.getLogger(__name__)
 
     @abstractmethod
@@ -31,41 +64,345 @@ class GenericDataProvider(metaclass=ABCMeta):
                                  **kwargs) -> pd.DataFrame:
         pass
 
-    def __init__(self, logger, verbose: int, tz, chunk_size: int = 6, **kwargs):
+    def _read_data(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        """
+        Read the data for symbol_data before any post processing.
+        """
+        raise NotImplementedError
+
+    def _read_source(self, symbol_data: SymbolData, filename: str, contents: bytes, **kwargs) -> pd.DataFrame:
+        """
+        Like _read_data() but parse contents already read from filename.
+        """
+        raise NotImplementedError
+
+    def list_symbols(self, timeframe: str) -> [str]:
+        """
+        Symbols with data for timeframe.
+        """
+        raise NotImplementedError
+
+    def _filenames(self, symbol_data: SymbolData) -> [str]:
+        """
+        Files to try, in order, for symbol_data.
+        """
+        return []
+
+    def _not_found(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        """
+        Called when data for symbol_data is missing or failed to load. Return an empty dataframe or raise.
+        """
+        raise Exception(f"{symbol_data.symbol} not found")
+
+    def _describe(self, symbol_data: SymbolData) -> tuple:
+        """
+        (first datetime, last datetime, rows) of the source data for symbol_data if known without parsing
+        it, otherwise None. rows may be None if only the first and last datetime are known cheaply.
+        """
+        return None
+
+    def __init__(self, logger, verbose: int, tz, chunk_size: int = 6, executor: str = None, max_workers: int = None,
+                 ordered: bool = True, cache_dir: str = None, cache_format: str = None, frame_cache_bytes: int = None,
+                 compact: bool = False, async_limit: int = 32, exchange: str = None, profile: bool = False,
+                 profile_callback=None, **kwargs):
+        """
+        :param executor: Load symbols in parallel with a 'thread' or 'process' pool in get_datas()
+        :param max_workers: Number of workers for the executor (default as in concurrent.futures)
+        :param ordered: Return datas in the order of symbol_datas, otherwise in order of completion
+        :param cache_dir: Cache parsed files in this directory, see FileCache
+        :param cache_format: 'parquet' or 'pickle' (default parquet if pyarrow is installed)
+        :param frame_cache_bytes: Keep post-processed frames from get_datas() in memory up to this size, see FrameCache
+        :param compact: Keep only OHLCV columns with float32 prices and int64 volume, see compact_ohlcv()
+        :param async_limit: Maximum number of files read and processed at a time in get_datas_async()
+        :param exchange: Calendar name, e.g. 'NYSE', to anchor intraday bars to the session open, see SessionCalendar
+        :param profile: Record time, rows and memory of each reading and post processing stage of each call to
+        get_datas() etc. in profiler, see StageProfiler
+        :param profile_callback: Called with each StageRecord, implies profile
+        """
+        if executor is not None and executor not in self.EXECUTORS:
+            raise Exception(f"Invalid executor '{executor}', expected one of {list(self.EXECUTORS)}")
         self.errors = 0
         self.chunk_size = chunk_size
+        self.executor = executor
+        self.max_workers = max_workers
+        self.ordered = ordered
+        self.file_cache = FileCache(cache_dir, cache_format) if cache_dir else None
+        self.frame_cache = FrameCache(frame_cache_bytes) if frame_cache_bytes else None
+        self.compact = compact
+        self.async_limit = async_limit
+        self.exchange = exchange
+        self.profile = profile or profile_callback is not None
+        self.profile_callback = profile_callback
+        self.profiler = None
         self.tz = pytz.timezone(tz)
         log_helper.init_logging([self._logger, logger], verbose)
         self.post_processor = PostProcessor(logger, **kwargs)
 
+    def __getstate__(self):
+        # Workers in a process pool get a copy of the provider, the frame cache stays in this process
+        state = self.__dict__.copy()
+        state['frame_cache'] = None
+        state['profile_callback'] = None
+        return state
+
     def _initialize(self):
         """
         Do initialization, e.g. connecting etc.
         """
         pass
 
+    async def _initialize_async(self):
+        """
+        Do initialization in get_datas_async(), e.g. connecting without blocking the event loop.
+        """
+        self._initialize()
+
     def _finish(self):
         """        
         Do any post data fetching activities, e.g. disconnect, exit async loop, etc.
         """
         pass
 
+    def _before_load(self, symbol_datas: [SymbolData], kwargs: dict):
+        """
+        Called with the arguments of get_datas() etc. before frames are looked up in the frame cache or loaded.
+        """
+        pass
+
+    def _start_profile(self):
+        """
+        Start a new profiler for a call to get_datas() etc. if profiling.
+        """
+        if self.profile:
+            self.profiler = StageProfiler(self.profile_callback)
+
+    def _add_profile(self, records: list):
+        if records:
+            self.profiler.add(records)
+
+    def _run_stages(self, df: pd.DataFrame, funcs: list, func_args: dict) -> pd.DataFrame:
+        """
+        Apply funcs in order, each recorded as a stage if profiling.
+        """
+        if self.profiler is None:
+            return reduce((lambda result, func: func(result, func_args)), funcs, df)
+        for func in funcs:
+            df = self.profiler.measure(func_args['ticker'], func.__name__, func, df, func_args)
+        return df
+
+    def _read_cached(self, filename: str, params, reader) -> pd.DataFrame:
+        """
+        Read filename with reader(), through the file cache if enabled. The params must include everything
+        besides the file itself which affects the parsed frame.
+        """
+        if self.file_cache is None:
+            return reader()
+        return self.file_cache.get(filename, params, reader)
+
     def get_datas(self, symbol_datas: [SymbolData], **kwargs) -> [Data]:
-        datas = []
+        self._start_profile()
         self._initialize()
-        chunks = self.chunks(symbol_datas, self.chunk_size)
-        for chunk in chunks:
-            dataframes = []
-            for symbol_data in chunk:
-                df = self._get_data_internal(symbol_data, **kwargs)
-                dataframes.append(df)
-            datas += self.create_data_class(zip(dataframes, chunk))
+        dataframes = [None] * len(symbol_datas)
+        completed = []
+        for i, df in self._iter_dataframes(symbol_datas, kwargs):
+            dataframes[i] = df
+            completed.append(i)
+        order = completed if self.executor and not self.ordered else range(len(symbol_datas))
+        datas = self.create_data_class((dataframes[i], symbol_datas[i]) for i in order)
 
         self.errors = len(datas) - len(symbol_datas)
         self._finish()
 
         return datas
 
+    def get_lazy_datas(self, symbol_datas: [SymbolData], cache: bool = True, **kwargs) -> [LazyData]:
+        """
+        Like get_datas() but nothing is loaded until df of a LazyData is accessed, and start, end and rows are
+        read without parsing the data when the provider supports it (CsvFileDataProvider and
+        BinaryStoreDataProvider). For other providers, e.g. JSONDataProvider whose files must be parsed as a
+        whole, accessing start, end or rows loads df. Symbols without a file are left out for providers
+        reading files, other missing data shows as an empty df.
+        :param cache: Keep each dataframe after it is loaded, until LazyData.release()
+        """
+        lazy_datas = []
+        for symbol_data in symbol_datas:
+            if self.READS_DATA and not any(os.path.exists(filename) for filename in self._filenames(symbol_data)):
+                self.logger.warning(f"{symbol_data.symbol} not found")
+                continue
+            lazy_datas.append(LazyData(symbol_data, partial(self._load_lazy, symbol_data, kwargs),
+                                       partial(self._describe, symbol_data), cache))
+        self.errors = len(lazy_datas) - len(symbol_datas)
+        return lazy_datas
+
+    def _load_lazy(self, symbol_data: SymbolData, kwargs: dict) -> pd.DataFrame:
+        self._initialize()
+        try:
+            return next(self._iter_dataframes([symbol_data], kwargs))[1]
+        finally:
+            self._finish()
+
+    def get_panel(self, symbol_datas: [SymbolData], fields: [str] = None, index: pd.DatetimeIndex = None,
+                  layout: str = 'wide', dtype=np.float64, **kwargs) -> pd.DataFrame:
+        """
+        Load symbol_datas into one frame aligned on a shared index. Each frame is written into a preallocated
+        (time x field x symbol) array as soon as it is loaded, so no per-symbol frames are kept or concatenated.
+        Rows not in index are dropped, missing values are NaN.
+
+        :param fields: Columns to load, default Open, High, Low, Close and Volume
+        :param index: Datetimes to align on. Default for daily transforms is the sessions of exchange (NYSE if
+        not set) from the earliest start to the latest end
+        :param layout: 'wide' for (field, symbol) columns or 'long' for (datetime, symbol) rows and field columns
+        :param dtype: Data type of the values
+        """
+        if layout not in ['wide', 'long']:
+            raise Exception(f"Invalid layout '{layout}', expected 'wide' or 'long'")
+        symbols = [symbol_data.symbol for symbol_data in symbol_datas]
+        if len(set(symbols)) != len(symbols):
+            raise Exception("Panel symbols must be unique")
+        fields = list(fields) if fields is not None else PostProcessor.OHLCV_COLUMNS
+        if index is None:
+            index = self._panel_index(symbol_datas)
+
+        self._start_profile()
+        self._initialize()
+        values = np.full((len(index), len(fields), len(symbols)), np.nan, dtype=dtype)
+        loaded = 0
+        for i, df in self._iter_dataframes(symbol_datas, kwargs):
+            if df.empty:
+                continue
+            rows = index.get_indexer(df.index)
+            found = rows >= 0
+            for f, field in enumerate(fields):
+                if field in df:
+                    values[rows[found], f, i] = df[field].to_numpy()[found]
+            loaded += 1
+        self.errors = loaded - len(symbol_datas)
+        self._finish()
+
+        if layout == 'long':
+            return pd.DataFrame(values.transpose(0, 2, 1).reshape(-1, len(fields)),
+                                index=pd.MultiIndex.from_product([index, symbols]), columns=fields)
+        return pd.DataFrame(values.reshape(len(index), -1), index=index,
+                            columns=pd.MultiIndex.from_product([fields, symbols]))
+
+    def _panel_index(self, symbol_datas: [SymbolData]) -> pd.DatetimeIndex:
+        if any(symbol_data.transform != 'day' for symbol_data in symbol_datas) or \
+                any(not symbol_data.start or not symbol_data.end for symbol_data in symbol_datas):
+            raise Exception("An index is required for panels other than daily bars with start and end")
+        calendar = SessionCalendar.get(self.exchange or 'NYSE')
+        opens, _ = calendar.sessions(min(pd.Timestamp(symbol_data.start) for symbol_data in symbol_datas),
+                                     max(pd.Timestamp(symbol_data.end) for symbol_data in symbol_datas))
+        return pd.DatetimeIndex(opens.astype('datetime64[D]'))
+
+    def _iter_dataframes(self, symbol_datas: [SymbolData], kwargs: dict):
+        """
+        Yield (index in symbol_datas, dataframe) as each dataframe is loaded, frames from the frame cache
+        first. Groups are loaded in the executor if set.
+        """
+        self._before_load(symbol_datas, kwargs)
+        cached = [self._frame_cache_get(symbol_data, kwargs) for symbol_data in symbol_datas]
+        groups = self._group_symbol_datas(symbol_datas, [df is None for df in cached])
+        for i, df in enumerate(cached):
+            if df is not None:
+                yield i, df
+        del cached
+
+        if not self.executor:
+            for group in groups:
+                dfs = self._get_data_group([symbol_datas[i] for i in group], **kwargs)
+                for i, df in zip(group, dfs):
+                    self._frame_cache_put(symbol_datas[i], kwargs, df)
+                    yield i, df
+            return
+
+        with self.EXECUTORS[self.executor](max_workers=self.max_workers) as executor:
+            futures = {executor.submit(_get_data_worker, self, [symbol_datas[i] for i in group], kwargs): group
+                       for group in groups}
+            for future in concurrent.futures.as_completed(futures):
+                results, records = future.result()
+                self._add_profile(records)
+                for i, (symbol, df) in zip(futures.pop(future), results):
+                    if symbol is not None:
+                        df.symbol = symbol
+                    self._frame_cache_put(symbol_datas[i], kwargs, df)
+                    yield i, df
+
+    def _frame_cache_get(self, symbol_data: SymbolData, kwargs: dict) -> pd.DataFrame:
+        if self.frame_cache is None:
+            return None
+        return self.frame_cache.get(FrameCache.key(symbol_data, kwargs))
+
+    def _frame_cache_put(self, symbol_data: SymbolData, kwargs: dict, df: pd.DataFrame):
+        if self.frame_cache is not None and not df.empty:
+            self.frame_cache.put(FrameCache.key(symbol_data, kwargs), df)
+
+    def _group_symbol_datas(self, symbol_datas: [SymbolData], selected: [bool]) -> [[int]]:
+        """
+        Group indices of the selected symbol_datas which only differ in transform, i.e. can share one read.
+        """
+        groups = {}
+        for i, symbol_data in enumerate(symbol_datas):
+            if selected[i]:
+                key = (symbol_data.symbol, symbol_data.timeframe, symbol_data.start, symbol_data.end,
+                       symbol_data.rth_only)
+                groups.setdefault(key, []).append(i)
+        return list(groups.values())
+
+    def _get_data_group(self, symbol_datas: [SymbolData], source: tuple = None, **kwargs) -> [pd.DataFrame]:
+        """
+        Get data for SymbolDatas which only differ in transform. Providers implementing _read_data() read
+        and pre-process the data once and derive each transform from it, others use _get_data_internal().
+        :param source: Optional (filename, contents) already read for the SymbolDatas
+        """
+        if not self.READS_DATA:
+            return [self._get_data_internal(symbol_data, **kwargs) for symbol_data in symbol_datas]
+
+        first = symbol_datas[0]
+        if source is None:
+            read = partial(self._read_data, first, **kwargs)
+        else:
+            read = partial(self._read_source, first, *source, **kwargs)
+        df = read() if self.profiler is None else self.profiler.measure(first.symbol, 'read', read)
+        if df.empty:
+            return [df] * len(symbol_datas)
+        if self.compact:
+            df = compact_ohlcv(df) if self.profiler is None else \
+                self.profiler.measure(first.symbol, 'compact_ohlcv', compact_ohlcv, df)
+
+        try:
+            func_args = self._post_process_args(first.symbol, first.start, first.end, first.timeframe,
+                                                first.transform, rth_only=first.rth_only, **kwargs)
+            df = self._run_stages(df, self._pre_process_funcs(), func_args)
+            transformed = {}
+            dataframes = []
+            for symbol_data in symbol_datas:
+                if symbol_data.transform in transformed:
+                    dataframes.append(FrameCache.copy_frame(transformed[symbol_data.transform]))
+                else:
+                    dataframes.append(self._transform(df, symbol_data.transform, func_args, transformed))
+            return dataframes
+        except Exception as e:
+            self.logger.warning(f"{first.symbol}: {e}")
+            return [self._not_found(symbol_data, **kwargs) for symbol_data in symbol_datas]
+
+    def _transform(self, df: pd.DataFrame, transform: str, func_args: dict, transformed: dict) -> pd.DataFrame:
+        """
+        Apply the transform stages of _post_process to pre-processed data. Transforms going via daily bars
+        reuse the daily bars already derived for this data.
+        """
+        timeframe = func_args['timeframe']
+        if transform == timeframe:
+            # Columns are added to the frame, the shared data is left as is, e.g. memory mapped
+            df = df.copy(deep=False)
+        elif self.post_processor.transforms_via_day(timeframe, transform):
+            if 'day' not in transformed:
+                self._transform(df, 'day', func_args, transformed)
+            df = transformed['day']
+            timeframe = 'day'
+        args = dict(func_args, timeframe=timeframe, transform=transform)
+        transformed[transform] = self._run_stages(df, self._transform_funcs(), args)
+        return transformed[transform]
+
     def create_data_class(self, lst):
         datas = []
         for df, symbol_data in lst:
@@ -81,19 +418,87 @@ class GenericDataProvider(metaclass=ABCMeta):
         return (l[i:i + n] for i in range(0, len(l), n))
 
     async def get_datas_async(self, symbol_datas: [SymbolData], **kwargs) -> [Data]:
-        self._initialize()
-        chunks = self.chunks(symbol_datas, self.chunk_size)
-        datas = []
-        for chunk in chunks:
-            funcs = [self._get_data_internal_async(
-                symbol_data, **kwargs) for symbol_data in chunk]
-            dfs = await asyncio.gather(*funcs)
-            datas += self.create_data_class(zip(dfs, chunk))
+        self._start_profile()
+        await self._initialize_async()
+        if self.READS_DATA:
+            datas = await self._get_datas_pipelined(symbol_datas, kwargs)
+        else:
+            chunks = self.chunks(symbol_datas, self.chunk_size)
+            datas = []
+            for chunk in chunks:
+                funcs = [self._get_data_internal_async(
+                    symbol_data, **kwargs) for symbol_data in chunk]
+                dfs = await asyncio.gather(*funcs)
+                datas += self.create_data_class(zip(dfs, chunk))
         self._finish()
         return datas
 
+    async def _get_datas_pipelined(self, symbol_datas: [SymbolData], kwargs: dict) -> [Data]:
+        """
+        Read files concurrently while parsing and post processing already read files in the executor
+        ('thread' unless set), so the event loop is never blocked. At most async_limit files are in flight,
+        from the start of reading until processed, so memory is bounded by async_limit files.
+        """
+        self._before_load(symbol_datas, kwargs)
+        dataframes = [self._frame_cache_get(symbol_data, kwargs) for symbol_data in symbol_datas]
+        groups = self._group_symbol_datas(symbol_datas, [df is None for df in dataframes])
+        semaphore = asyncio.Semaphore(self.async_limit)
+        with self.EXECUTORS[self.executor or 'thread'](max_workers=self.max_workers) as executor:
+            results = await asyncio.gather(*[
+                self._get_data_group_async([symbol_datas[i] for i in group], kwargs, executor, semaphore)
+                for group in groups])
+        for group, dfs in zip(groups, results):
+            for i, df in zip(group, dfs):
+                self._frame_cache_put(symbol_datas[i], kwargs, df)
+                dataframes[i] = df
+        return self.create_data_class(zip(dataframes, symbol_datas))
+
+    async def _get_data_group_async(self, symbol_datas: [SymbolData], kwargs: dict,
+                                    executor: concurrent.futures.Executor = None,
+                                    semaphore: asyncio.Semaphore = None) -> [pd.DataFrame]:
+        """
+        Async _get_data_group(). The file is read without blocking if _prefetch() allows, the rest is done
+        in executor (the default executor of the event loop if None).
+        """
+        async with semaphore or contextlib.nullcontext():
+            source = None
+            if self._prefetch(symbol_datas[0]):
+                start = time.perf_counter()
+                source = await self._read_file_async(symbol_datas[0])
+                if self.profiler is not None:
+                    self.profiler.record(symbol_datas[0].symbol, 'read_file', time.perf_counter() - start,
+                                         data_out=source)
+            loop = asyncio.get_running_loop()
+            results, records = await loop.run_in_executor(executor, _get_data_worker, self, symbol_datas, kwargs,
+                                                          source)
+        self._add_profile(records)
+        dataframes = []
+        for symbol, df in results:
+            if symbol is not None:
+                df.symbol = symbol
+            dataframes.append(df)
+        return dataframes
+
+    def _prefetch(self, symbol_data: SymbolData) -> bool:
+        """
+        Whether get_datas_async() should read the file for symbol_data up front. Not done with a file cache
+        since the parsed frame is then usually read from the cache instead.
+        """
+        return self.file_cache is None
+
+    async def _read_file_async(self, symbol_data: SymbolData) -> tuple:
+        """
+        Read the first existing file of _filenames(). Returns (filename, contents) or None.
+        """
+        for filename in self._filenames(symbol_data):
+            if await aiofiles.os.path.exists(filename):
+                async with aiofiles.open(filename, mode='rb') as f:
+                    return filename, await f.read()
+        return None
+
     def get_dataframes(self, symbol_datas: [SymbolData]) -> [pd.DataFrame]:
         dataframes = []
+        self._start_profile()
         self._initialize()
         for symbol_data in symbol_datas:
             try:
@@ -108,7 +513,7 @@ class GenericDataProvider(metaclass=ABCMeta):
 
         return dataframes
 
-    def _post_process(self, data, ticker, from_date, to_date, timeframe, transform, **kwargs):
+    def _post_process_args(self, ticker, from_date, to_date, timeframe, transform, **kwargs) -> dict:
         func_args = {
             'ticker': ticker,
             'timeframe': timeframe,
@@ -116,15 +521,32 @@ class GenericDataProvider(metaclass=ABCMeta):
             'from': from_date,
             'to': to_date,
             'provider': self,
+            'exchange': self.exchange,
         }
         func_args.update(**kwargs)
-        # Post process data in this order:
-        funcs = [self.post_processor.filter_dates,
-                 self.post_processor.filter_rth,
-                 self.post_processor.validate,
-                 self.post_processor.transform_timeframe,
+        return func_args
+
+    def _pre_process_funcs(self) -> list:
+        """
+        Post processing done on the data as read, independent of transform.
+        """
+        return [self.post_processor.filter_dates,
+                self.post_processor.filter_rth,
+                self.post_processor.validate,
+                ]
+
+    def _transform_funcs(self) -> list:
+        funcs = [self.post_processor.transform_timeframe,
                  self.post_processor.fill_na,
-                 self.post_processor.add_meta_data,
                  ]
+        if self.compact:
+            funcs.append(self.post_processor.compact)
+        return funcs + [self.post_processor.add_trading_days,
+                        self.post_processor.add_meta_data]
+
+    def _post_process(self, data, ticker, from_date, to_date, timeframe, transform, **kwargs):
+        func_args = self._post_process_args(ticker, from_date, to_date, timeframe, transform, **kwargs)
+        # Post process data in this order:
+        funcs = self._pre_process_funcs() + self._transform_funcs()
 
-        return reduce((lambda result, func: func(result, func_args)), funcs, data)
+        return self._run_stages(data, funcs, func_args)
@@ -2,135 +2,255 @@ import logging
 import os
 import json
 
-import aiofiles
+import numpy as np
 import pandas as pd
 
 from pd_dataprovider.providers.generic_dataprovider import GenericDataProvider
 from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.utils.file_index import FileIndex
+from pd_dataprovider.utils.snapshots import SnapshotStore
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _loads(contents):
+    return orjson.loads(contents) if orjson is not None else json.loads(contents)
 
 
 class JSONDataProvider(GenericDataProvider):
 
+    READS_DATA = True
+    OPTIONS = GenericDataProvider.OPTIONS + ['file_index', 'file_index_path', 'columnar']
+
     logging.basicConfig(level=logging.DEBUG,
                         format='%(filename)s: %(message)s')
     logger = logging.getLogger(__name__)
 
-    def __init__(self, paths, keys, verbose=0, epoch=False, **kwargs):
+    def __init__(self, paths, keys, verbose=0, epoch=False, file_index=True, file_index_path=None, columnar=False,
+                 **kwargs):
+        """
+        :param file_index: Find files from directory listings, see FileIndex
+        :param file_index_path: Keep the directory listings in this file between runs
+        :param columnar: Build the columns directly from the decoded bars, keeping only the keys used and the
+        bars between start and end, instead of building a frame of all records. Decodes with orjson if installed.
+        Snapshots are then added while building the columns, without copying the historical data
+
+        Daily data includes snapshots, the latest bars in '{path}/snapshots/{symbol}.json' or in one
+        '{path}/snapshots.json', when get_datas() is called with snapshots=True, see SnapshotStore. The snapshot
+        files are only read by such calls, and the symbols with new snapshots since the previous one are in
+        updated_snapshots. Their frames are removed from the frame cache.
+        """
         super(JSONDataProvider, self).__init__(
             self.logger, verbose, tz='America/New_York', **kwargs)
         self.paths = paths
         self.keys = keys
         self.epoch = epoch
+        self.columnar = columnar
+        self.file_index = FileIndex('json', index_file=file_index_path) if file_index else None
+        self.snapshots = SnapshotStore(_loads)
+        self.updated_snapshots = []
+
+    def _before_load(self, symbol_datas: [SymbolData], kwargs: dict):
+        if kwargs.get('snapshots'):
+            self.updated_snapshots = self.refresh_snapshots()
+            if self.frame_cache is not None and self.updated_snapshots:
+                self.frame_cache.discard(self.updated_snapshots)
+
+    def refresh_snapshots(self) -> [str]:
+        """
+        Read the snapshot files changed since the previous refresh, returns the symbols with new snapshots.
+        """
+        return sorted({symbol for path in self.paths for symbol in self.snapshots.load(path)})
 
-    @DeprecationWarning
     async def _get_data_internal_async(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
-        for path in self.paths:
-            filename = (
-                f"{path}/{symbol_data.timeframe}/{symbol_data.symbol}.json")
-            self.logger.debug(f"Trying '{filename}'")
-            if os.path.exists(filename):
-                async with aiofiles.open(filename, mode='r') as f:
-                    contents = await f.read()
-                    jsonData = json.loads(contents)
-                    if jsonData[symbol_data.symbol]:
-                        df = pd.DataFrame(
-                            jsonData[symbol_data.symbol], columns=self.keys)
-                        df.rename(columns={self.keys[0]: GenericDataProvider.DEFAULT_COL_NAMES[0],
-                                           self.keys[1]: GenericDataProvider.DEFAULT_COL_NAMES[1],
-                                           self.keys[2]: GenericDataProvider.DEFAULT_COL_NAMES[2],
-                                           self.keys[3]: GenericDataProvider.DEFAULT_COL_NAMES[3],
-                                           self.keys[4]: GenericDataProvider.DEFAULT_COL_NAMES[4],
-                                           self.keys[5]: GenericDataProvider.DEFAULT_COL_NAMES[5]},
-                                  inplace=True)
-                        df.set_index(
-                            GenericDataProvider.DEFAULT_COL_NAMES[0], inplace=True)
-                        df.index = pd.to_datetime(df.index, unit='s', utc=True).tz_convert(
-                            self.tz).tz_localize(None)
-                        self.logger.info(
-                            f"{filename}: {len(df)} ({df.index[0]} - {df.index[-1]})")
-                        data = self._post_process(df, symbol_data.symbol, symbol_data.start, symbol_data.end,
-                                                  symbol_data.timeframe, symbol_data.transform,
-                                                  rth_only=symbol_data.rth_only, **kwargs)
-                        data.symbol = symbol_data.symbol
-                        return data
-        if 'graceful' in kwargs and kwargs['graceful']:
-            self.logger.warning("{} not found in {}".format(
-                symbol_data.symbol, self.paths))
-            df = pd.DataFrame()
-            df.symbol = symbol_data.symbol
-            return df
-        else:
-            raise Exception("{} not found in {}".format(
-                symbol_data.symbol, self.paths))
+        return (await self._get_data_group_async([symbol_data], kwargs))[0]
+
+    def json_to_df(self, filename: str, symbol_data: SymbolData, snapshot: list = None) -> pd.DataFrame:
+        """
+        :param snapshot: Bars to add to the bars of the file, if not present
+        """
+        if snapshot and self.columnar and self.file_cache is None:
+            return self._read_json(filename, symbol_data, snapshot)
+        params = (self.keys, self.epoch, str(self.tz), symbol_data.symbol)
+        if self._range(symbol_data)[0]:
+            params += self._range(symbol_data)
+        df = self._read_cached(filename, params, lambda: self._read_json(filename, symbol_data))
+        return self._append_snapshot(df, snapshot, filename, symbol_data)
 
-    def json_to_df(self, filename: str, symbol_data: SymbolData) -> pd.DataFrame:
+    def _read_json(self, filename: str, symbol_data: SymbolData, snapshot: list = None) -> pd.DataFrame:
+        if self.columnar:
+            with open(filename, 'rb') as f:
+                return self._json_data_to_df(_loads(f.read()), filename, symbol_data, snapshot)
         with open(filename) as f:
-            json_data = json.load(f)
-            if json_data[symbol_data.symbol]:
-                df = pd.DataFrame(
-                    json_data[symbol_data.symbol], columns=self.keys)
-                df.rename(columns={self.keys[0]: GenericDataProvider.DEFAULT_COL_NAMES[0],
-                                   self.keys[1]: GenericDataProvider.DEFAULT_COL_NAMES[1],
-                                   self.keys[2]: GenericDataProvider.DEFAULT_COL_NAMES[2],
-                                   self.keys[3]: GenericDataProvider.DEFAULT_COL_NAMES[3],
-                                   self.keys[4]: GenericDataProvider.DEFAULT_COL_NAMES[4],
-                                   self.keys[5]: GenericDataProvider.DEFAULT_COL_NAMES[5]},
-                          inplace=True)
-                df.set_index(
-                    GenericDataProvider.DEFAULT_COL_NAMES[0], inplace=True)
-                if self.epoch:
-                    df.index = pd.to_datetime(df.index, unit='s', utc=True).tz_convert(
-                        self.tz).tz_localize(None)
-                else:
-                    df.index = pd.to_datetime(df.index, utc=True).tz_convert(
-                        self.tz).tz_localize(None)
-                self.logger.info("{}, {:d} rows ({} to {})".format(
-                    f.name, len(df), df.index[0], df.index[-1]))
-                #TODO: remove unexpected columns?
-                return df
+            return self._json_data_to_df(json.load(f), filename, symbol_data)
+
+    def _range(self, symbol_data: SymbolData) -> (str, str):
+        """
+        The start and end of the bars to keep when decoding, otherwise None, None.
+        """
+        if self.columnar and symbol_data.start and symbol_data.end:
+            return symbol_data.start, symbol_data.end
+        return None, None
+
+    def _to_datetimes(self, values) -> pd.DatetimeIndex:
+        if self.epoch:
+            return pd.to_datetime(values, unit='s', utc=True).tz_convert(self.tz).tz_localize(None)
+        return pd.to_datetime(values, utc=True).tz_convert(self.tz).tz_localize(None)
+
+    def _bar_datetimes(self, bars: list) -> pd.DatetimeIndex:
+        values = [bar[self.keys[0]] for bar in bars]
+        return self._to_datetimes(np.array(values) if self.epoch else values)
+
+    def _columnar_df(self, bars: list, symbol_data: SymbolData, snapshot: list = None) -> pd.DataFrame:
+        """
+        The frame of bars (dicts of self.keys), built column by column from the bars between start and end.
+        Snapshot bars at datetimes not in bars are added at the end.
+        """
+        index = self._bar_datetimes(bars)
+        if snapshot:
+            snapshot_index = self._bar_datetimes(snapshot)
+            new = ~snapshot_index.isin(index)
+            if new.any():
+                bars = bars + [bar for bar, is_new in zip(snapshot, new) if is_new]
+                index = index.append(snapshot_index[new])
             else:
-                self.logger.warning(
-                    f"Could not find '{symbol_data.symbol}' in file '{filename}'")
-            return pd.DataFrame()
+                self.logger.debug(f"Skipping snapshot: datetime '{snapshot_index[0]}' is present in historical data")
+        start, end = self._range(symbol_data)
+        if start and index.is_monotonic_increasing:
+            rows = index.slice_indexer(start, end)
+            bars, index = bars[rows], index[rows]
+        columns = {name: self._column([bar.get(key) for bar in bars])
+                   for name, key in zip(GenericDataProvider.DEFAULT_COL_NAMES[1:], self.keys[1:])}
+        return pd.DataFrame(columns, index=index.rename(GenericDataProvider.DEFAULT_COL_NAMES[0]))
+
+    @staticmethod
+    def _column(values: list):
+        # Numeric lists convert to int64/float64 arrays as pandas would infer them, anything else
+        # (missing keys, strings) is left to pandas
+        array = np.array(values)
+        return array if array.dtype.kind in 'iuf' else values
+
+    def _json_data_to_df(self, json_data: dict, filename: str, symbol_data: SymbolData,
+                         snapshot: list = None) -> pd.DataFrame:
+        if json_data[symbol_data.symbol] and self.columnar:
+            df = self._columnar_df(json_data[symbol_data.symbol], symbol_data, snapshot)
+            if df.empty:
+                self.logger.info(f"{filename}, no rows from {symbol_data.start} to {symbol_data.end}")
+            else:
+                self.logger.info("{}, {:d} rows ({} to {})".format(filename, len(df), df.index[0], df.index[-1]))
+            return df
+        elif json_data[symbol_data.symbol]:
+            df = pd.DataFrame(
+                json_data[symbol_data.symbol], columns=self.keys)
+            df.rename(columns={self.keys[0]: GenericDataProvider.DEFAULT_COL_NAMES[0],
+                               self.keys[1]: GenericDataProvider.DEFAULT_COL_NAMES[1],
+                               self.keys[2]: GenericDataProvider.DEFAULT_COL_NAMES[2],
+                               self.keys[3]: GenericDataProvider.DEFAULT_COL_NAMES[3],
+                               self.keys[4]: GenericDataProvider.DEFAULT_COL_NAMES[4],
+                               self.keys[5]: GenericDataProvider.DEFAULT_COL_NAMES[5]},
+                      inplace=True)
+            df.set_index(
+                GenericDataProvider.DEFAULT_COL_NAMES[0], inplace=True)
+            if self.epoch:
+                df.index = pd.to_datetime(df.index, unit='s', utc=True).tz_convert(
+                    self.tz).tz_localize(None)
+            else:
+                df.index = pd.to_datetime(df.index, utc=True).tz_convert(
+                    self.tz).tz_localize(None)
+            self.logger.info("{}, {:d} rows ({} to {})".format(
+                filename, len(df), df.index[0], df.index[-1]))
+            #TODO: remove unexpected columns?
+            return df
+        else:
+            self.logger.warning(
+                f"Could not find '{symbol_data.symbol}' in file '{filename}'")
+        return pd.DataFrame()
 
     def _get_data_internal(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
-        for path in self.paths:
-            filename = f"{path}/{symbol_data.timeframe}/{symbol_data.symbol}.json"
+        return self._get_data_group([symbol_data], **kwargs)[0]
+
+    def list_symbols(self, timeframe: str) -> [str]:
+        return (self.file_index or FileIndex('json')).list_symbols(self.paths, timeframe)
+
+    def _locate(self, symbol_data: SymbolData) -> [(str, str)]:
+        """
+        (path, filename) of the files to try for symbol_data.
+        """
+        if self.file_index is not None:
+            filenames = [(path, self.file_index.resolve(path, symbol_data.timeframe, symbol_data.symbol))
+                         for path in self.paths]
+            return [(path, filename) for path, filename in filenames if filename is not None]
+        return [(path, f"{path}/{symbol_data.timeframe}/{symbol_data.symbol}.json") for path in self.paths]
+
+    def _filenames(self, symbol_data: SymbolData) -> [str]:
+        return [filename for _, filename in self._locate(symbol_data)]
+
+    def _read_data(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        for path, filename in self._locate(symbol_data):
             self.logger.debug(f"Trying '{filename}'")
             if os.path.exists(filename):
                 try:
-                    df = self.json_to_df(filename, symbol_data)
-                    df = self.append_snapshots(df, path, symbol_data, kwargs)
-                    data = self._post_process(df, symbol_data.symbol, symbol_data.start, symbol_data.end,
-                                              symbol_data.timeframe, symbol_data.transform,
-                                              rth_only=symbol_data.rth_only, **kwargs)
-                    data.symbol = symbol_data.symbol
-                    return data
+                    df = self.json_to_df(filename, symbol_data, self._snapshot(path, symbol_data, kwargs))
+                    if df.empty:
+                        return self._not_found(symbol_data, **kwargs)
+                    return df
                 except Exception as e:
                     self.logger.warning(f"{symbol_data.symbol}: {e}")
-                    df = pd.DataFrame()
-                    df.symbol = symbol_data.symbol
-                    return df
-            else:
-                self.logger.warning(f"{symbol_data.symbol} not found in paths {self.paths}")
-                df = pd.DataFrame()
-                df.symbol = symbol_data.symbol
-                return df
+                    return self._not_found(symbol_data, **kwargs)
+        self.logger.warning(f"{symbol_data.symbol} not found in paths {self.paths}")
+        return self._not_found(symbol_data, **kwargs)
 
-    def append_snapshots(self, df: pd.DataFrame, path: str, symbol_data: SymbolData, kwargs: dict) -> pd.DataFrame:
-        if not df.empty and 'snapshots' in kwargs and kwargs['snapshots'] and symbol_data.timeframe == 'day':
-            snapshot_filename = f"{path}/snapshots/{symbol_data.symbol}.json"
-            self.logger.debug(
-                f"Trying snapshot file: '{snapshot_filename}'")
-            snapshot_df = self.json_to_df(
-                snapshot_filename, symbol_data)
-            if snapshot_df.empty:
-                self.logger.warning(
-                    f"Failed to load snapshot file '{snapshot_filename}'")
+    def _read_source(self, symbol_data: SymbolData, filename: str, contents: bytes, **kwargs) -> pd.DataFrame:
+        path = next(path for path, located in self._locate(symbol_data) if located == filename)
+        snapshot = self._snapshot(path, symbol_data, kwargs)
+        try:
+            if self.columnar:
+                df = self._json_data_to_df(_loads(contents), filename, symbol_data, snapshot)
             else:
-                if snapshot_df.index.isin(df.index):
-                    self.logger.debug(
-                        f"Skipping snapshot: datetime '{snapshot_df.index[0]}' is present in historical df")
-                else:
-                    df = df.append(snapshot_df)
+                df = self._append_snapshot(self._json_data_to_df(json.loads(contents), filename, symbol_data),
+                                           snapshot, filename, symbol_data)
+            if df.empty:
+                return self._not_found(symbol_data, **kwargs)
+            return df
+        except Exception as e:
+            self.logger.warning(f"{symbol_data.symbol}: {e}")
+            return self._not_found(symbol_data, **kwargs)
+
+    def _not_found(self, symbol_data: SymbolData, **kwargs) -> pd.DataFrame:
+        df = pd.DataFrame()
+        df.symbol = symbol_data.symbol
         return df
+
+    def _snapshot(self, path: str, symbol_data: SymbolData, kwargs: dict) -> list:
+        """
+        The snapshot bars to add for symbol_data, or None.
+        """
+        if kwargs.get('snapshots') and symbol_data.timeframe == 'day':
+            snapshot = self.snapshots.bars(path).get(symbol_data.symbol)
+            if not snapshot:
+                self.logger.debug(f"No snapshot for {symbol_data.symbol} in '{path}'")
+            return snapshot
+        return None
+
+    def _append_snapshot(self, df: pd.DataFrame, snapshot: list, filename: str,
+                         symbol_data: SymbolData) -> pd.DataFrame:
+        """
+        Append the snapshot bars at datetimes not in df, for frames not built with the snapshot.
+        """
+        if not snapshot or df.empty:
+            return df
+        snapshot_df = self._json_data_to_df({symbol_data.symbol: snapshot}, f"{filename} (snapshot)", symbol_data)
+        new = ~snapshot_df.index.isin(df.index)
+        if not new.any():
+            self.logger.debug(f"Skipping snapshot: datetime '{snapshot_df.index[0]}' is present in historical df")
+            return df
+        return pd.concat([df, snapshot_df[new]])
+
+    def append_snapshots(self, df: pd.DataFrame, path: str, symbol_data: SymbolData, kwargs: dict) -> pd.DataFrame:
+        """
+        Append the snapshot for symbol_data in path to df, if called with snapshots=True.
+        """
+        return self._append_snapshot(df, self._snapshot(path, symbol_data, kwargs), path, symbol_data)
@@ -0,0 +1,65 @@
+import os
+import struct
+import threading
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'PDBARS\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIq')
+HEADER_SIZE = 64
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+EXTENSION = 'bars'
+
+
+def write_bars(filename: str, df: pd.DataFrame):
+    """
+    Write the Open, High, Low, Close and Volume columns of df to a bar store file:
+
+        64 byte header: magic, version, number of columns, number of rows (little endian)
+        int64 timestamps (nanoseconds, naive datetimes as in the provider frames)
+        float32 values, one contiguous block per column
+
+    The file is replaced atomically, so readers with the old file mapped keep a consistent view.
+    """
+    df = df.sort_index()
+    n = len(df)
+    timestamps = df.index.asi8.astype('<i8')
+    values = np.empty((len(COLUMNS), n), dtype='<f4')
+    for i, column in enumerate(COLUMNS):
+        values[i] = df[column].to_numpy(dtype=np.float32) if column in df else np.nan
+
+    tmp_file = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(COLUMNS), n).ljust(HEADER_SIZE, b'\x00'))
+            f.write(timestamps.tobytes())
+            f.write(values.tobytes())
+        os.replace(tmp_file, filename)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def read_bars(filename: str, start=None, end=None) -> pd.DataFrame:
+    """
+    Memory map a bar store file and return the bars from start through end (strings as for DataFrame
+    slicing, e.g. '2020-01-31' includes that whole day) as a DataFrame wrapping the mapped file without
+    copying. The mapping is copy-on-write, so the frame can be modified without changing the file, and
+    processes reading the same file share its pages in the OS page cache.
+    """
+    if os.path.getsize(filename) < HEADER_SIZE:
+        raise Exception(f"'{filename}' is not a bar store file")
+    mapped = np.memmap(filename, mode='c', dtype=np.uint8)
+    magic, version, columns, n = HEADER.unpack(mapped[:HEADER.size].tobytes())
+    if magic != MAGIC or version != VERSION or columns != len(COLUMNS):
+        raise Exception(f"'{filename}' is not a version {VERSION} bar store file")
+    if len(mapped) != HEADER_SIZE + n * (8 + 4 * columns):
+        raise Exception(f"'{filename}' has {len(mapped)} bytes, expected {n} rows")
+
+    timestamps = mapped[HEADER_SIZE:HEADER_SIZE + 8 * n].view('<i8')
+    values = mapped[HEADER_SIZE + 8 * n:].view('<f4').reshape(columns, n)
+    index = pd.DatetimeIndex(timestamps.view('M8[ns]'), name='Date')
+    rows = index.slice_indexer(start, end) if start or end else slice(None)
+    return pd.DataFrame(values[:, rows].T, index=index[rows], columns=COLUMNS, copy=False)
@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pandas_market_calendars as mcal
+
+
+class SessionCalendar:
+    """
+    Regular trading sessions of an exchange, e.g. 'NYSE' or 'XSTO' (any pandas_market_calendars name), as
+    naive datetimes in the timezone of the exchange. Sessions, including half days and holidays, are computed
+    for a whole year at a time and kept, so lookups only slice precomputed arrays. Use get() to share one
+    calendar per exchange within the process.
+
+    Set cache_dir (or the environment variable PD_DATAPROVIDER_CALENDAR_CACHE) to also keep the computed
+    years on disk between processes.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    cache_dir = os.environ.get('PD_DATAPROVIDER_CALENDAR_CACHE')
+
+    _calendars = {}
+    _calendars_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, exchange: str) -> 'SessionCalendar':
+        with cls._calendars_lock:
+            if exchange not in cls._calendars:
+                cls._calendars[exchange] = cls(exchange)
+            return cls._calendars[exchange]
+
+    def __init__(self, exchange: str):
+        self.exchange = exchange
+        self.calendar = mcal.get_calendar(exchange)
+        self.tz = self.calendar.tz
+        self._years = {}
+        self._lock = threading.Lock()
+
+    def sessions(self, start, end) -> (np.ndarray, np.ndarray):
+        """
+        Open and close times (datetime64[ns]) of the sessions from the day of start through the day of end.
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        years = [self._year(year) for year in range(start.year, end.year + 1)]
+        opens = np.concatenate([opens for opens, _ in years])
+        closes = np.concatenate([closes for _, closes in years])
+        first = np.searchsorted(opens, start.normalize().to_datetime64(), side='left')
+        last = np.searchsorted(opens, (end.normalize() + pd.Timedelta(days=1)).to_datetime64(), side='left')
+        return opens[first:last], closes[first:last]
+
+    def locate(self, timestamps: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        For each timestamp (int64 nanoseconds) the open and close (int64) of the latest session opened at
+        or before it, and whether the timestamp is within that session (open <= timestamp < close).
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(timestamps) == 0:
+            return timestamps, timestamps, np.zeros(0, dtype=bool)
+        opens, closes = self.sessions(pd.Timestamp(timestamps.min()), pd.Timestamp(timestamps.max()))
+        if len(opens) == 0:
+            return timestamps, timestamps, np.zeros(len(timestamps), dtype=bool)
+        opens, closes = opens.view(np.int64), closes.view(np.int64)
+        session = np.maximum(np.searchsorted(opens, timestamps, side='right') - 1, 0)
+        opens, closes = opens[session], closes[session]
+        return opens, closes, (timestamps >= opens) & (timestamps < closes)
+
+    def rth_mask(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """
+        Boolean mask of the rows of index within regular trading hours, half days included.
+        """
+        return self.locate(index.asi8)[2]
+
+    def trading_days(self, start, end) -> int:
+        """
+        Number of sessions from the day of start through the day of end.
+        """
+        return len(self.sessions(start, end)[0])
+
+    def expected_bars(self, start, end, minutes: int) -> int:
+        """
+        Number of bars of minutes length during the sessions from the day of start through the day of end,
+        counting a bar cut short by the close.
+        """
+        opens, closes = self.sessions(start, end)
+        size = np.timedelta64(minutes, 'm')
+        return int(((closes - opens + size - np.timedelta64(1, 'ns')) // size).sum())
+
+    def missing_sessions(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """
+        Opens of the sessions between the first and last row of index without any row.
+        """
+        if len(index) == 0:
+            return np.array([], dtype='datetime64[ns]')
+        opens, _ = self.sessions(index.min(), index.max())
+        days = index.normalize().unique().to_numpy()
+        session_days = opens.astype('datetime64[D]').astype('datetime64[ns]')
+        return opens[~np.isin(session_days, days)]
+
+    def _year(self, year: int) -> (np.ndarray, np.ndarray):
+        with self._lock:
+            if year not in self._years:
+                self._years[year] = self._load_year(year)
+            return self._years[year]
+
+    def _cache_filename(self, year: int) -> str:
+        return os.path.join(self.cache_dir, f"{self.exchange}-{year}-{mcal.__version__}.npz")
+
+    def _load_year(self, year: int) -> (np.ndarray, np.ndarray):
+        if self.cache_dir:
+            try:
+                with np.load(self._cache_filename(year)) as cached:
+                    return cached['opens'], cached['closes']
+            except (OSError, KeyError, ValueError):
+                pass
+
+        self.logger.debug(f"Computing {self.exchange} sessions for {year}")
+        schedule = self.calendar.schedule(f"{year}-01-01", f"{year}-12-31")
+        opens, closes = (schedule[col].dt.tz_convert(self.tz).dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+                         for col in ['market_open', 'market_close'])
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_file = f"{self._cache_filename(year)}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+                np.savez(tmp_file, opens=opens, closes=closes)
+                os.replace(tmp_file, self._cache_filename(year))
+            except OSError as e:
+                self.logger.warning(f"Could not write calendar cache for {self.exchange} {year}: {e}")
+        return opens, closes
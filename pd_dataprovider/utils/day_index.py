@@ -0,0 +1,111 @@
+import io
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class DayIndex:
+    """
+    Sidecar index '<file>.idx' with the byte offset of the first row of each day in a csv file sorted
+    by date, so a date range can be read by seeking to the first needed row, and the number of rows. The
+    index is rebuilt when the size or modification time of the csv file changes. Files not sorted in
+    ascending order are not indexed.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, filename: str, days: np.ndarray, offsets: np.ndarray, header_end: int, size: int,
+                 rows: int):
+        self.filename = filename
+        self.days = days
+        self.offsets = offsets
+        self.header_end = header_end
+        self.size = size
+        self.rows = rows
+
+    @staticmethod
+    def index_filename(filename: str) -> str:
+        return f"{filename}.idx"
+
+    @classmethod
+    def load(cls, filename: str, column: str, epoch: bool = False, tz=None, build: bool = True) -> 'DayIndex':
+        """
+        Load the index for filename, building it first if missing or stale. Returns None if the file
+        is not sorted by date, or without build if there is no current index.
+        """
+        stat = os.stat(filename)
+        try:
+            with open(cls.index_filename(filename)) as f:
+                meta = json.load(f)
+            if meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns:
+                if not meta['sorted']:
+                    return None
+                return cls(filename, np.array(meta['days'], dtype='datetime64[D]'),
+                           np.array(meta['offsets'], dtype=np.int64), meta['header_end'], meta['size'], meta['rows'])
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls.build(filename, column, epoch, tz) if build else None
+
+    @classmethod
+    def build(cls, filename: str, column: str, epoch: bool = False, tz=None) -> 'DayIndex':
+        """
+        Scan filename and write its index. Returns None if the file is not sorted by date.
+        """
+        stat = os.stat(filename)
+        offsets = []
+        fields = []
+        with open(filename, 'rb') as f:
+            header = f.readline()
+            position = header.decode().rstrip('\r\n').split(',').index(column)
+            offset = len(header)
+            for line in f:
+                if line.strip():
+                    offsets.append(offset)
+                    fields.append(line.split(b',', position + 1)[position].decode())
+                offset += len(line)
+
+        if epoch:
+            dates = pd.to_datetime(np.array(fields, dtype=np.int64), unit='s', utc=True)
+            dates = dates.tz_convert(tz).tz_localize(None)
+        else:
+            dates = pd.to_datetime(fields)
+        days = dates.normalize().to_numpy().astype('datetime64[D]')
+        is_sorted = bool(np.all(dates[1:] >= dates[:-1])) if len(dates) > 1 else True
+        rows = len(fields)
+
+        first = np.ones(len(days), dtype=bool)
+        first[1:] = days[1:] != days[:-1]
+        days = days[first]
+        offsets = np.array(offsets, dtype=np.int64)[first]
+
+        meta = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sorted': is_sorted, 'rows': rows,
+                'header_end': len(header), 'days': [str(day) for day in days], 'offsets': offsets.tolist()}
+        tmp_file = f"{cls.index_filename(filename)}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_file, cls.index_filename(filename))
+            cls.logger.debug(f"Indexed {len(days)} days in '{filename}'")
+        except OSError as e:
+            cls.logger.warning(f"Could not write index for '{filename}': {e}")
+
+        if not is_sorted:
+            return None
+        return cls(filename, days, offsets, len(header), stat.st_size, rows)
+
+    def read_range(self, start, end) -> io.BytesIO:
+        """
+        The header and all rows from the day of start through the day of end, as a csv file in memory.
+        """
+        first = np.searchsorted(self.days, np.datetime64(pd.Timestamp(start).date(), 'D'), side='left')
+        last = np.searchsorted(self.days, np.datetime64(pd.Timestamp(end).date(), 'D'), side='right')
+        begin = self.offsets[first] if first < len(self.offsets) else self.size
+        stop = self.offsets[last] if last < len(self.offsets) else self.size
+        with open(self.filename, 'rb') as f:
+            header = f.read(self.header_end)
+            f.seek(begin)
+            data = f.read(max(0, stop - begin))
+        return io.BytesIO(header + data)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from pd_dataprovider.objects import Data
+
+OHLCV_DTYPES = {
+    'Open': np.float32,
+    'High': np.float32,
+    'Low': np.float32,
+    'Close': np.float32,
+    'Volume': np.int64,
+}
+
+
+def compact_ohlcv(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop all columns but Open, High, Low, Close and Volume and use float32 prices and int64 volume.
+    Volume stays float32 if it has NaN or fractional values. Object columns, e.g. with None, are converted
+    with pd.to_numeric().
+    """
+    symbol = getattr(df, 'symbol', None)
+    columns = [col for col in OHLCV_DTYPES if col in df]
+    if len(columns) < len(df.columns):
+        df = df.loc[:, columns]
+
+    numeric = {col: pd.to_numeric(df[col]) for col in columns if df[col].dtype == object}
+    if numeric:
+        df = df.assign(**numeric)
+    dtypes = {col: OHLCV_DTYPES[col] for col in columns if df[col].dtype != OHLCV_DTYPES[col]}
+    if 'Volume' in dtypes:
+        volume = df['Volume'].to_numpy()
+        if not np.issubdtype(volume.dtype, np.integer) and \
+                (np.isnan(volume).any() or not np.array_equal(volume, np.round(volume))):
+            dtypes['Volume'] = np.float32
+    if dtypes:
+        df = df.astype(dtypes)
+    if symbol is not None:
+        df.symbol = symbol
+    return df
+
+
+def memory_report(datas: [Data]) -> pd.DataFrame:
+    """
+    Bytes used per column (including the index) and in total for each Data.
+    """
+    index = pd.MultiIndex.from_tuples([(data.symbol, data.timeframe) for data in datas],
+                                      names=['symbol', 'timeframe'])
+    report = pd.DataFrame([data.memory_usage() for data in datas], index=index).fillna(0).astype(np.int64)
+    report['Total'] = report.sum(axis=1)
+    return report
@@ -0,0 +1,82 @@
+import hashlib
+import logging
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    DEFAULT_FORMAT = 'parquet'
+except ImportError:
+    DEFAULT_FORMAT = 'pickle'
+
+
+class FileCache:
+    """
+    On-disk cache of parsed bar files. Frames are stored in a binary format (parquet when pyarrow is
+    installed, otherwise pickle) keyed by source path, mtime, size and the parameters used for parsing,
+    e.g. column names. A changed source file gives a new key, so stale entries are never read.
+    """
+
+    FORMATS = ['parquet', 'pickle']
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, cache_dir: str, fmt: str = None):
+        if fmt is None:
+            fmt = DEFAULT_FORMAT
+        if fmt not in self.FORMATS:
+            raise Exception(f"Invalid cache format '{fmt}', expected one of {self.FORMATS}")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.fmt = fmt
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, filename: str, params) -> str:
+        stat = os.stat(filename)
+        parts = [os.path.realpath(filename), stat.st_mtime_ns, stat.st_size, params]
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def get(self, filename: str, params, reader) -> pd.DataFrame:
+        """
+        Return the cached frame for filename, or call reader() and cache its result.
+        """
+        cache_file = os.path.join(self.cache_dir, f"{self.key(filename, params)}.{self.fmt}")
+        if os.path.exists(cache_file):
+            try:
+                df = self._read(cache_file)
+                self.hits += 1
+                self.logger.debug(f"Cache hit for '{filename}': '{cache_file}'")
+                return df
+            except Exception as e:
+                self.logger.warning(f"Failed to read cache file '{cache_file}': {e}")
+
+        self.misses += 1
+        df = reader()
+        if not df.empty:
+            self._write(df, cache_file)
+        return df
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _read(self, cache_file: str) -> pd.DataFrame:
+        if self.fmt == 'parquet':
+            return pd.read_parquet(cache_file)
+        return pd.read_pickle(cache_file)
+
+    def _write(self, df: pd.DataFrame, cache_file: str):
+        # Write to a temporary file first so concurrent readers never see a partial file
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if self.fmt == 'parquet':
+                df.to_parquet(tmp_file)
+            else:
+                df.to_pickle(tmp_file)
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            self.logger.warning(f"Failed to write cache file '{cache_file}': {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
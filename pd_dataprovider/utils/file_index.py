@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import threading
+
+
+class FileIndex:
+    """
+    Symbol to file lookup for directories of '{prefix}_{symbol}.{extension}' and '{symbol}.{extension}' files,
+    e.g. 'data/day/NYS_AAPL.csv'. Each directory is listed with one os.scandir() and listed again only when
+    its modification time changes, so resolving a symbol costs one stat of the directory. The listings can
+    be kept in index_file between runs. File names are matched case insensitively on case insensitive file
+    systems (e.g. the macOS default), as opening the file would, and case sensitively otherwise.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, extension: str, prefixes: [str] = None, index_file: str = None, case_sensitive: bool = None):
+        """
+        :param extension: File extension without dot, e.g. 'csv'
+        :param prefixes: Prefixes tried in order before the plain symbol, as in CsvFileDataProvider
+        :param index_file: Optional json file to keep directory listings in
+        :param case_sensitive: Match file names case sensitively, default as the file system of each directory
+        """
+        self.extension = extension
+        self.prefixes = prefixes if prefixes is not None else []
+        self.index_file = index_file
+        self.case_sensitive = case_sensitive
+        self.scans = 0
+        self._listings = {}
+        self._lock = threading.Lock()
+        if index_file:
+            self._load()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def resolve(self, path: str, timeframe: str, symbol: str) -> str:
+        """
+        The file for symbol in '{path}/{timeframe}', or None.
+        """
+        listing = self._listing(f"{path}/{timeframe}")
+        return listing['files'].get(symbol if listing['case_sensitive'] else symbol.lower())
+
+    def list_symbols(self, paths: [str], timeframe: str) -> [str]:
+        """
+        Sorted symbols with a file for timeframe in any of paths, with prefixes removed.
+        """
+        symbols = set()
+        for path in paths:
+            symbols.update(self._listing(f"{path}/{timeframe}")['symbols'])
+        return sorted(symbols)
+
+    def _listing(self, directory: str) -> dict:
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return {'case_sensitive': True, 'files': {}, 'symbols': []}
+        with self._lock:
+            listing = self._listings.get(directory)
+            if listing is None or listing['mtime_ns'] != mtime_ns:
+                suffix = f".{self.extension}"
+                with os.scandir(directory) as entries:
+                    names = sorted(entry.name for entry in entries if entry.name.endswith(suffix) and entry.is_file())
+                listing = self._make_listing(directory, mtime_ns, names, self._is_case_sensitive(directory, names))
+                self._listings[directory] = listing
+                self.scans += 1
+                self.logger.debug(f"Indexed {len(names)} files in '{directory}'")
+                if self.index_file:
+                    self._save()
+            return listing
+
+    def _is_case_sensitive(self, directory: str, names: [str]) -> bool:
+        if self.case_sensitive is not None:
+            return self.case_sensitive
+        # A file found under its name in other case is the same file on a case insensitive file system
+        name = next((name for name in names if name.swapcase() != name), None)
+        if name is None:
+            return True
+        try:
+            return not os.path.samefile(f"{directory}/{name}", f"{directory}/{name.swapcase()}")
+        except OSError:
+            return True
+
+    def _make_listing(self, directory: str, mtime_ns: int, names: [str], case_sensitive: bool) -> dict:
+        files = {}
+        ranks = {}
+        symbols = set()
+        for name in names:
+            stem = name[:-len(self.extension) - 1]
+            candidates = [(rank, stem[len(prefix) + 1:]) for rank, prefix in enumerate(self.prefixes)
+                          if stem.startswith(f"{prefix}_")]
+            candidates.append((len(self.prefixes), stem))
+            for rank, symbol in candidates:
+                symbol = symbol if case_sensitive else symbol.lower()
+                if symbol not in ranks or rank < ranks[symbol]:
+                    ranks[symbol] = rank
+                    files[symbol] = f"{directory}/{name}"
+            symbols.add(candidates[0][1])
+        return {'mtime_ns': mtime_ns, 'names': names, 'case_sensitive': case_sensitive, 'files': files,
+                'symbols': sorted(symbols)}
+
+    def _load(self):
+        try:
+            with open(self.index_file) as f:
+                saved = json.load(f)
+            self._listings = {directory: self._make_listing(directory, listing['mtime_ns'], listing['names'],
+                                                            listing['case_sensitive'])
+                              for directory, listing in saved.items()}
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.debug(f"Not using index file '{self.index_file}': {e}")
+
+    def _save(self):
+        saved = {directory: {'mtime_ns': listing['mtime_ns'], 'names': listing['names'],
+                             'case_sensitive': listing['case_sensitive']}
+                 for directory, listing in self._listings.items()}
+        tmp_file = f"{self.index_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(saved, f)
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            self.logger.warning(f"Could not write index file '{self.index_file}': {e}")
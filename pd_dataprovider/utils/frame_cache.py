@@ -0,0 +1,90 @@
+import dataclasses
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from pd_dataprovider.objects import SymbolData
+
+
+class FrameCache:
+    """
+    In-memory LRU cache of post-processed frames, bounded by the total size of the cached frames in bytes.
+    Frames are copied when stored and when returned, so callers can modify their frames freely.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(symbol_data: SymbolData, kwargs: dict) -> tuple:
+        """
+        Cache key for a SymbolData and the keyword arguments passed to get_datas(). RTH filtering is
+        never applied to day, week or month data so rth_only is ignored for those.
+        """
+        fields = dataclasses.asdict(symbol_data)
+        fields = {name: value.strip() if isinstance(value, str) else value for name, value in fields.items()}
+        if fields['timeframe'] in ['day', 'week', 'month']:
+            fields['rth_only'] = False
+        return tuple(fields.values()), tuple(sorted((name, repr(value)) for name, value in kwargs.items()))
+
+    def get(self, key: tuple) -> pd.DataFrame:
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            df, _ = entry
+        return self.copy_frame(df)
+
+    def put(self, key: tuple, df: pd.DataFrame):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            self.logger.debug(f"Not caching {getattr(df, 'symbol', '')}: {size} bytes exceeds {self.max_bytes}")
+            return
+        df = self.copy_frame(df)
+        with self._lock:
+            if key in self._frames:
+                self.nbytes -= self._frames.pop(key)[1]
+            while self._frames and self.nbytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._frames.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+            self._frames[key] = (df, size)
+            self.nbytes += size
+
+    def discard(self, symbols: [str]):
+        """
+        Remove the frames of symbols, e.g. when their data changed.
+        """
+        symbols = set(symbols)
+        with self._lock:
+            for key in [key for key in self._frames if key[0][0] in symbols]:
+                self.nbytes -= self._frames.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._frames), 'bytes': self.nbytes}
+
+    @staticmethod
+    def copy_frame(df: pd.DataFrame) -> pd.DataFrame:
+        copy = df.copy()
+        if hasattr(df, 'symbol'):
+            copy.symbol = df.symbol
+        return copy
@@ -0,0 +1,125 @@
+import asyncio
+import contextlib
+import logging
+import time
+
+
+class IBClientPool:
+    """
+    Connections to TWS/Gateway with distinct client ids. Requests go to the connected client with the
+    fewest active requests, so historical data is downloaded over all connections at once. Pacing is not
+    handled here, share one PacingScheduler for the requests of all clients. Disconnected clients are
+    reconnected when next used. A client failing to connect is only tried again after a backoff doubling with
+    each failure, unless no other client is available.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, clients: list, client_ids: [int], host: str, port: int, timeout: int,
+                 backoff: float = 5, max_backoff: float = 300):
+        """
+        :param clients: IB instances, connected or not
+        :param client_ids: Client id of each client
+        :param backoff: Seconds before a client is reconnected after its first failure
+        :param max_backoff: Limit of the backoff doubled with each further failure
+        """
+        if len(clients) != len(client_ids) or len(set(client_ids)) != len(client_ids):
+            raise Exception(f"Expected a distinct client id for each of {len(clients)} clients, got {client_ids}")
+        self.clients = clients
+        self.client_ids = client_ids
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.active = [0] * len(clients)
+        self.requests = [0] * len(clients)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = [0] * len(clients)
+        self.retry_after = [0.0] * len(clients)
+        self._connecting = {}
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def connected(self) -> int:
+        return sum(1 for ib in self.clients if ib.isConnected())
+
+    async def connect_async(self):
+        """
+        Connect all clients not connected, except those waiting for their backoff while another client is
+        connected. Raises if none could be connected.
+        """
+        now = time.monotonic()
+        disconnected = [i for i, ib in enumerate(self.clients) if not ib.isConnected()]
+        waiting = [i for i in disconnected if now < self.retry_after[i]]
+        await asyncio.gather(*[self._connect(i) for i in disconnected if i not in waiting])
+        if not self.connected():
+            await asyncio.gather(*[self._connect(i) for i in waiting])
+        if not self.connected():
+            raise Exception(f"Could not connect any of {len(self.clients)} clients to {self.host}:{self.port}")
+
+    async def _connect(self, i: int) -> bool:
+        # Concurrent requests for a disconnected client wait for the same connection attempt
+        if i not in self._connecting:
+            self._connecting[i] = asyncio.ensure_future(self._connect_client(i))
+        try:
+            return await self._connecting[i]
+        finally:
+            self._connecting.pop(i, None)
+
+    async def _connect_client(self, i: int) -> bool:
+        self.logger.info(f"IBAsync: {self.host}:{self.port}, timeout={self.timeout}, id={self.client_ids[i]}")
+        try:
+            await self.clients[i].connectAsync(self.host, self.port, clientId=self.client_ids[i],
+                                               timeout=self.timeout, readonly=True)
+            self.failures[i] = 0
+            return True
+        except Exception as e:
+            backoff = min(self.backoff * 2 ** self.failures[i], self.max_backoff)
+            self.failures[i] += 1
+            self.retry_after[i] = time.monotonic() + backoff
+            self.logger.warning(f"Could not connect client {self.client_ids[i]}: {e!r}. Retrying in {backoff}s")
+            self.clients[i].disconnect()
+            return False
+
+    def disconnect(self):
+        for ib in self.clients:
+            ib.disconnect()
+
+    @contextlib.asynccontextmanager
+    async def client(self):
+        """
+        The least busy client, reconnected first if disconnected. Clients waiting for their backoff come last.
+        """
+        now = time.monotonic()
+
+        def order(i):
+            waiting = not self.clients[i].isConnected() and now < self.retry_after[i]
+            return waiting, self.active[i], self.requests[i]
+
+        for i in sorted(range(len(self.clients)), key=order):
+            if self.clients[i].isConnected() or await self._connect(i):
+                break
+        else:
+            raise Exception(f"No client connected to {self.host}:{self.port}")
+        self.active[i] += 1
+        self.requests[i] += 1
+        try:
+            yield self.clients[i]
+        finally:
+            self.active[i] -= 1
+
+    async def run(self, request, retries: int = 1):
+        """
+        Run the coroutine function request(ib) with the least busy client. If the connection is lost, the
+        client is disconnected, to be reconnected when next used, and request is retried.
+        """
+        for attempt in range(retries + 1):
+            async with self.client() as ib:
+                try:
+                    return await request(ib)
+                except ConnectionError as e:
+                    ib.disconnect()
+                    if attempt == retries:
+                        raise
+                    self.logger.warning(f"Connection lost: {e}. Retrying")
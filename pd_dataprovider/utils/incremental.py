@@ -0,0 +1,76 @@
+import io
+import os
+
+import pandas as pd
+
+
+def read_last_line(filename: str, block_size: int = 4096) -> str:
+    """
+    Return the last non-empty line of a file, reading backwards from the end in blocks.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b''
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+            lines = data.rstrip(b'\r\n').split(b'\n')
+            if len(lines) > 1 or end == 0:
+                return lines[-1].decode().rstrip('\r')
+    return ''
+
+
+def read_last_timestamp(filename: str) -> pd.Timestamp:
+    """
+    Return the datetime of the last row in a csv file written by DataFrame.to_csv(), i.e. with the
+    datetime index in the first column, or None if the file is missing or has no rows.
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        header = f.readline()
+    last = read_last_line(filename)
+    if not last or last == header.rstrip('\r\n'):
+        return None
+    return pd.Timestamp(last.split(',')[0])
+
+
+def append_bars(filename: str, df: pd.DataFrame) -> int:
+    """
+    Append the rows of df after the last datetime in filename, or write all rows if the file is missing.
+    The rows are written with one write call and the file is truncated back if it fails, so a failed
+    append never leaves a partial row. Returns the number of rows written.
+    """
+    if df.empty:
+        return 0
+    last = read_last_timestamp(filename)
+    if last is None:
+        tmp_file = f"{filename}.tmp"
+        df.to_csv(tmp_file, header=True)
+        os.replace(tmp_file, filename)
+        return len(df)
+
+    df = df[df.index > last]
+    if df.empty:
+        return 0
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False)
+    with open(filename, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        prefix = b''
+        if size > 0:
+            f.seek(size - 1)
+            if f.read(1) != b'\n':
+                prefix = b'\n'
+        try:
+            f.write(prefix + buffer.getvalue().encode())
+            f.flush()
+            os.fsync(f.fileno())
+        except Exception:
+            f.truncate(size)
+            raise
+    return len(df)
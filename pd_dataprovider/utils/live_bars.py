@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from pd_dataprovider.utils.post_processor import PostProcessor
+
+
+class BarBuffer:
+    """
+    Ring buffer of the latest capacity OHLCV bars, ordered by datetime. Every value is written twice,
+    capacity rows apart, so the bars in the buffer are always one contiguous slice and frame() returns
+    a view without copying.
+    """
+
+    COLUMNS = PostProcessor.OHLCV_COLUMNS
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._index = np.zeros(2 * capacity, dtype='datetime64[ns]')
+        self._values = np.full((2 * capacity, len(self.COLUMNS)), np.nan)
+        self._start = 0
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _window(self) -> slice:
+        return slice(self._start, self._start + self._length)
+
+    def index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self._index[self._window()], name='Date')
+
+    def frame(self) -> pd.DataFrame:
+        """
+        The bars as a DataFrame sharing memory with the buffer, i.e. changed by later updates.
+        """
+        return pd.DataFrame(self._values[self._window()], index=self.index(), columns=self.COLUMNS, copy=False)
+
+    def upsert(self, df: pd.DataFrame):
+        """
+        Replace the bars from the first datetime of df on with the bars of df, keeping the latest
+        capacity bars.
+        """
+        if df.empty:
+            return
+        index = df.index.to_numpy(dtype='datetime64[ns]')
+        self._length = int(np.searchsorted(self._index[self._window()], index[0], side='left'))
+        values = df.reindex(columns=self.COLUMNS).to_numpy(dtype=np.float64)
+        if len(index) > self.capacity:
+            index, values = index[-self.capacity:], values[-self.capacity:]
+        for row in range(len(index)):
+            self._append(index[row], values[row])
+
+    def _append(self, timestamp, values):
+        if self._length == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self._length -= 1
+        position = (self._start + self._length) % self.capacity
+        for offset in [position, position + self.capacity]:
+            self._index[offset] = timestamp
+            self._values[offset] = values
+        self._length += 1
+
+
+class LiveFrame:
+    """
+    Post-processed bars of one SymbolData kept up to date from streamed bars. Each update post-processes
+    only the source bars of the last transformed bar onwards, so the last, partial, bar is updated and new
+    bars are appended without processing the history again. Stages are filter_dates, filter_rth, validate,
+    transform_timeframe and fill_na, i.e. as in get_datas() but without compact and the columns added by
+    add_trading_days.
+    """
+
+    def __init__(self, post_processor: PostProcessor, func_args: dict, capacity: int):
+        """
+        :param func_args: Post processing arguments, see GenericDataProvider._post_process_args()
+        :param capacity: Number of source bars, and transformed bars, kept
+        """
+        self.post_processor = post_processor
+        self.func_args = func_args
+        self.source = BarBuffer(capacity)
+        self.transformed = BarBuffer(capacity)
+        self.funcs = [post_processor.filter_dates, post_processor.filter_rth, post_processor.validate,
+                      post_processor.transform_timeframe, post_processor.fill_na]
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.transformed.frame()
+
+    def update(self, bars: pd.DataFrame) -> int:
+        """
+        Add or update source bars, returns the number of transformed bars added or changed.
+        """
+        if bars.empty:
+            return 0
+        self.source.upsert(bars)
+        transformed = self.transformed.index()
+        # Recompute from the start of the transformed bar holding the first changed source bar
+        first = np.searchsorted(transformed.to_numpy(), bars.index[0].to_datetime64(), side='right') - 1
+        source = self.source.frame()
+        tail = (source.loc[transformed[first]:] if first >= 0 else source).copy()
+        for func in self.funcs:
+            tail = func(tail, self.func_args)
+        self.transformed.upsert(tail)
+        return len(tail)
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+
+class PacingViolation(Exception):
+    pass
+
+
+class PacingScheduler:
+    """
+    Schedule IB historical data requests within the pacing limits
+    (https://interactivebrokers.github.io/tws-api/historical_limitations.html):
+
+        - At most max_concurrent simultaneous requests
+        - No identical requests within identical_cooldown seconds
+        - At most max_requests requests within window seconds
+
+    Requests failing with PacingViolation are retried after backoff, backoff * 2, ... seconds.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, max_concurrent: int = 50, max_requests: int = 60, window: float = 600,
+                 identical_cooldown: float = 15, retries: int = 3, backoff: float = 15):
+        self.max_concurrent = max_concurrent
+        self.max_requests = max_requests
+        self.window = window
+        self.identical_cooldown = identical_cooldown
+        self.retries = retries
+        self.backoff = backoff
+        self.requests = 0
+        self.violations = 0
+        self._history = deque()
+        self._last_request = {}
+        self._semaphores = {}
+
+    async def run(self, key, request):
+        """
+        Run the coroutine function request() when allowed by the pacing limits. Requests with equal key
+        are considered identical.
+        """
+        for attempt in range(self.retries + 1):
+            async with self._semaphore():
+                await self._wait_for_slot(key)
+                try:
+                    return await request()
+                except PacingViolation as e:
+                    self.violations += 1
+                    if attempt == self.retries:
+                        raise
+                    delay = self.backoff * 2 ** attempt
+                    self.logger.warning(f"Pacing violation for {key}: {e}. Retrying in {delay} seconds")
+            await asyncio.sleep(delay)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # A semaphore belongs to one event loop, e.g. each asyncio.run() call
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores = {loop: asyncio.Semaphore(self.max_concurrent)}
+        return self._semaphores[loop]
+
+    async def _wait_for_slot(self, key):
+        while True:
+            now = time.monotonic()
+            while self._history and self._history[0] <= now - self.window:
+                self._history.popleft()
+
+            wait = 0
+            if len(self._history) >= self.max_requests:
+                wait = self._history[0] + self.window - now
+            if key in self._last_request:
+                wait = max(wait, self._last_request[key] + self.identical_cooldown - now)
+
+            if wait <= 0:
+                self._history.append(now)
+                self._last_request = {k: t for k, t in self._last_request.items()
+                                      if t > now - self.identical_cooldown}
+                self._last_request[key] = now
+                self.requests += 1
+                return
+            self.logger.debug(f"Pacing: waiting {wait:.1f} seconds for {key}")
+            await asyncio.sleep(wait)
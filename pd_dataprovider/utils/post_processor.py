@@ -3,6 +3,9 @@ import pandas as pd
 import numpy as np
 
 from pd_dataprovider.utils import log_helper
+from pd_dataprovider.utils.calendar import SessionCalendar
+from pd_dataprovider.utils.dtypes import compact_ohlcv
+from pd_dataprovider.utils.timeframe import Timeframe, INTRADAY, DAY, WEEK, MONTH
 from pd_dataprovider.utils.validator import Validator
 
 
@@ -12,6 +15,19 @@ class PostProcessor:
     validator = Validator()
     ta = {}
 
+    OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+    # Resampling function for each (source kind, target kind) of Timeframe, called with the post process
+    # arguments. Transforms without an entry go via daily bars if possible, e.g. intraday to week.
+    RESAMPLERS = {
+        (INTRADAY, INTRADAY): lambda self, data, target, kwargs: self._transform_fixed(
+            data, target.minutes, kwargs.get('exchange')),
+        (INTRADAY, DAY): lambda self, data, target, kwargs: self._transform_fixed(data, target.minutes),
+        (DAY, DAY): lambda self, data, target, kwargs: self._transform_fixed(data, target.minutes),
+        (DAY, WEEK): lambda self, data, target, kwargs: self._transform_week(data),
+        (DAY, MONTH): lambda self, data, target, kwargs: self._transform_month(data),
+    }
+
     def __init__(self, verbose, **kwargs):
         log_helper.init_logging([self.logger], verbose)
         self.ta = kwargs['ta'] if 'ta' in kwargs else {}
@@ -26,6 +42,9 @@ class PostProcessor:
     def filter_rth(self, data, kwargs):
         if kwargs['timeframe'] not in ['day', 'week', 'month'] and 'rth_only' in kwargs and kwargs['rth_only']:
             self.logger.debug('Filtering for RTH only')
+            if kwargs.get('exchange'):
+                # Sessions of the exchange calendar, i.e. including half days and excluding the close
+                return pd.DataFrame(data[SessionCalendar.get(kwargs['exchange']).rth_mask(data.index)])
             return pd.DataFrame(data.between_time('09:30', '16:00'))
         else:
             return data
@@ -34,58 +53,42 @@ class PostProcessor:
         if kwargs['timeframe'] == kwargs['transform']:
             return data # Let it pass regardless of timeframe
 
-        if kwargs['timeframe'] == 'day':
-            if kwargs['transform'] == 'week':
-                data = self._transform_week(data)
-            if kwargs['transform'] == 'month':
-                data = self._transform_month(data)
-            if "D" in kwargs['transform'] and kwargs['transform'] != "1D":
-                data = self._transform_day(data, kwargs['transform'][:-1])
-        elif kwargs['timeframe'] == '5min':
-            if kwargs['transform'] == '10min':
-                data = self._transform_min(10, data)
-            if kwargs['transform'] == '15min':
-                data = self._transform_min(15, data)
-            if kwargs['transform'] == '30min':
-                data = self._transform_min(30, data)
-            if kwargs['transform'] == '60min':
-                data = self._transform_hour(data)
-            if kwargs['transform'] == 'day':
-                data = self._transform_day(data, 1)
-            if kwargs['transform'] == 'week':
-                daily = self._transform_day(data, 1)
-                data = self._transform_week(daily)
-        elif kwargs['timeframe'] == '1min':
-            if kwargs['transform'] == '5min':
-                data = self._transform_min(5, data)
-            if kwargs['transform'] == '15min':
-                data = self._transform_min(15, data)
-            if kwargs['transform'] == '30min':
-                data = self._transform_min(30, data)
-            if kwargs['transform'] == '60min':
-                data = self._transform_hour(data)
-        elif kwargs['timeframe'] == '60min':
-            if kwargs['transform'] == '240min':
-                data = self._transform_min(240, data)
-        elif kwargs['timeframe'] == '15min':
-            if kwargs['transform'] == '30min':
-                data = self._transform_min(30, data)
-            elif kwargs['transform'] == '60min':
-                data = self._transform_min(60, data)
-            elif kwargs['transform'] == '240min':
-                data = self._transform_min(240, data)
-            elif kwargs['transform'] == 'day':
-                data = self._transform_day(data, 1)
-            elif kwargs['transform'] == 'week':
-                daily = self._transform_day(data, 1)
-                data = self._transform_week(daily)
-        else:
-            raise Exception(
-                f"NOT IMPLEMENTED: transform '{kwargs['timeframe']}' to '{kwargs['transform']}'")
+        source = Timeframe.parse(kwargs['timeframe'])
+        for target in self.resample_plan(kwargs['timeframe'], kwargs['transform']):
+            data = self.RESAMPLERS[(source.kind, target.kind)](self, data, target, kwargs)
+            source = target
         return data
 
+    def resample_plan(self, timeframe, transform):
+        """
+        The timeframes to resample through from timeframe to transform, e.g. [day, week] for 5min to week.
+        Raises if transform bars are not made up of whole timeframe bars.
+        """
+        source, target = Timeframe.parse(timeframe), Timeframe.parse(transform)
+        if not source.divides(target):
+            raise Exception(f"NOT IMPLEMENTED: transform '{timeframe}' to '{transform}'")
+        if (source.kind, source.length) == (target.kind, target.length):
+            return []
+        if (source.kind, target.kind) in self.RESAMPLERS:
+            return [target]
+        if (source.kind, DAY) in self.RESAMPLERS and (DAY, target.kind) in self.RESAMPLERS:
+            return [Timeframe.parse(DAY), target]
+        raise Exception(f"NOT IMPLEMENTED: transform '{timeframe}' to '{transform}'")
+
+    def transforms_via_day(self, timeframe, transform):
+        """
+        True if transform_timeframe() derives transform from daily bars, e.g. 5min to week.
+        """
+        try:
+            plan = self.resample_plan(timeframe, transform)
+        except Exception:
+            return False
+        return len(plan) > 1 and plan[0].name == DAY
+
     def validate(self, data, kwargs):
         self.validator.validate_nan(data, kwargs['ticker'])
+        if kwargs.get('exchange') and kwargs['timeframe'] not in ['week', 'month']:
+            self.validator.validate_sessions(data, kwargs['ticker'], kwargs['exchange'])
         return data
 
     def faulty_values(self, data, kwargs):
@@ -103,84 +106,134 @@ class PostProcessor:
         df.symbol = kwargs['ticker']
         return df
 
+    def compact(self, df, kwargs):
+        return compact_ohlcv(df)
+
     def fill_na(self, df, kwargs):
-        df.fillna(method='ffill', inplace=True)
+        # Not in place, the data may be shared with other frames or memory mapped
+        if df.isna().to_numpy().any():
+            return df.fillna(method='ffill')
         return df
 
     def _transform_week(self, data):
         self.logger.debug(f"Transforming to 1 week")
-        # From: http://blog.yhat.com/posts/stock-data-python.html
-        transdat = data.loc[:, ["Open", "High", "Low", "Close", 'Volume']]
-
-        transdat["week"] = pd.to_datetime(transdat.index).map(
-            lambda x: x.isocalendar()[1])  # Identify weeks
-        transdat["year"] = pd.to_datetime(transdat.index).map(lambda x: x.isocalendar()[0])
-        # Group by year and other appropriate variable
-        grouped = transdat.groupby(list(set(["year", "week"])))
-        dataframes = pd.DataFrame({"Open": [], "High": [], "Low": [], "Close": [], "Volume": []})
-        for name, group in grouped:
-            df = pd.DataFrame(
-                {"Open": group.iloc[0, 0], "High": max(group.High), "Low": min(group.Low),
-                 "Close": group.iloc[-1, 3], "Volume": group.Volume.sum()},
-                index=[group.index[0]])
-            dataframes = dataframes.append(df)
-        sorted = dataframes.sort_index()
-
-        return sorted
-
-    def _transform_hour(self, data):
-        self.logger.debug(f"Transforming to 1H")
-        conversion = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
-        # TODO: remove 16:00 bar? Official close is Open of 16:00 bar?
-        # TODO: if RTH modify first datetime index each day to '9:30' (data is correct but looks odd)
-        resampled = data.resample('60Min').agg(conversion)
-        return resampled.dropna()
-
-    def _transform_day(self, data, transform):
-        self.logger.debug(f"Transforming to 1D")
-        conversion = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
-        resampled = data.resample(f"{transform}D").agg(conversion)
-        return resampled.dropna()
-
-    def _transform_min(self, to_tf, data):
-        self.logger.debug(f"Transforming to {to_tf}")
-        conversion = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
-        resampled = data.resample(f"{to_tf}Min").agg(conversion)
-        return resampled.dropna()
+        iso = data.index.isocalendar()
+        keys = iso['year'].to_numpy(dtype=np.int64) * 100 + iso['week'].to_numpy(dtype=np.int64)
+        return self._aggregate_periods(data, keys)
+
+    def _transform_fixed(self, data, minutes, exchange=None):
+        """
+        Aggregate into bars of a fixed number of minutes, counted from midnight of the first day and labeled
+        with the start of the bar, as resample(). Bars without data are left out, as are rows with a
+        missing price. With an exchange, bars during regular sessions are counted from the session open
+        and end at the session close instead, e.g. 60min bars at 09:30, 10:30, ... 15:30 for NYSE, and bars
+        outside the sessions are counted from the previous close, so bars never overlap.
+        """
+        self.logger.debug(f"Transforming to {minutes}min")
+        if data.empty or data.index.tz is not None:
+            conversion = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+            return data.resample(f"{minutes}Min").agg(conversion).dropna()
+
+        prices = self.OHLCV_COLUMNS[:4]
+        if data[prices].isna().to_numpy().any():
+            data = data.dropna(subset=prices)
+            if data.empty:
+                return self._aggregate_periods(data, [])
+        size = minutes * 60 * 10 ** 9
+        origin = data.index.min().normalize().value
+        timestamps = data.index.asi8
+        labels = (timestamps - origin) // size * size + origin
+        if exchange is not None:
+            labels = self._session_labels(timestamps, labels, size, exchange)
+        return self._aggregate_periods(data, labels, labels=labels)
+
+    def _session_labels(self, timestamps, labels, size, exchange):
+        """
+        Bar starts counted from the session open for rows within a session of exchange, and from the close
+        for rows after it. Rows before the first session are counted back from its open. Labels are kept if
+        no row is within a session.
+        """
+        opens, closes, in_session = SessionCalendar.get(exchange).locate(timestamps)
+        if not in_session.any():
+            return labels
+        anchored = (timestamps - opens) // size * size + opens
+        after_close = (timestamps - closes) // size * size + closes
+        return np.where(timestamps >= closes, after_close, anchored)
 
     def _transform_month(self, data):
         self.logger.debug(f"Transforming to 1M")
-        transdat = data.loc[:, ["Open", "High", "Low", "Close", 'Volume']]
-
-        #transdat["week"] = pd.to_datetime(transdat.index).map(lambda x: x.month)
-        #transdat["week"] = pd.to_datetime(transdat.index).map(lambda x: pd.Int64Index(x.isocalendar().week))
-        transdat["year"] = pd.to_datetime(transdat.index).map(lambda x: x.year)
-        transdat["month"] = pd.to_datetime(transdat.index).map(lambda x: x.month)
-
-        # Group by year and other appropriate variable
-        grouped = transdat.groupby(list({"year", "month"}))
-        dataframes = pd.DataFrame({"Open": [], "High": [], "Low": [], "Close": [], "Volume": []})
-        for name, group in grouped:
-            df = pd.DataFrame(
-                {"Open": group.iloc[0, 0], "High": max(group.High), "Low": min(group.Low),
-                 "Close": group.iloc[-1, 3], "Volume": group.Volume.sum()},
-                index=[group.index[0]])
-            dataframes = dataframes.append(df)
-        sorted = dataframes.sort_index()
-
-        return sorted
+        keys = data.index.year.to_numpy(dtype=np.int64) * 100 + data.index.month.to_numpy(dtype=np.int64)
+        return self._aggregate_periods(data, keys)
+
+    def _aggregate_periods(self, data, keys, labels=None):
+        """
+        Aggregate bars into one OHLCV bar per run of equal period keys (e.g. ISO year/week). Each bar is
+        labeled with the datetime of its first row, or with labels (int64 nanoseconds) of that row if given.
+        """
+        transdat = data.loc[:, self.OHLCV_COLUMNS]
+        if not transdat.index.is_monotonic_increasing:
+            order = np.argsort(transdat.index.to_numpy(), kind='stable')
+            transdat = transdat.iloc[order]
+            keys = np.asarray(keys)[order]
+            if labels is not None:
+                labels = np.asarray(labels)[order]
+        if transdat.empty:
+            return pd.DataFrame({col: [] for col in self.OHLCV_COLUMNS})
+
+        keys = np.asarray(keys)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)] - 1
+        opens, highs, lows, closes, volumes = (transdat[col].to_numpy() for col in self.OHLCV_COLUMNS)
+
+        return pd.DataFrame({'Open': opens[starts],
+                             'High': np.fmax.reduceat(highs, starts),
+                             'Low': np.fmin.reduceat(lows, starts),
+                             'Close': closes[ends],
+                             'Volume': np.add.reduceat(np.nan_to_num(volumes), starts)},
+                            index=transdat.index[starts].rename(None) if labels is None else
+                            pd.DatetimeIndex(np.asarray(labels)[starts], name=transdat.index.name))
 
     def add_trading_days(self, data, kwargs):
-        if kwargs['transform'] == 'day':
-            data = self._add_trading_days(data, "Day")
+        """
+        Number the trading days within each year ('Day'), month ('DayOfMonth') and ISO week ('DayOfWeek')
+        from 1, and for intraday bars the bars within each regular session ('Bar', 0 for bars outside the
+        sessions). Done when get_datas() is called with trading_days=True, not for week and month bars.
+        """
+        if not kwargs.get('trading_days') or kwargs['transform'] in ['week', 'month']:
+            return data
+        data = self._add_trading_days(data, 'Day')
+        data = self._add_trading_days(data, 'DayOfMonth', period='month')
+        data = self._add_trading_days(data, 'DayOfWeek', period='week')
+        if Timeframe.parse(kwargs['transform']).kind == INTRADAY:
+            data = self._add_bar_of_session(data, 'Bar', kwargs.get('exchange'))
         return data
 
-    def _add_trading_days(self, df, column_name):
-        groups = df.groupby(df.index.year)
-        for group in groups:
-            yearly = group[1]
-            day = 1
-            for index, row in yearly.iterrows():
-                df.loc[index, column_name] = day
-                day += 1
+    def _add_trading_days(self, df, column_name, period='year'):
+        days, inverse = np.unique(df.index.normalize().asi8, return_inverse=True)
+        days = pd.DatetimeIndex(days)
+        if period == 'year':
+            keys = days.year.to_numpy()
+        elif period == 'month':
+            keys = days.year.to_numpy() * 100 + days.month.to_numpy()
+        else:
+            iso = days.isocalendar()
+            keys = iso['year'].to_numpy(dtype=np.int64) * 100 + iso['week'].to_numpy(dtype=np.int64)
+        numbers = pd.Series(keys).groupby(keys).cumcount().to_numpy() + 1
+        df[column_name] = numbers[inverse]
+        return df
+
+    def _add_bar_of_session(self, df, column_name, exchange=None):
+        """
+        Number bars from the session open, sessions of exchange or 09:30 to 16:00 without one.
+        """
+        if exchange:
+            sessions, _, in_session = SessionCalendar.get(exchange).locate(df.index.asi8)
+        else:
+            sessions = df.index.normalize().asi8
+            minutes = df.index.hour.to_numpy() * 60 + df.index.minute.to_numpy()
+            in_session = (minutes >= 9 * 60 + 30) & (minutes < 16 * 60)
+        numbers = np.zeros(len(df), dtype=np.int64)
+        keys = sessions[in_session]
+        numbers[in_session] = pd.Series(keys).groupby(keys).cumcount().to_numpy() + 1
+        df[column_name] = numbers
         return df
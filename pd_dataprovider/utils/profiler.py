@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, astuple, fields
+
+import pandas as pd
+
+
+@dataclass
+class StageRecord:
+    symbol: str
+    stage: str
+    seconds: float
+    rows_in: int
+    rows_out: int
+    memory_delta: int
+
+
+class StageProfiler:
+    """
+    Records wall time, rows in and out and memory delta (bytes of the frame out minus the frame in) of each
+    reading and post-processing stage per symbol, see the profile option of GenericDataProvider. Records made
+    in worker processes are sent back with the frames and added to the profiler of the calling process.
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: Called with each StageRecord as it is recorded
+        """
+        self.callback = callback
+        self.records = []
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Copies in worker processes start empty and report back through take_remote()
+        state = self.__dict__.copy()
+        state.update(callback=None, records=[])
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(value) -> (int, int):
+        if isinstance(value, pd.DataFrame):
+            return len(value), int(value.memory_usage(index=True).sum())
+        if isinstance(value, (bytes, bytearray)):
+            return 0, len(value)
+        if isinstance(value, tuple):  # (filename, contents) from _read_file_async()
+            return 0, sum(len(item) for item in value if isinstance(item, (bytes, bytearray)))
+        return 0, 0
+
+    def measure(self, symbol: str, stage: str, func, data=None, *args):
+        """
+        Call func(data, *args), or func() if data is None, and record it as stage.
+        """
+        start = time.perf_counter()
+        result = func() if data is None else func(data, *args)
+        self.record(symbol, stage, time.perf_counter() - start, data, result)
+        return result
+
+    def record(self, symbol: str, stage: str, seconds: float, data_in=None, data_out=None):
+        """
+        Record a stage taking data_in to data_out, dataframes or bytes read.
+        """
+        rows_in, bytes_in = self._size(data_in)
+        rows_out, bytes_out = self._size(data_out)
+        self.add([StageRecord(symbol, stage, seconds, rows_in, rows_out, bytes_out - bytes_in)])
+
+    def add(self, records: [StageRecord]):
+        with self._lock:
+            self.records.extend(records)
+        if self.callback is not None:
+            for record in records:
+                self.callback(record)
+
+    def take_remote(self) -> [StageRecord]:
+        """
+        The records of a copy in a worker process, to be added to the profiler of the calling process.
+        Empty in the calling process, where records are added directly.
+        """
+        if self.pid == os.getpid():
+            return []
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+    def frame(self) -> pd.DataFrame:
+        """
+        All records, one row each.
+        """
+        return pd.DataFrame([astuple(record) for record in self.records],
+                            columns=[field.name for field in fields(StageRecord)])
+
+    def report(self, by='stage') -> pd.DataFrame:
+        """
+        Records summed by stage (or 'symbol', or a list of both) with the number of calls and the share of
+        the total time, slowest first.
+        """
+        df = self.frame()
+        report = df.groupby(by, sort=False).agg(calls=('seconds', 'size'), seconds=('seconds', 'sum'),
+                                                rows_in=('rows_in', 'sum'), rows_out=('rows_out', 'sum'),
+                                                memory_delta=('memory_delta', 'sum'))
+        report['share'] = report['seconds'] / report['seconds'].sum() if len(report) else 0.0
+        return report.sort_values('seconds', ascending=False)
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import threading
+
+
+class SnapshotStore:
+    """
+    Latest bars per symbol for the JSON providers, from '{path}/snapshots/{symbol}.json' files and/or one
+    combined '{path}/snapshots.json' file, both in the format of the bar files ({symbol: [bar, ...]}). Each
+    load lists the directory with one os.scandir() and parses only files changed since the previous load,
+    so refreshing the snapshots of a whole universe costs one stat per file.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, loads=json.loads):
+        """
+        :param loads: Function decoding the contents (bytes) of a file
+        """
+        self.loads = loads
+        self._files = {}  # filename -> ((mtime_ns, size), {symbol: bars})
+        self._bars = {}  # path -> {symbol: bars}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def bars(self, path: str) -> dict:
+        """
+        Snapshot bars per symbol for path as of the last load(), loading path the first time.
+        """
+        with self._lock:
+            if path not in self._bars:
+                self._load(path)
+            return self._bars[path]
+
+    def load(self, path: str) -> [str]:
+        """
+        Read changed snapshot files in path, returns the symbols whose snapshot bars changed.
+        """
+        with self._lock:
+            return self._load(path)
+
+    def _load(self, path: str) -> [str]:
+        filenames = []
+        combined = f"{path}/snapshots.json"
+        if os.path.isfile(combined):
+            filenames.append((combined, os.stat(combined)))
+        try:
+            with os.scandir(f"{path}/snapshots") as entries:
+                filenames += sorted((entry.path, entry.stat()) for entry in entries
+                                    if entry.name.endswith('.json') and entry.is_file())
+        except OSError:
+            pass
+
+        bars = {}
+        for filename, stat in filenames:
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = self._files.get(filename)
+            if cached is None or cached[0] != signature:
+                try:
+                    with open(filename, 'rb') as f:
+                        cached = (signature, self.loads(f.read()))
+                except (OSError, ValueError) as e:
+                    self.logger.warning(f"Could not read snapshot file '{filename}': {e}")
+                    continue
+                self._files[filename] = cached
+            bars.update(cached[1])  # Files per symbol override the combined file
+
+        listed = {filename for filename, _ in filenames}
+        for filename in [filename for filename in self._files if filename not in listed and
+                         (filename == combined or filename.startswith(f"{path}/snapshots/"))]:
+            del self._files[filename]
+
+        previous = self._bars.get(path, {})
+        updated = sorted(symbol for symbol, symbol_bars in bars.items() if previous.get(symbol) != symbol_bars)
+        self._bars[path] = bars
+        if updated:
+            self.logger.debug(f"Snapshots updated in '{path}': {len(updated)} symbols")
+        return updated
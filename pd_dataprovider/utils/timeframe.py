@@ -0,0 +1,61 @@
+import re
+from dataclasses import dataclass
+
+MINUTES_PER_DAY = 24 * 60
+
+INTRADAY = 'intraday'
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+
+
+@dataclass(frozen=True)
+class Timeframe:
+    """
+    A bar duration parsed from a timeframe string:
+
+        '5min', '60min', '2h'  -> intraday, length in minutes
+        'day', '1D', '5D'      -> day, length in days
+        'week', 'month'        -> week or month, length 1
+    """
+    name: str
+    kind: str
+    length: int
+
+    PATTERN = re.compile(r'^(\d+)\s*(min|h|D)$')
+
+    @staticmethod
+    def parse(name: str) -> 'Timeframe':
+        if name in [DAY, WEEK, MONTH]:
+            return Timeframe(name, name, 1)
+        match = Timeframe.PATTERN.match(name.strip()) if isinstance(name, str) else None
+        if match is None or int(match.group(1)) == 0:
+            raise Exception(f"Invalid timeframe '{name}'")
+        length, unit = int(match.group(1)), match.group(2)
+        if unit == 'D':
+            return Timeframe(name, DAY, length)
+        return Timeframe(name, INTRADAY, length * 60 if unit == 'h' else length)
+
+    @property
+    def minutes(self) -> int:
+        """
+        Fixed bar duration in minutes, None for week and month.
+        """
+        if self.kind == INTRADAY:
+            return self.length
+        if self.kind == DAY:
+            return self.length * MINUTES_PER_DAY
+        return None
+
+    def divides(self, other: 'Timeframe') -> bool:
+        """
+        True if bars of other are made up of whole bars of this timeframe.
+        """
+        if self.kind == INTRADAY and MINUTES_PER_DAY % self.length != 0:
+            # Bars would straddle days
+            return other.kind == INTRADAY and other.length % self.length == 0
+        if other.kind in [WEEK, MONTH]:
+            return self.kind == INTRADAY or (self.kind == DAY and self.length == 1) or self.kind == other.kind
+        if self.kind in [WEEK, MONTH]:
+            return False
+        return other.minutes % self.minutes == 0
@@ -2,14 +2,16 @@
 import logging as logger
 
 import pandas as pd
-import pandas_market_calendars as mcal
+
+from pd_dataprovider.utils.calendar import SessionCalendar
 
 
 class Validator:
     logger.basicConfig(level=logger.INFO, format='%(filename)s: %(message)s')
 
-    def __init__(self):
-        self.nyse = mcal.get_calendar('NYSE')
+    @property
+    def nyse(self) -> SessionCalendar:
+        return SessionCalendar.get('NYSE')
 
     def validate_nan(self, df, ticker):
         nan_rows = pd.isnull(df).any(1).to_numpy().nonzero()[0]
@@ -17,9 +19,15 @@ class Validator:
         if len(nan_rows) > 0:
             logger.warning("WARNING: {:s} has {:d} rows with NaN".format(ticker, len(nan_rows)))
 
+    def validate_sessions(self, df, ticker, exchange):
+        missing = SessionCalendar.get(exchange).missing_sessions(df.index)
+        if len(missing) > 0:
+            logger.warning("WARNING: {:s} has no rows for {:d} {:s} sessions, first missing {}"
+                           .format(ticker, len(missing), exchange, pd.Timestamp(missing[0]).date()))
+
     @DeprecationWarning
     def validate_dates(self, data, ticker, from_date, to_date):
-        nyse_days = len(self.nyse.valid_days(start_date=from_date, end_date=to_date))
+        nyse_days = self.nyse.trading_days(from_date, to_date)
         if len(data) == 0:
             raise Exception("No data available from {} to {}. Verify {} data by "
                             "provider includes these dates.".format(ticker, from_date, to_date, data))
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pd_dataprovider.convert_store import convert
+from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.providers.binary_dataprovider import BinaryStoreDataProvider
+from pd_dataprovider.providers.csv_dataprovider import CsvFileDataProvider
+from pd_dataprovider.providers.json_dataprovider import JSONDataProvider
+from pd_dataprovider.utils.bar_store import COLUMNS, read_bars, write_bars
+
+
+class TestBinary(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv = CsvFileDataProvider(["data"])
+        for timeframe, symbol in [('day', 'SPY'), ('5min', 'AAPL_2018-01-06')]:
+            os.makedirs(f"{self.tmp.name}/{timeframe}", exist_ok=True)
+            df = self.csv._read_csv(f"data/{timeframe}/{symbol}.csv")
+            write_bars(f"{self.tmp.name}/{timeframe}/{symbol}.bars", df)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _mapped(array: np.ndarray) -> bool:
+        while array is not None and not isinstance(array, np.memmap):
+            array = array.base
+        return array is not None
+
+    def test_read_bars(self):
+        filename = f"{self.tmp.name}/day/SPY.bars"
+        expected = self.csv._read_csv("data/day/SPY.csv")[COLUMNS].sort_index()
+        df = read_bars(filename)
+        assert df.equals(expected)
+        assert self._mapped(df.index.values) and self._mapped(df.values) and df._mgr.nblocks == 1
+
+        sliced = read_bars(filename, '2016-01-04', '2016-01-31')
+        assert sliced.equals(expected.loc['2016-01-04':'2016-01-31'])
+        assert len(read_bars(filename, '1990-01-01', '1990-12-31')) == 0
+
+        with open(f"{self.tmp.name}/day/BAD.bars", 'wb') as f:
+            f.write(b'Date,Open' * 10)
+        with self.assertRaises(Exception):
+            read_bars(f"{self.tmp.name}/day/BAD.bars")
+
+    def test_provider(self):
+        provider = BinaryStoreDataProvider([self.tmp.name])
+        assert provider.list_symbols('day') == ['SPY']
+        symbol_datas = [SymbolData('SPY', 'day', 'day', '2010-01-01', '2017-01-01'),
+                        SymbolData('SPY', 'day', 'week', '2010-01-01', '2017-01-01'),
+                        SymbolData('AAPL_2018-01-06', '5min', '15min', '2017-12-10', '2017-12-31', rth_only=True)]
+        binary = provider.get_dataframes(symbol_datas)
+        csv = self.csv.get_dataframes(symbol_datas)
+        for b, c in zip(binary, csv):
+            pd.testing.assert_frame_equal(b[COLUMNS], c[COLUMNS], check_freq=False)
+
+        # Frames from get_datas() are views of the mapped file
+        for symbol_data in [symbol_datas[0], SymbolData('SPY', 'day', 'day', '', '')]:
+            df = provider.get_datas([symbol_data])[0].df
+            assert self._mapped(df.values) and self._mapped(df['Close'].values)
+        df = provider.get_datas(symbol_datas[:1], trading_days=True)[0].df
+        assert 'Day' in df and self._mapped(df['Close'].values)
+        assert not self._mapped(provider.get_datas(symbol_datas[1:2])[0].df['Close'].values)
+
+        lazy = provider.get_lazy_datas(symbol_datas[:1])[0]
+        assert (lazy.start, lazy.end, lazy.rows) == (pd.Timestamp('2004-02-06'), pd.Timestamp('2017-08-25'), 3356)
+        assert not lazy.loaded and lazy.df.equals(binary[0])
+
+        with self.assertRaises(Exception):
+            provider.get_datas([SymbolData('MISSING', 'day', 'day', '2010-01-01', '2017-01-01')])
+        datas = provider.get_datas([SymbolData('MISSING', 'day', 'day', '2010-01-01', '2017-01-01'),
+                                    symbol_datas[0]], graceful=True)
+        assert [data.symbol for data in datas] == ['SPY']
+
+    def test_convert(self):
+        with tempfile.TemporaryDirectory() as out:
+            counts = convert(self.csv, out, ['day'], workers=2, echo=lambda line: None)
+            assert counts == {'converted': 3, 'skipped': 0, 'failed': 0}
+            assert convert(self.csv, out, ['day'], workers=2, echo=lambda line: None)['skipped'] == 3
+            # JSON prices are parsed as float64, which float32 keeps within the tolerance but not exactly
+            json = JSONDataProvider(['data/alpaca'], ['startEpochTime', 'openPrice', 'highPrice', 'lowPrice',
+                                                      'closePrice', 'volume'], epoch=True)
+            counts = convert(json, f"{out}/exact", ['day'], workers=2, echo=lambda line: None, tolerance=0)
+            assert counts == {'converted': 0, 'skipped': 0, 'failed': 2}
+            assert not os.path.exists(f"{out}/exact/day/XONE.bars")
+            assert convert(json, f"{out}/json", ['day'], workers=2, echo=lambda line: None)['converted'] == 2
+
+            symbol_datas = [SymbolData(symbol, 'day', 'day', '2016-01-01', '2016-12-31') for symbol in ['SPY', 'NYSF_XLP']]
+            binary = BinaryStoreDataProvider([out]).get_dataframes(symbol_datas)
+            csv = self.csv.get_dataframes(symbol_datas)
+            assert len(binary) == len(csv) == 2
+            for b, c in zip(binary, csv):
+                pd.testing.assert_frame_equal(b[COLUMNS], c[COLUMNS], check_freq=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
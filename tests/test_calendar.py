@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from pd_dataprovider.objects import SymbolData
+from pd_dataprovider.providers.csv_dataprovider import CsvFileDataProvider
+from pd_dataprovider.utils.calendar import SessionCalendar
+
+
+class TestCalendar(unittest.TestCase):
+
+    def test_rth_mask(self):
+        calendar = SessionCalendar.get('NYSE')
+        index = pd.DatetimeIndex(['2017-11-22 09:25', '2017-11-22 09:30', '2017-11-22 15:55', '2017-11-22 16:00',
+                                  '2017-11-23 10:00',  # Thanksgiving
+                                  '2017-11-24 12:55', '2017-11-24 13:00'])  # Half day
+        assert list(calendar.rth_mask(index)) == [False, True, True, False, False, True, False]
+        assert len(calendar.rth_mask(pd.DatetimeIndex([]))) == 0
+
+    def test_trading_days_and_expected_bars(self):
+        calendar = SessionCalendar.get('NYSE')
+        assert calendar.trading_days('2017-11-20', '2017-11-30') == 8
+        assert calendar.trading_days('2017-11-23', '2017-11-23') == 0
+        assert calendar.expected_bars('2017-11-22', '2017-11-22', 5) == 78
+        assert calendar.expected_bars('2017-11-24', '2017-11-24', 60) == 4  # 09:30 to 13:00
+        assert calendar.expected_bars('2017-11-20', '2017-11-24', 30) == 3 * 13 + 7
+
+        index = pd.date_range('2017-11-20 10:00', '2017-11-30 10:00', freq='1D')
+        missing = calendar.missing_sessions(index.delete([2, 8]))  # 22nd and 28th
+        assert list(pd.DatetimeIndex(missing).date.astype(str)) == ['2017-11-22', '2017-11-28']
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with mock.patch.object(SessionCalendar, 'cache_dir', cache_dir):
+                expected = SessionCalendar('NYSE').sessions('2016-12-20', '2017-01-10')
+                assert len(os.listdir(cache_dir)) == 2
+
+                calendar = SessionCalendar('NYSE')
+                with mock.patch.object(calendar.calendar, 'schedule') as schedule:
+                    opens, closes = calendar.sessions('2016-12-20', '2017-01-10')
+                    schedule.assert_not_called()
+                assert np.array_equal(opens, expected[0]) and np.array_equal(closes, expected[1])
+
+    def test_filter_rth_with_exchange(self):
+        symbol_data = SymbolData('AAPL_2018-01-06', '5min', '5min', '2017-12-10', '2017-12-31', rth_only=True)
+        default = CsvFileDataProvider(["data"]).get_dataframes([symbol_data])[0]
+        df = CsvFileDataProvider(["data"], exchange='NYSE').get_dataframes([symbol_data])[0]
+        assert len(df.at_time('16:00')) == 0
+        assert df.equals(default[default.index.time != pd.Timestamp('16:00').time()])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,20 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
 import unittest
+import unittest.mock
 
+import numpy as np
+import pandas as pd
 import pandas_market_calendars as mcal
 
 from pd_dataprovider.objects import SymbolData
 from pd_dataprovider.providers.csv_dataprovider import CsvFileDataProvider
+from pd_dataprovider.utils.day_index import DayIndex
+from pd_dataprovider.utils.dtypes import compact_ohlcv, memory_report
+from pd_dataprovider.utils.file_index import FileIndex
 
 class TestCsv(unittest.TestCase):
 
@@ -39,6 +50,298 @@ class TestCsv(unittest.TestCase):
         assert spy_daily.loc['20160104':'20160108', 'Volume'].sum() == \
                spy_weekly.loc['20160104']['Volume']
 
+    def test_parallel_get_datas(self):
+        symbol_datas = [SymbolData('SPY', 'day', 'week', '2010-01-01', '2017-01-01'),
+                        SymbolData('DIS', 'day', 'day', '2000-01-01', '2017-01-01'),
+                        SymbolData('NYSF_XLP', 'day', 'month', '2008-01-01', '2015-12-31')]
+        serial = CsvFileDataProvider(["data"]).get_datas(symbol_datas)
+        for executor in ['thread', 'process']:
+            provider = CsvFileDataProvider(["data"], executor=executor, max_workers=2)
+            datas = provider.get_datas(symbol_datas)
+            assert [d.symbol for d in datas] == ['SPY', 'DIS', 'NYSF_XLP']
+            assert provider.errors == 0
+            for data, expected in zip(datas, serial):
+                assert data.df.symbol == expected.symbol
+                assert data.df.equals(expected.df)
+
+        provider = CsvFileDataProvider(["data"], executor='thread', ordered=False)
+        datas = provider.get_datas(symbol_datas)
+        assert sorted(d.symbol for d in datas) == ['DIS', 'NYSF_XLP', 'SPY']
+
+    def test_file_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(f"{tmp}/data/day")
+            shutil.copy('data/day/SPY.csv', f"{tmp}/data/day/SPY.csv")
+            symbol_datas = [SymbolData('SPY', 'day', 'day', '2010-01-01', '2017-01-01')]
+            expected = CsvFileDataProvider([f"{tmp}/data"]).get_dataframes(symbol_datas)[0]
+
+            for cache_format in ['parquet', 'pickle']:
+                provider = CsvFileDataProvider([f"{tmp}/data"], cache_dir=f"{tmp}/cache/{cache_format}",
+                                               cache_format=cache_format)
+                first = provider.get_dataframes(symbol_datas)[0]
+                second = provider.get_dataframes(symbol_datas)[0]
+                assert provider.file_cache.stats() == {'hits': 1, 'misses': 1}
+                assert first.equals(expected) and second.equals(expected)
+                assert second.index.name == expected.index.name
+
+            # Modified source file invalidates the cached frame
+            with open(f"{tmp}/data/day/SPY.csv", 'a') as f:
+                f.write("2017-08-28,245.0,246.0,244.0,245.5,100000,165.0,SPY\n")
+            provider.get_dataframes([SymbolData('SPY', 'day', 'day', '2017-08-01', '2017-08-31')])
+            assert provider.file_cache.stats() == {'hits': 1, 'misses': 2}
+
+    def test_frame_cache(self):
+        provider = CsvFileDataProvider(["data"], frame_cache_bytes=10 * 1024 * 1024)
+        symbol_datas = [SymbolData('SPY', 'day', 'day', '2010-01-01', '2017-01-01'),
+                        SymbolData('SPY', 'day', 'week', '2010-01-01', '2017-01-01')]
+        first = provider.get_datas(symbol_datas)
+        first[0].df['Close'] = 0.0  # Must not modify the cached frame
+        second = provider.get_datas(symbol_datas)
+        stats = provider.frame_cache.stats()
+        assert stats['hits'] == 2 and stats['misses'] == 2 and stats['evictions'] == 0
+        assert second[0].df.symbol == 'SPY'
+        assert second[0].df.loc['20160104']['Close'] != 0.0
+        assert second[1].df.equals(first[1].df)
+
+        # Only room for one of the frames
+        provider = CsvFileDataProvider(["data"], frame_cache_bytes=provider.frame_cache.nbytes - 1)
+        provider.get_datas(symbol_datas)
+        assert provider.frame_cache.stats()['evictions'] == 1
+        assert provider.frame_cache.stats()['entries'] == 1
+
+    def test_compact(self):
+        symbol_datas = [SymbolData('SPY', 'day', 'day', '2010-01-01', '2017-01-01'),
+                        SymbolData('SPY', 'day', 'week', '2010-01-01', '2017-01-01'),
+                        SymbolData('AAPL_2018-01-06', '5min', '60min', '2017-12-10', '2017-12-31')]
+        default = CsvFileDataProvider(["data"]).get_datas(symbol_datas)
+        compact = CsvFileDataProvider(["data"], compact=True).get_datas(symbol_datas)
+        for data, expected in zip(compact, default):
+            assert list(data.df.columns) == ['Open', 'High', 'Low', 'Close', 'Volume']
+            assert list(data.df.dtypes) == [np.float32] * 4 + [np.int64]
+            assert data.df.symbol == expected.symbol
+            assert (data.df['Close'] == expected.df['Close']).all()
+            assert (data.df['Volume'] == expected.df['Volume']).all()
+
+        report = memory_report(compact)
+        assert list(report.index) == [('SPY', 'day'), ('SPY', 'week'), ('AAPL_2018-01-06', '60min')]
+        assert report.loc[('SPY', 'day'), 'Total'] < memory_report(default).loc[('SPY', 'day'), 'Total']
+
+        # Object columns, e.g. from JSON with nulls
+        df = pd.DataFrame({'Close': pd.Series([1.5, None], dtype=object),
+                           'Volume': pd.Series([None, 100], dtype=object)})
+        df.symbol = 'SPY'
+        df = compact_ohlcv(df)
+        assert list(df.dtypes) == [np.float32, np.float32] and df.symbol == 'SPY'
+        assert df['Volume'].isna().tolist() == [True, False] and df['Close'][0] == 1.5
+        df = compact_ohlcv(pd.DataFrame({'Volume': pd.Series([100, 200], dtype=object)}))
+        assert df['Volume'].dtype == np.int64
+
+    def test_range_reads(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(f"{tmp}/data/5min")
+            os.makedirs(f"{tmp}/data/day")
+            shutil.copy('data/5min/AAPL_2018-01-06.csv', f"{tmp}/data/5min/AAPL.csv")
+            shutil.copy('data/day/DIS.csv', f"{tmp}/data/day/DIS.csv")  # Not sorted
+            symbol_datas = [SymbolData('AAPL', '5min', '60min', '2017-12-12 10:00', '2017-12-14 15:00'),
+                            SymbolData('AAPL', '5min', '5min', '2017-12-20', '2017-12-21'),
+                            SymbolData('AAPL', '5min', '5min', '2018-06-01', '2018-06-30'),
+                            SymbolData('DIS', 'day', 'week', '2016-01-01', '2016-06-30')]
+            expected = CsvFileDataProvider([f"{tmp}/data"]).get_datas(symbol_datas)
+            assert len(expected) == 3
+
+            for options in [{'stream_rows': 100}, {'day_index': True}, {'stream_rows': 100, 'day_index': True}]:
+                provider = CsvFileDataProvider([f"{tmp}/data"], **options)
+                datas = provider.get_datas(symbol_datas)
+                assert provider.errors == -1
+                for data, expected_data in zip(datas, expected):
+                    assert data.df.equals(expected_data.df)
+                    assert data.df.symbol == expected_data.symbol
+
+            assert os.path.exists(f"{tmp}/data/5min/AAPL.csv.idx")
+            index = DayIndex.load(f"{tmp}/data/5min/AAPL.csv", 'Date')
+            rows = pd.read_csv(index.read_range('2017-12-20', '2017-12-21'), index_col=0, parse_dates=True)
+            assert rows.index[0] == pd.Timestamp('2017-12-20 04:45') and rows.index[-1].day == 21
+            assert DayIndex.load(f"{tmp}/data/day/DIS.csv", 'Date') is None
+
+    def test_get_datas_async(self):
+        symbol_datas = [SymbolData('SPY', 'day', 'day', '2010-01-01', '2017-01-01'),
+                        SymbolData('SPY', 'day', 'week', '2010-01-01', '2017-01-01'),
+                        SymbolData('DIS', 'day', 'month', '2010-01-01', '2017-01-01'),
+                        SymbolData('AAPL_2018-01-06', '5min', '60min', '2017-12-10', '2017-12-31')]
+        provider = CsvFileDataProvider(["data"], async_limit=2)
+        expected = provider.get_datas(symbol_datas)
+
+        async def load():
+            # The event loop keeps running while files are parsed
+            ticks = 0
+            task = asyncio.ensure_future(provider.get_datas_async(symbol_datas))
+            while not task.done():
+                ticks += 1
+                await asyncio.sleep(0.001)
+            return task.result(), ticks
+
+        # Files read but not yet processed count towards async_limit
+        in_flight, max_in_flight = 0, 0
+        read_file, read_source = provider._read_file_async, provider._read_source
+
+        async def read_file_counted(*args):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            return await read_file(*args)
+
+        def read_source_counted(*args, **kwargs):
+            nonlocal in_flight
+            time.sleep(0.02)
+            in_flight -= 1
+            return read_source(*args, **kwargs)
+
+        with unittest.mock.patch.object(provider, '_read_file_async', read_file_counted), \
+                unittest.mock.patch.object(provider, '_read_source', read_source_counted):
+            datas, ticks = asyncio.run(load())
+        assert ticks > 1
+        assert max_in_flight == 2
+        assert [(d.symbol, d.timeframe) for d in datas] == [(d.symbol, d.timeframe) for d in expected]
+        for data, expected_data in zip(datas, expected):
+            assert data.df.equals(expected_data.df)
+            assert data.df.symbol == expected_data.symbol
+
+        provider = CsvFileDataProvider(["data"], executor='process')
+        datas = asyncio.run(provider.get_datas_async(symbol_datas))
+        assert datas[2].df.equals(expected[2].df) and datas[2].df.symbol == 'DIS'
+
+        with self.assertRaisesRegex(Exception, 'MISSING not found'):
+            asyncio.run(provider.get_datas_async([SymbolData('MISSING', 'day', 'day', '2016-01-01', '2016-12-31')]))
+
+    def test_file_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for path in ['a', 'b']:
+                os.makedirs(f"{tmp}/{path}/day")
+            shutil.copy('data/day/SPY.csv', f"{tmp}/a/day/NYSF_SPY.csv")
+            shutil.copy('data/day/DIS.csv', f"{tmp}/a/day/DIS.csv")
+            shutil.copy('data/day/NYSF_XLP.csv', f"{tmp}/b/day/NYS_XLP.csv")
+            shutil.copy('data/day/SPY.csv', f"{tmp}/b/day/SPY.csv")
+            index_file = f"{tmp}/index.json"
+            provider = CsvFileDataProvider([f"{tmp}/a", f"{tmp}/b"], prefix=['NYS', 'NYSF'],
+                                           file_index_path=index_file)
+
+            assert provider.list_symbols('day') == ['DIS', 'SPY', 'XLP']
+            assert provider._filenames(SymbolData('SPY', 'day', 'day', None, None)) == \
+                   [f"{tmp}/a/day/NYSF_SPY.csv", f"{tmp}/b/day/SPY.csv"]
+            assert provider._filenames(SymbolData('NYS_XLP', 'day', 'day', None, None)) == [f"{tmp}/b/day/NYS_XLP.csv"]
+            symbol_datas = [SymbolData(symbol, 'day', 'day', '2016-01-01', '2016-12-31') for symbol in ['XLP', 'DIS', 'SPY']]
+            datas = provider.get_datas(symbol_datas)
+            assert [data.symbol for data in datas] == ['XLP', 'DIS', 'SPY']
+            assert provider.file_index.scans == 2
+
+            # Same files as without the index
+            expected = CsvFileDataProvider([f"{tmp}/a", f"{tmp}/b"], prefix=['NYS', 'NYSF'],
+                                           file_index=False).get_datas(symbol_datas)
+            assert all(data.df.equals(expected_data.df) for data, expected_data in zip(datas, expected))
+
+            # Listings are reused from the index file until a directory changes
+            provider = CsvFileDataProvider([f"{tmp}/a", f"{tmp}/b"], prefix=['NYS', 'NYSF'],
+                                           file_index_path=index_file)
+            shutil.copy('data/day/SPY.csv', f"{tmp}/b/day/QQQ.csv")
+            assert provider.list_symbols('day') == ['DIS', 'QQQ', 'SPY', 'XLP']
+            assert provider.file_index.scans == 1
+
+            # As on a case insensitive file system, which this one is not
+            assert provider.file_index.resolve(f"{tmp}/a", 'day', 'spy') is None
+            index = FileIndex('csv', ['NYS', 'NYSF'], case_sensitive=False)
+            assert index.resolve(f"{tmp}/a", 'day', 'spy') == f"{tmp}/a/day/NYSF_SPY.csv"
+            assert index.list_symbols([f"{tmp}/a"], 'day') == ['DIS', 'SPY']
+
+    def test_file_index_missing_directory(self):
+        symbol_data = SymbolData('SPY', 'day', 'day', '2016-01-01', '2016-02-01')
+        datas = CsvFileDataProvider(['data', '/nonexistent']).get_datas([symbol_data])
+        assert len(datas[0].df) == 20
+
+        provider = CsvFileDataProvider(['/nonexistent'])
+        with self.assertRaisesRegex(Exception, 'SPY not found'):
+            provider.get_datas([symbol_data])
+        with self.assertRaisesRegex(Exception, 'SPY not found'):
+            CsvFileDataProvider(['data']).get_datas([SymbolData('SPY', 'week', 'week', '2016-01-01', '2016-02-01')])
+        assert provider.list_symbols('day') == []
+
+    def test_get_panel(self):
+        symbol_datas = [SymbolData(symbol, 'day', 'day', '2016-01-01', '2016-12-31') for symbol in ['SPY', 'DIS', 'NYSF_XLP']]
+        datas = CsvFileDataProvider(["data"]).get_datas(symbol_datas)
+        for options in [{}, {'executor': 'thread'}]:
+            panel = CsvFileDataProvider(["data"], **options).get_panel(symbol_datas)
+            assert len(panel) == 252 and panel.index[0] == pd.Timestamp('2016-01-04')
+            assert list(panel.columns.get_level_values(1)[:3]) == ['SPY', 'DIS', 'NYSF_XLP']
+            for data in datas:
+                close = panel['Close'][data.symbol].dropna()
+                assert np.allclose(close.to_numpy(), data.df['Close'].reindex(close.index).to_numpy())
+                assert len(close) == len(data.df) - (data.symbol == 'NYSF_XLP')  # Row on Good Friday is dropped
+
+        index = pd.date_range('2016-06-01', '2016-06-30', freq='B')
+        long = CsvFileDataProvider(["data"]).get_panel(symbol_datas, fields=['Close', 'Volume'], index=index,
+                                                       layout='long', dtype=np.float32)
+        assert list(long.columns) == ['Close', 'Volume'] and len(long) == len(index) * 3
+        assert long.loc[(pd.Timestamp('2016-06-01'), 'DIS'), 'Close'] == datas[1].df.loc['2016-06-01', 'Close']
+        assert long.loc[pd.Timestamp('2016-06-01')].index.tolist() == ['SPY', 'DIS', 'NYSF_XLP']
+
+        with self.assertRaises(Exception):
+            CsvFileDataProvider(["data"]).get_panel([SymbolData('SPY', 'day', 'week', '2016-01-01', '2016-12-31')])
+
+    def test_get_lazy_datas(self):
+        provider = CsvFileDataProvider(["data"], epoch=False)
+        symbol_datas = [SymbolData('SPY', 'day', 'week', '2016-01-01', '2016-12-31'),
+                        SymbolData('MISSING', 'day', 'day', '2016-01-01', '2016-12-31'),
+                        SymbolData('AAPL_2018-01-06', '5min', '5min', '2017-12-10', '2017-12-31')]
+        expected = provider.get_datas([symbol_datas[0], symbol_datas[2]])
+        with unittest.mock.patch.object(provider, '_read_data', wraps=provider._read_data) as read_data:
+            datas = provider.get_lazy_datas(symbol_datas)
+            assert [d.symbol for d in datas] == ['SPY', 'AAPL_2018-01-06'] and provider.errors == -1
+            for data in datas:
+                raw = provider._read_csv(provider._filenames(data.symbol_data)[0])
+                assert (data.start, data.end, data.rows) == (raw.index[0], raw.index[-1], None)
+            read_data.assert_not_called()
+
+            assert datas[0].df.equals(expected[0].df) and datas[0].loaded
+            assert datas[0].df is datas[0].df and read_data.call_count == 1
+            datas[0].release()
+            assert not datas[0].loaded and datas[1].df.equals(expected[1].df)
+
+        data = provider.get_lazy_datas(symbol_datas[:1], cache=False)[0]
+        assert data.df is not data.df and not data.loaded
+
+        # Rows are known from a day index
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(f"{tmp}/5min")
+            shutil.copy('data/5min/AAPL_2018-01-06.csv', f"{tmp}/5min/AAPL_2018-01-06.csv")
+            provider = CsvFileDataProvider([tmp], day_index=True)
+            lazy = provider.get_lazy_datas(symbol_datas[2:])[0]
+            assert lazy.rows is None and not lazy.loaded
+            provider.get_datas(symbol_datas[2:])
+            lazy = provider.get_lazy_datas(symbol_datas[2:])[0]
+            assert lazy.rows == len(provider._read_csv(f"{tmp}/5min/AAPL_2018-01-06.csv")) and not lazy.loaded
+
+    def test_profile(self):
+        symbol_datas = [SymbolData('SPY', 'day', 'day', '2010-01-01', '2017-01-01'),
+                        SymbolData('SPY', 'day', 'week', '2010-01-01', '2017-01-01'),
+                        SymbolData('AAPL_2018-01-06', '5min', '15min', '2017-12-10', '2017-12-31', rth_only=True)]
+        for options in [{}, {'executor': 'process'}]:
+            records = []
+            provider = CsvFileDataProvider(["data"], profile_callback=records.append, **options)
+            provider.get_datas(symbol_datas)
+            assert len(records) == len(provider.profiler.records) == 2 * (1 + 3) + 3 * 4
+
+            report = provider.profiler.report()
+            assert report.loc['read', 'calls'] == 2 and report.loc['transform_timeframe', 'calls'] == 3
+            assert report.loc['read', 'rows_out'] == 3356 + 3667
+            filter_rth = provider.profiler.frame().query("stage == 'filter_rth' and symbol == 'AAPL_2018-01-06'")
+            assert (filter_rth['rows_out'] < filter_rth['rows_in']).all()
+            assert abs(report['share'].sum() - 1) < 1e-9
+            assert list(provider.profiler.report('symbol').index.sort_values()) == ['AAPL_2018-01-06', 'SPY']
+
+        provider = CsvFileDataProvider(["data"], profile=True)
+        asyncio.run(provider.get_datas_async(symbol_datas[:1]))
+        assert list(provider.profiler.frame()['stage'][:2]) == ['read_file', 'read']
+        assert CsvFileDataProvider(["data"]).profiler is None
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
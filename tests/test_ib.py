@@ -1,6 +1,106 @@
+import asyncio
+import time
 import unittest
+from datetime import datetime, timedelta, timezone
 
+from ib_insync import IB, BarData, BarDataList, Event, Stock
+
+from pd_dataprovider.objects import SymbolData
 from pd_dataprovider.providers.async_ib_dataprovider import AsyncIBDataProvider
+from pd_dataprovider.utils.ib_pool import IBClientPool
+from pd_dataprovider.utils.live_bars import BarBuffer
+from pd_dataprovider.utils.pacing import PacingScheduler
+
+
+class FakeIB:
+    """
+    Stand-in for ib_insync.IB returning 5min bars after a delay. The first violations requests fail with a
+    pacing violation, reported through errorEvent like IB does. Bars requested with keepUpToDate are kept in
+    streams and updated by the test with update(). The first drops requests fail with a lost connection and
+    the first refusals connection attempts fail.
+
+    A fake TWS would have to implement the binary API protocol to serve historical data, so requests are
+    tested with this stand-in. Connection failures are tested with the real IB against a local server in
+    test_client_pool_socket.
+    """
+
+    def __init__(self, latency=0.02, violations=0, connected=True, drops=0, refusals=0):
+        self.errorEvent = Event('errorEvent')
+        self.latency = latency
+        self.violations = violations
+        self.connected = connected
+        self.drops = drops
+        self.refusals = refusals
+        self.client_id = None
+        self.connects = 0
+        self.active = 0
+        self.max_active = 0
+        self.requests = []
+        self.streams = []
+        self.cancelled = []
+        self._req_id = 0
+
+    def isConnected(self):
+        return self.connected
+
+    async def connectAsync(self, host, port, clientId, timeout, readonly):
+        self.client_id = clientId
+        self.connects += 1
+        if self.refusals > 0:
+            self.refusals -= 1
+            raise ConnectionRefusedError('Connection refused')
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+                                     formatDate=1, keepUpToDate=False, timeout=60):
+        self._req_id += 1
+        bars = BarDataList()
+        bars.reqId = self._req_id
+        self.requests.append((contract.symbol, time.monotonic()))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.latency)
+        self.active -= 1
+        if self.drops > 0:
+            self.drops -= 1
+            self.connected = False
+            raise ConnectionError('Socket disconnect')
+        if self.violations > 0:
+            self.violations -= 1
+            self.errorEvent.emit(bars.reqId, 162, 'Historical Market Data Service error message:'
+                                                  'Historical data request pacing violation', contract)
+            return bars
+        start = datetime(2021, 3, 1, 14, 30, tzinfo=timezone.utc)
+        bars += [BarData(date=start + timedelta(minutes=5 * i), open=100.0 + i, high=101.0 + i, low=99.0 + i,
+                         close=100.5 + i, volume=1000) for i in range(12)]
+        if keepUpToDate:
+            self.streams.append(bars)
+        return bars
+
+    def cancelHistoricalData(self, bars):
+        self.cancelled.append(bars)
+
+    @staticmethod
+    def update(bars, close, new_bar=False):
+        """
+        Update the last bar with close like IB does, or add a new bar after it.
+        """
+        last = bars[-1]
+        if new_bar:
+            bars.append(BarData(date=last.date + timedelta(minutes=5), open=close, high=close, low=close,
+                                close=close, volume=100))
+        else:
+            last.high, last.low, last.close = max(last.high, close), min(last.low, close), close
+            last.volume += 100
+        bars.updateEvent.emit(bars, new_bar)
+
+
+def make_provider(ib, **pacing):
+    return AsyncIBDataProvider(verbose=0, host='', port=0, timeout=1, chunk_size=10, ib=ib,
+                               pacing=PacingScheduler(**pacing), keep_alive=True)
 
 
 class TestIb(unittest.TestCase):
@@ -15,6 +115,238 @@ class TestIb(unittest.TestCase):
         assert AsyncIBDataProvider.exctract_symbol('OMXS30-201708-OMS-SEK') == tuple(['FUT', 'OMXS30', 'OMS', 'SEK', '201708', ''])
         assert AsyncIBDataProvider.exctract_symbol('DAX-201709-DTB-EUR-25') == tuple(['FUT', 'DAX', 'DTB', 'EUR', '201709', '25'])
 
+    def test_async_concurrent_requests(self):
+        ib = FakeIB(latency=0.05, violations=2)
+        provider = make_provider(ib, max_concurrent=2, identical_cooldown=0, backoff=0.01)
+        symbols = ['SPY', 'QQQ', 'IWM', 'DIA', 'XLF', 'XLE']
+        datas = asyncio.run(provider.get_datas_async(
+            [SymbolData(symbol, '5min', '5min', '', '', rth_only=False) for symbol in symbols]))
+
+        assert [d.symbol for d in datas] == symbols
+        assert len(datas[0].df) == 12
+        assert datas[0].df.index[0] == datetime(2021, 3, 1, 9, 30)
+        assert ib.max_active == 2
+        assert provider.pacing.violations == 2
+        assert provider.pacing.requests == len(symbols) + 2
+
+    def test_request_errors(self):
+        ib = FakeIB(latency=0.05, violations=1)
+        provider = make_provider(ib, identical_cooldown=0, backoff=0.01)
+
+        async def run():
+            # Errors of other requests, e.g. market data farm messages, while a request is in flight
+            asyncio.get_running_loop().call_later(0.01, ib.errorEvent.emit, 999, 200, 'No security definition')
+            return await provider.get_datas_async([SymbolData('SPY', '5min', '5min', '', '', rth_only=False)])
+
+        datas = asyncio.run(run())
+        assert len(datas[0].df) == 12 and provider.pacing.violations == 1
+        # Kept only while a historical request of the client is in flight
+        assert provider._request_errors == {} and provider._historical_requests == {}
+        ib.errorEvent.emit(1000, 2104, 'Market data farm connection is OK')
+        assert provider._request_errors == {}
+
+    def test_pacing_limits(self):
+        ib = FakeIB(latency=0)
+        provider = make_provider(ib, max_requests=2, window=0.2, identical_cooldown=0.1)
+        symbol_datas = [SymbolData('SPY', '5min', '5min', '', '', rth_only=False),
+                        SymbolData('SPY', '5min', '5min', '', '', rth_only=False),
+                        SymbolData('QQQ', '5min', '5min', '', '', rth_only=False),
+                        SymbolData('IWM', '5min', '5min', '', '', rth_only=False)]
+        datas = asyncio.run(provider.get_datas_async(symbol_datas))
+
+        assert len(datas) == 4
+        times = {}
+        for symbol, t in ib.requests:
+            times.setdefault(symbol, []).append(t)
+        assert times['SPY'][1] - times['SPY'][0] >= 0.1  # Identical request
+        starts = sorted(t for _, t in ib.requests)
+        assert starts[2] - starts[0] >= 0.2  # Max two requests in window
+
+    def test_bar_buffer(self):
+        ib = FakeIB(latency=0)
+        bars = asyncio.run(ib.reqHistoricalDataAsync(Stock('SPY', 'ARCA', 'USD'), '', '1 D', '5 mins',
+                                                      'TRADES', False))
+        df = make_provider(ib)._to_dataframe(bars, tz_fix=True)
+        buffer = BarBuffer(5)
+        buffer.upsert(df.iloc[:4])
+        buffer.upsert(df.iloc[3:9])  # Wraps around, replacing the fourth bar
+        frame = buffer.frame()
+        assert len(buffer) == 5
+        assert frame.equals(df.iloc[4:9].astype(float))
+        assert frame.values.base is not None  # A view of the buffer
+        buffer.upsert(df.iloc[8:9] + 1)
+        assert frame.iloc[-1]['Close'] == df.iloc[8]['Close'] + 1
+
+    def test_stream_datas(self):
+        ib = FakeIB(latency=0)
+        provider = make_provider(ib, identical_cooldown=0)
+        received = []
+
+        async def stream():
+            datas = []
+            stream = provider.stream_datas([SymbolData('SPY', '5min', '15min', '', '', rth_only=False)],
+                                           capacity=100, callback=received.append)
+            async for data in stream:
+                datas.append((len(data.df), data.df.iloc[-1].copy()))
+                if len(datas) == 1:
+                    FakeIB.update(ib.streams[0], 120.0)
+                    FakeIB.update(ib.streams[0], 112.0, new_bar=True)
+                elif len(datas) == 3:
+                    break
+            await stream.aclose()
+            return datas, data.df
+
+        datas, df = asyncio.run(stream())
+
+        assert len(received) == 3
+        assert [rows for rows, _ in datas] == [4, 4, 5]
+        # Last bar of 09:30 - 10:25 updated, then a new 15min bar at 10:30
+        assert datas[0][1]['Close'] == 111.5 and datas[0][1]['Volume'] == 3000
+        assert datas[1][1]['Close'] == 120.0 and datas[1][1]['High'] == 120.0
+        assert datas[1][1]['Volume'] == 3100
+        assert df.index[-1] == datetime(2021, 3, 1, 10, 30)
+        assert df.iloc[-1]['Close'] == 112.0
+        expected = provider.post_processor.transform_timeframe(
+            provider._to_dataframe(ib.streams[0], tz_fix=True), {'timeframe': '5min', 'transform': '15min'})
+        assert (df.values == expected.values).all()
+        assert ib.cancelled == ib.streams
+
+    def test_start_stream(self):
+        ib = FakeIB(latency=0)
+        provider = make_provider(ib, identical_cooldown=0)
+        received = []
+
+        async def stream():
+            task = provider.start_stream([SymbolData('SPY', '5min', '15min', '2021-03-01 10:00', '2021-03-02',
+                                                     rth_only=False)], received.append, capacity=100)
+            while not ib.streams:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+            FakeIB.update(ib.streams[0], 112.0, new_bar=True)
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(stream())
+
+        # Updates reach the callback without iterating, bars before 'from' are filtered
+        assert len(received) == 2
+        assert received[0].df.index[0] == datetime(2021, 3, 1, 10, 0)
+        assert received[-1].df.index[-1] == datetime(2021, 3, 1, 10, 30)
+        assert ib.cancelled == ib.streams
+
+    def test_client_pool(self):
+        clients = []
+
+        def factory():
+            clients.append(FakeIB(latency=0.05, connected=False))
+            return clients[-1]
+
+        provider = AsyncIBDataProvider(verbose=0, host='', port=0, timeout=1, chunk_size=10, id=10, clients=3,
+                                       ib_factory=factory, pacing=PacingScheduler(identical_cooldown=0),
+                                       keep_alive=True)
+        symbol_datas = [SymbolData(symbol, '5min', '5min', '', '', rth_only=False)
+                        for symbol in ['SPY', 'QQQ', 'IWM', 'DIA', 'XLF', 'XLE']]
+        datas = asyncio.run(provider.get_datas_async(symbol_datas))
+
+        assert [len(d.df) for d in datas] == [12] * 6
+        assert [ib.client_id for ib in clients] == [10, 11, 12]
+        assert [len(ib.requests) for ib in clients] == [2, 2, 2]
+        assert [ib.max_active for ib in clients] == [2, 2, 2]
+
+        # Connections are kept, the lost one is reconnected and a request failing with it is retried
+        clients[1].disconnect()
+        clients[2].drops = 1
+        datas = asyncio.run(provider.get_datas_async(symbol_datas))
+
+        assert [len(d.df) for d in datas] == [12] * 6
+        assert [ib.connects for ib in clients] == [1, 2, 1]
+        assert sum(len(ib.requests) for ib in clients) == 13
+        assert not clients[2].isConnected()
+
+        asyncio.run(provider.get_datas_async(symbol_datas))
+        assert [ib.connects for ib in clients] == [1, 2, 2]
+
+    def test_client_pool_backoff(self):
+        clients = [FakeIB(latency=0, connected=False, refusals=n) for n in [2, 0]]
+        pool = IBClientPool(clients, [1, 2], '', 0, 1, backoff=0.1)
+
+        async def request(ib):
+            return ib.client_id
+
+        async def run():
+            with self.assertLogs(IBClientPool.logger, 'WARNING'):
+                await pool.connect_async()
+            # The refused client is not tried again until its backoff expires
+            ids = [await pool.run(request) for _ in range(3)]
+            await asyncio.sleep(0.15)
+            ids.append(await pool.run(request))
+            await asyncio.sleep(0.25)
+            ids.append(await pool.run(request))
+            return ids
+
+        ids = asyncio.run(run())
+
+        assert ids == [2, 2, 2, 2, 1]
+        assert [ib.connects for ib in clients] == [3, 1]
+        assert pool.failures == [0, 0]
+
+    def test_client_pool_connect_backoff(self):
+        clients = []
+
+        def factory():
+            clients.append(FakeIB(latency=0, connected=False, refusals=1 if not clients else 0))
+            return clients[-1]
+
+        provider = AsyncIBDataProvider(verbose=0, host='', port=0, timeout=1, chunk_size=10, id=10, clients=2,
+                                       ib_factory=factory, pacing=PacingScheduler(identical_cooldown=0),
+                                       keep_alive=True)
+        symbol_datas = [SymbolData('SPY', '5min', '5min', '', '', rth_only=False)]
+        with self.assertLogs(IBClientPool.logger, 'WARNING'):
+            asyncio.run(provider.get_datas_async(symbol_datas))
+        # Connecting the other clients again skips the refused one during its backoff
+        asyncio.run(provider.get_datas_async(symbol_datas))
+        assert [ib.connects for ib in clients] == [1, 1]
+
+        provider.pool.retry_after[0] = 0
+        asyncio.run(provider.get_datas_async(symbol_datas))
+        assert [ib.connects for ib in clients] == [2, 1]
+        assert provider.pool.connected() == 2
+
+        # Without a connected client, those waiting are tried anyway
+        provider.disconnect()
+        clients[0].refusals = clients[1].refusals = 1
+        with self.assertLogs(IBClientPool.logger, 'WARNING'):
+            with self.assertRaisesRegex(Exception, 'Could not connect any'):
+                asyncio.run(provider.pool.connect_async())
+        asyncio.run(provider.get_datas_async(symbol_datas))
+        assert [ib.connects for ib in clients] == [4, 3]
+
+    def test_client_pool_socket(self):
+        async def run():
+            # Accepts connections and closes them without the API handshake
+            server = await asyncio.start_server(lambda reader, writer: writer.close(), '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            pool = IBClientPool([IB(), IB()], [1, 2], '127.0.0.1', port, timeout=0.5)
+            try:
+                with self.assertLogs(IBClientPool.logger, 'WARNING'):
+                    with self.assertRaisesRegex(Exception, 'Could not connect any of 2 clients'):
+                        await pool.connect_async()
+                with self.assertLogs(IBClientPool.logger, 'WARNING'):
+                    with self.assertRaisesRegex(Exception, 'No client connected'):
+                        async with pool.client():
+                            pass
+            finally:
+                server.close()
+                await server.wait_closed()
+            return pool
+
+        pool = asyncio.run(run())
+
+        assert pool.connected() == 0
+        assert pool.failures == [2, 2]
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from pd_dataprovider.utils.incremental import read_last_timestamp, append_bars
+
+
+class TestIncremental(unittest.TestCase):
+
+    def test_read_last_timestamp(self):
+        assert read_last_timestamp('data/5min/AAPL_2018-01-06.csv') == pd.Timestamp('2018-01-05 19:55:00')
+        assert read_last_timestamp('data/day/SPY.csv') == pd.Timestamp('2017-08-25')
+        assert read_last_timestamp('data/missing.csv') is None
+
+    def test_append_bars(self):
+        index = pd.date_range('2021-03-01 09:30', periods=6, freq='5min', name='Date')
+        df = pd.DataFrame({'Open': range(6), 'Close': range(6)}, index=index)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'SPY.csv')
+            assert append_bars(filename, df.iloc[:4]) == 4
+            assert read_last_timestamp(filename) == index[3]
+
+            # Overlapping bars are skipped
+            assert append_bars(filename, df.iloc[2:]) == 2
+            assert append_bars(filename, df) == 0
+
+            result = pd.read_csv(filename, index_col='Date', parse_dates=True)
+            assert result.index.equals(index)
+            assert list(result['Close']) == list(range(6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,11 @@
+import asyncio
+import json
+import shutil
+import tempfile
 import unittest
+import unittest.mock
+
+import pandas as pd
 
 from pd_dataprovider.objects import SymbolData, Data
 from pd_dataprovider.providers.json_dataprovider import JSONDataProvider
@@ -50,6 +57,95 @@ class TestCsv(unittest.TestCase):
         assert df.loc['2021-11-30']['Close'] == 165.3   # Last bar from daily file
         assert df.loc['2021-12-01']['Close'] == 164.77  # Single bar from snapshots file
 
+    def test_file_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            provider = JSONDataProvider(['data/alpaca'], ['t', 'o', 'h', 'l', 'c', 'v'], epoch=True,
+                                        cache_dir=cache_dir)
+            symbol_datas = [SymbolData('SPY', '5min', '5min', '2020-05-11', '2020-05-13', rth_only=False)]
+            first = provider.get_datas(symbol_datas)[0].df
+            second = provider.get_datas(symbol_datas)[0].df
+            assert provider.file_cache.stats() == {'hits': 1, 'misses': 1}
+            assert first.equals(second)
+            assert second.loc['2020-05-12 16:35']['Close'] == 284.88
+
+    def test_get_datas_async(self):
+        provider = JSONDataProvider(['data/alpaca-v2'], ['DateTime', 'Open', 'High', 'Low', 'Close', 'Volume'])
+        symbol_datas = [SymbolData('AAPL', 'day', 'day', '2021-01-01', '2021-12-02'),
+                        SymbolData('AAPL', 'day', 'week', '2021-01-01', '2021-12-02'),
+                        SymbolData('AAPL', '1min', '1min', '2021-12-01', '2021-12-03', rth_only=False),
+                        SymbolData('MISSING', 'day', 'day', '2021-01-01', '2021-12-02')]
+        expected = provider.get_datas(symbol_datas, snapshots=True)
+        datas = asyncio.run(provider.get_datas_async(symbol_datas, snapshots=True))
+        assert [d.timeframe for d in datas] == ['day', 'week', '1min']
+        for data, expected_data in zip(datas, expected):
+            assert data.df.equals(expected_data.df)
+            assert data.df.symbol == 'AAPL'
+
+    def test_columnar(self):
+        cases = [(['data/alpaca'], ['t', 'o', 'h', 'l', 'c', 'v'], True,
+                  [('SPY', '5min', '2020-05-12 17:00', '2020-05-12 18:30')]),
+                 (['data/alpaca-v2'], ['DateTime', 'Open', 'High', 'Low', 'Close', 'Volume'], False,
+                  [('AAPL', 'day', '2021-01-01', '2021-12-02'), ('AAPL', '1min', '2021-12-01', '2021-12-02')])]
+        for paths, keys, epoch, symbols in cases:
+            for symbol, timeframe, start, end in symbols:
+                records = JSONDataProvider(paths, keys, epoch=epoch)
+                columnar = JSONDataProvider(paths, keys, epoch=epoch, columnar=True)
+                everything = SymbolData(symbol, timeframe, timeframe, '', '')
+                pd.testing.assert_frame_equal(columnar._read_data(everything), records._read_data(everything))
+
+                symbol_data = SymbolData(symbol, timeframe, timeframe, start, end, rth_only=False)
+                df = columnar._read_data(symbol_data)
+                assert len(df) < len(records._read_data(symbol_data))
+                assert df.index[0] >= pd.Timestamp(start) and df.index[-1] < pd.Timestamp(end) + pd.Timedelta(days=1)
+                pd.testing.assert_frame_equal(columnar.get_datas([symbol_data], snapshots=True)[0].df,
+                                              records.get_datas([symbol_data], snapshots=True)[0].df)
+
+    def test_bulk_snapshots(self):
+        keys = ['DateTime', 'Open', 'High', 'Low', 'Close', 'Volume']
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copytree('data/alpaca-v2/day', f"{tmp}/day")
+            with open('data/alpaca-v2/day/AAPL.json') as f, open(f"{tmp}/day/MSFT.json", 'w') as out:
+                json.dump({'MSFT': json.load(f)['AAPL']}, out)
+            shutil.copytree('data/alpaca-v2/snapshots', f"{tmp}/snapshots")
+            with open(f"{tmp}/snapshots.json", 'w') as f:
+                json.dump({'MSFT': [dict(DateTime='2021-12-02T05:00:00Z', Open=1, High=2, Low=0.5, Close=1.5,
+                                         Volume=100)],
+                           'AAPL': [dict(DateTime='2021-12-02T05:00:00Z', Open=1, High=2, Low=0.5, Close=1.5,
+                                         Volume=100)]}, f)
+
+            symbol_datas = [SymbolData(symbol, 'day', 'day', '2021-01-01', '2021-12-02') for symbol in ['AAPL', 'MSFT']]
+            records = JSONDataProvider([tmp], keys)
+            columnar = JSONDataProvider([tmp], keys, columnar=True)
+            expected = records.get_datas(symbol_datas, snapshots=True)
+            assert records.updated_snapshots == ['AAPL', 'MSFT']
+            assert expected[0].df.loc['2021-12-01', 'Close'] == 164.77  # File per symbol overrides snapshots.json
+            assert expected[1].df.index[-1] == pd.Timestamp('2021-12-02') and expected[1].df['Close'].iloc[-1] == 1.5
+
+            with unittest.mock.patch('pandas.concat', wraps=pd.concat) as concat:
+                datas = columnar.get_datas(symbol_datas, snapshots=True)
+                concat.assert_not_called()
+            for data, expected_data in zip(datas, expected):
+                pd.testing.assert_frame_equal(data.df, expected_data.df)
+
+            assert records.get_datas(symbol_datas, snapshots=True) and records.updated_snapshots == []
+            with open(f"{tmp}/snapshots.json", 'w') as f:
+                json.dump({'MSFT': [dict(DateTime='2021-12-02T05:00:00Z', Open=1, High=2, Low=0.5, Close=1.75,
+                                         Volume=200)]}, f)
+            assert records.refresh_snapshots() == ['MSFT']
+            assert records.get_datas(symbol_datas, snapshots=True)[1].df['Close'].iloc[-1] == 1.75
+
+            # Snapshots are only read when requested, and changed ones replace cached frames
+            cached = JSONDataProvider([tmp], keys, frame_cache_bytes=10 ** 8)
+            with unittest.mock.patch.object(cached.snapshots, 'load', wraps=cached.snapshots.load) as load:
+                cached.get_datas(symbol_datas)
+                load.assert_not_called()
+            assert cached.get_datas(symbol_datas, snapshots=True)[1].df['Close'].iloc[-1] == 1.75
+            with open(f"{tmp}/snapshots.json", 'w') as f:
+                json.dump({'MSFT': [dict(DateTime='2021-12-02T05:00:00Z', Open=1, High=2, Low=0.5, Close=2.0,
+                                         Volume=300)]}, f)
+            datas = cached.get_datas(symbol_datas, snapshots=True)
+            assert cached.updated_snapshots == ['MSFT'] and datas[1].df['Close'].iloc[-1] == 2.0
+            assert cached.frame_cache.stats()['hits'] == 1  # AAPL
 
 
 if __name__ == '__main__':
@@ -2,10 +2,12 @@
 # -*- coding: utf-8; py-indent-offset:4 -*-
 
 import unittest
+from unittest import mock
 
 from pd_dataprovider.objects import SymbolData
 from pd_dataprovider.provider_factory import ProviderFactory
 from pd_dataprovider.providers.csv_dataprovider import CsvFileDataProvider
+from pd_dataprovider.utils.calendar import SessionCalendar
 import pandas as pd
 
 
@@ -51,7 +53,22 @@ class TestPostProcessor(unittest.TestCase):
         assert str(round(daily.df.loc[pd.to_datetime('2020-04-01')]['Close'],2)) == "112.83"
         assert str(weekly.df.loc[pd.to_datetime('2020-04-14')]['Open']) == "130.0"
 
+    def test_resample_multi_timeframes_single_read(self):
+        symbol_datas = [SymbolData('VOLV.B_5min', '5min', '60min', '', '', rth_only=False),
+                        SymbolData('VOLV.B_5min', '5min', 'week', '', '', rth_only=False),
+                        SymbolData('VOLV.B_5min', '5min', 'day', '', '', rth_only=False),
+                        SymbolData('VOLV.B_5min', '5min', '5min', '', '', rth_only=False),
+                        SymbolData('VOLV.B_5min', '5min', 'day', '', '', rth_only=False)]
+        provider = CsvFileDataProvider(["data"])
+        expected = [provider.get_datas([symbol_data])[0].df for symbol_data in symbol_datas]
 
+        with mock.patch.object(provider, '_read_data', wraps=provider._read_data) as read_data:
+            datas = provider.get_datas(symbol_datas)
+            assert read_data.call_count == 1
+        for data, df in zip(datas, expected):
+            assert data.df.equals(df)
+            assert data.df.symbol == 'VOLV.B_5min'
+        assert datas[2].df is not datas[4].df
 
     def test_resample_timeframe_metadata(self):
         provider = CsvFileDataProvider(["data"], verbose=2)
@@ -63,6 +80,104 @@ class TestPostProcessor(unittest.TestCase):
         assert datas[1].timeframe == 'week'
         assert datas[2].timeframe == 'month'
 
+    def test_resample_week_month_bars(self):
+        provider = CsvFileDataProvider(["data"])
+        daily, weekly, monthly = provider.get_dataframes([SymbolData('SPY', 'day', 'day', '2016-01-01', '2016-12-31'),
+                                                          SymbolData('SPY', 'day', 'week', '2016-01-01', '2016-12-31'),
+                                                          SymbolData('SPY', 'day', 'month', '2016-01-01', '2016-12-31')])
+        week = daily.loc['2016-01-04':'2016-01-08']
+        assert weekly.loc['2016-01-04']['Open'] == week['Open'].iloc[0]
+        assert weekly.loc['2016-01-04']['High'] == week['High'].max()
+        assert weekly.loc['2016-01-04']['Low'] == week['Low'].min()
+        assert weekly.loc['2016-01-04']['Close'] == week['Close'].iloc[-1]
+
+        month = daily.loc['2016-02']
+        assert monthly.index[1] == pd.to_datetime('2016-02-01')
+        assert monthly.loc['2016-02-01']['High'] == month['High'].max()
+        assert monthly.loc['2016-02-01']['Volume'] == month['Volume'].sum()
+        assert len(monthly) == 12
+
+    def test_resample_any_timeframe(self):
+        provider = CsvFileDataProvider(["data"])
+        five, day, month, hours = provider.get_dataframes([
+            SymbolData('AAPL_2018-01-06', '5min', '5min', '2017-12-10', '2017-12-31', rth_only=True),
+            SymbolData('AAPL_2018-01-06', '5min', 'day', '2017-12-10', '2017-12-31', rth_only=True),
+            SymbolData('AAPL_2018-01-06', '5min', 'month', '2017-12-10', '2017-12-31', rth_only=True),
+            SymbolData('AAPL_2018-01-06', '5min', '2h', '2017-12-10', '2017-12-31', rth_only=True)])
+        assert month.index[0] == day.index[0]
+        assert month['High'].iloc[0] == five['High'].max() and month['Volume'].iloc[0] == five['Volume'].sum()
+        assert hours.index[0] == pd.to_datetime('2017-12-11 08:00:00')
+        assert hours.loc['2017-12-11 08:00:00']['Open'] == five.loc['2017-12-11 09:30:00']['Open']
+
+        post_processor = provider.post_processor
+        assert [tf.name for tf in post_processor.resample_plan('1min', 'week')] == ['day', 'week']
+        assert post_processor.transforms_via_day('30min', 'month')
+        assert not post_processor.transforms_via_day('day', 'week')
+        for timeframe, transform in [('5min', '7min'), ('day', '60min'), ('week', 'month'), ('5D', 'week')]:
+            with self.assertRaises(Exception):
+                post_processor.resample_plan(timeframe, transform)
+
+    def test_resample_session_anchored(self):
+        provider = CsvFileDataProvider(["data"], exchange='NYSE')
+        five, hourly = provider.get_dataframes([
+            SymbolData('AAPL_2018-01-06', '5min', '5min', '2017-12-10', '2017-12-31', rth_only=True),
+            SymbolData('AAPL_2018-01-06', '5min', '60min', '2017-12-10', '2017-12-31', rth_only=True)])
+        bar = hourly.loc['2017-12-29 09:30:00']
+        session = five.loc['2017-12-29 09:30:00':'2017-12-29 10:25:00']
+        assert pd.to_datetime('2017-12-29 09:00:00') not in hourly.index
+        assert bar['Open'] == session['Open'].iloc[0] and bar['High'] == session['High'].max()
+        assert bar['Close'] == session['Close'].iloc[-1] and bar['Volume'] == session['Volume'].sum()
+
+        # Half day: the last bar ends at the 13:00 close
+        index = pd.date_range('2017-11-24 09:30', '2017-11-24 15:55', freq='5min')
+        data = pd.DataFrame({'Open': 1.0, 'High': 2.0, 'Low': 0.5, 'Close': 1.5, 'Volume': 10.0}, index=index)
+        bars = provider.post_processor.transform_timeframe(
+            data, {'timeframe': '5min', 'transform': '60min', 'exchange': 'NYSE'})
+        assert list(bars.index.strftime('%H:%M')) == ['09:30', '10:30', '11:30', '12:30', '13:00', '14:00', '15:00']
+        assert bars.loc['2017-11-24 12:30']['Volume'] == 60.0
+
+        # Extended hours: bars after the close start at the close, bars before the open end at the open
+        index = pd.date_range('2017-12-11 08:00', '2017-12-11 17:00', freq='15min')
+        data = pd.DataFrame({'Open': 1.0, 'High': 2.0, 'Low': 0.5, 'Close': 1.5, 'Volume': 10.0}, index=index)
+        bars = provider.post_processor.transform_timeframe(
+            data, {'timeframe': '15min', 'transform': '90min', 'exchange': 'NYSE'})
+        assert bars.index.is_monotonic_increasing
+        assert list(bars.index.strftime('%H:%M')) == ['08:00', '09:30', '11:00', '12:30', '14:00', '15:30', '16:00']
+        assert bars.loc['2017-12-11 15:30']['Volume'] == 20.0 and bars.loc['2017-12-11 16:00']['Volume'] == 50.0
+
+        calendar = SessionCalendar.get('NYSE')
+        assert calendar is SessionCalendar.get('NYSE')
+        opens, closes = calendar.sessions('2017-11-20', '2017-11-30')
+        assert len(opens) == 8 and pd.Timestamp(closes[3]) == pd.Timestamp('2017-11-24 13:00')
+
+    def test_add_trading_days(self):
+        provider = CsvFileDataProvider(["data"])
+        daily, five = [data.df for data in provider.get_datas(
+            [SymbolData('SPY', 'day', 'day', '2010-01-01', '2017-01-01'),
+             SymbolData('AAPL_2018-01-06', '5min', '15min', '2017-12-10', '2017-12-31', rth_only=True)],
+            trading_days=True)]
+        assert (daily['Day'].to_numpy() == daily.groupby(daily.index.year).cumcount().to_numpy() + 1).all()
+        assert daily.loc['20160104']['Day'] == 1 and daily.loc['20161230']['Day'] == 252
+        assert daily.loc['20160201']['DayOfMonth'] == 1 and daily.loc['20160229']['DayOfMonth'] == 20
+        assert list(daily.loc['20160111':'20160115', 'DayOfWeek']) == [1, 2, 3, 4, 5]
+        assert list(daily.loc['20160119':'20160122', 'DayOfWeek']) == [1, 2, 3, 4]  # Holiday Monday
+
+        assert five.loc['2017-12-11 09:30']['Bar'] == 1 and five.loc['2017-12-11 15:45']['Bar'] == 26
+        assert five.loc['2017-12-12 09:30']['Day'] == 2 and five.loc['2017-12-12 15:45']['Day'] == 2
+
+        # Bars are counted from the session open, not from pre-market bars
+        extended = provider.get_datas([SymbolData('AAPL_2018-01-06', '5min', '5min', '2017-12-10', '2017-12-31',
+                                                  rth_only=False)], trading_days=True)[0].df
+        day = extended.loc['2017-12-11']
+        assert day.index[0] < pd.Timestamp('2017-12-11 09:30') and day['Bar'].iloc[0] == 0
+        assert extended.loc['2017-12-11 09:30']['Bar'] == 1 and extended.loc['2017-12-11 15:55']['Bar'] == 78
+        nyse = CsvFileDataProvider(["data"], exchange='NYSE').get_datas(
+            [SymbolData('AAPL_2018-01-06', '5min', '5min', '2017-12-10', '2017-12-31', rth_only=False)],
+            trading_days=True)[0].df
+        assert (nyse['Bar'].to_numpy() == extended['Bar'].to_numpy()).all()
+        assert 'Bar' not in daily and 'Bar' not in provider.get_dataframes(
+            [SymbolData('AAPL_2018-01-06', '5min', '15min', '2017-12-10', '2017-12-31')])[0]
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file